@@ -0,0 +1,253 @@
+import argparse
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+# Add the path to the dlt645 module
+sys.path.append(r'E:\Git\SongYang_PowerSupply_ControlScript\dlt645\dlt645')
+
+import dlt645
+from Power_Supply_Control import PowerSupply
+from Meter_Cal_Control import MeterCalControl
+import Calibration_Control
+from Calibration_Control import run_recipe
+
+# Configure logging
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class Counters:
+    """
+    Time spent in serial I/O and in sleeps by the benchmark thread, plus meter transactions.
+    """
+
+    def __init__(self):
+        self.serial_io = 0.0
+        self.wait = 0.0
+        self.transactions = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.thread = threading.get_ident()
+
+    def snapshot(self):
+        return (self.serial_io, self.wait, self.transactions)
+
+
+class TimedSerial:
+    """
+    Wrap a serial port to account the time spent in read/write and count request frames.
+    """
+
+    def __init__(self, ser, counters, count_frames=False):
+        self.ser = ser
+        self.counters = counters
+        self.frame_reader = dlt645.FrameReader() if count_frames else None
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def read(self, size=1):
+        start = time.perf_counter()
+        try:
+            data = self.ser.read(size)
+        finally:
+            self.counters.serial_io += time.perf_counter() - start
+        self.counters.bytes_in += len(data)
+        return data
+
+    def write(self, data):
+        start = time.perf_counter()
+        try:
+            return self.ser.write(data)
+        finally:
+            self.counters.serial_io += time.perf_counter() - start
+            self.counters.bytes_out += len(data)
+            if self.frame_reader is not None:
+                frame = self.frame_reader.feed(data)
+                while frame is not None:
+                    self.counters.transactions += 1
+                    frame = self.frame_reader.next_frame()
+
+    @property
+    def in_waiting(self):
+        return self.ser.in_waiting
+
+    @property
+    def timeout(self):
+        return self.ser.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.ser.timeout = value
+
+
+class TimedSleep:
+    """
+    Replace time.sleep while active and account the time slept by the benchmark thread.
+
+    With skip, fixed delays are dropped but the sleeps of functions wrapped by keep()
+    (the settle wait after a setpoint, the source needs that time whatever the mode) still happen.
+    """
+
+    def __init__(self, counters, skip=False):
+        self.counters = counters
+        self.skip = skip
+        self.sleep = time.sleep
+        self.keeping = 0
+
+    def __call__(self, seconds):
+        if threading.get_ident() != self.counters.thread:
+            return self.sleep(seconds)
+        start = time.perf_counter()
+        if not self.skip or self.keeping:
+            self.sleep(seconds)
+        self.counters.wait += time.perf_counter() - start
+
+    def keep(self, func):
+        """Return func with its sleeps kept even when skipping."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.keeping += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.keeping -= 1
+        return wrapper
+
+    def __enter__(self):
+        time.sleep = self
+        return self
+
+    def __exit__(self, *exc):
+        time.sleep = self.sleep
+
+
+def run_flow(power_supply, meter_control, recipe, settle_config, solver_config, counters):
+    """
+    Run a calibration recipe, timing each step.
+
+    :return: {step: {"wall", "serial_io", "wait", "compute", "transactions"}}, recipe status
+    """
+    steps = {}
+
+    def step(name, func):
+        io_start, wait_start, tx_start = counters.snapshot()
+        start = time.perf_counter()
+        func()
+        wall = time.perf_counter() - start
+        io_end, wait_end, tx_end = counters.snapshot()
+        serial_io, wait = io_end - io_start, wait_end - wait_start
+        steps[name] = {
+            "wall": wall,
+            "serial_io": serial_io,
+            "wait": wait,
+            "compute": max(0.0, wall - serial_io - wait),
+            "transactions": tx_end - tx_start,
+        }
+
+    report = run_recipe(recipe, power_supply, meter_control, settle_config, solver_config, step_hook=step)
+    return steps, report["status"]
+
+
+def summarize(steps, status, meters, wall):
+    totals = {key: sum(step[key] for step in steps.values())
+              for key in ("serial_io", "wait", "compute", "transactions")}
+    return {
+        "meters": meters,
+        "status": status,
+        "wall_time": wall,
+        "serial_io": totals["serial_io"],
+        "wait": totals["wait"],
+        "compute": totals["compute"],
+        # a failed or partial run calibrated nothing
+        "meters_per_hour": meters * 3600 / wall if wall and status == "done" else None,
+        "transactions_per_meter": totals["transactions"] / meters,
+        "steps": steps,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a full calibration cycle, split per step")
+    parser.add_argument("--meter-port", help="Meter serial port, runs against the simulator if omitted")
+    parser.add_argument("--supply-port", help="Power supply serial port, defaults to config.json")
+    parser.add_argument("--recipe", default="recipe.json", help="Calibration recipe, defaults to recipe.json")
+    parser.add_argument("--runs", default=1, type=int, help="Number of calibration cycles, defaults to 1")
+    parser.add_argument("--skip-sleeps", action="store_true",
+                        help="Drop the fixed delays, to measure serial I/O and compute only (the settle wait "
+                             "still waits for the source)")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    with open("config.json", "r") as config_file:
+        config = json.load(config_file)
+    with open(args.recipe, "r") as recipe_file:
+        recipe = json.load(recipe_file)
+    settle_config = config.get("settle", {})
+    solver_config = config.get("solver", {})
+
+    simulator = None
+    if args.meter_port is None:
+        from Station_Simulator import Simulator
+
+        sim_config = config.get("simulator", {})
+        simulator = Simulator(
+            meters=1,
+            settle_time=sim_config.get("settle_time", 2.0),
+            noise=sim_config.get("noise", 0.0),
+            byte_latency=sim_config.get("byte_latency", 0.0),
+            response_delay=sim_config.get("response_delay", 0.0),
+        ).start()
+        meter_port, supply_port = simulator.meter_ports[0], simulator.supply_port
+        # the simulated supply answers the readback in the layout extract_voltage_and_current() expects
+        settle_config = dict(settle_config, mode="supply")
+    else:
+        meter_port = args.meter_port
+        supply_port = args.supply_port or config["serial"]["port"]
+
+    counters = Counters()
+    reports = []
+    try:
+        power_supply = PowerSupply(port=supply_port, baudrate=config["serial"].get("baudrate", 9600),
+                                   timeout=config["serial"].get("timeout", 1))
+        meter_control = MeterCalControl(port=meter_port, baudrate=115200, instrument=True)
+        power_supply.connection = TimedSerial(power_supply.connection, counters)
+        meter_control.ser = TimedSerial(meter_control.ser, counters, count_frames=True)
+        meter_control.session.flo = meter_control.ser
+
+        with TimedSleep(counters, skip=args.skip_sleeps) as timed_sleep:
+            Calibration_Control.wait_for_setpoint = timed_sleep.keep(Calibration_Control.wait_for_setpoint)
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                steps, status = run_flow(power_supply, meter_control, recipe, settle_config, solver_config, counters)
+                reports.append(summarize(steps, status, 1, time.perf_counter() - start))
+
+        meter_transactions = meter_control.transaction_stats()
+        meter_retries = meter_control.retry_stats()
+        meter_control.ser.close()
+        power_supply.close()
+    finally:
+        if simulator is not None:
+            simulator.stop()
+
+    report = {
+        "simulated": simulator is not None,
+        "recipe": recipe.get("name"),
+        "skip_sleeps": args.skip_sleeps,
+        "settle": settle_config,
+        "solver": solver_config,
+        "runs": reports,
+        "meter_transactions": meter_transactions,
+        "meter_retries": meter_retries,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    failed = [run["status"] for run in reports if run["status"] != "done"]
+    if failed:
+        logging.error(f"{len(failed)}/{len(reports)} run(s) did not complete: {', '.join(failed)}")
+        sys.exit(1)
@@ -1,3 +1,4 @@
+import argparse
 import json
 import logging
 import serial
@@ -5,30 +6,211 @@ import sys
 import os
 import math
 import time  # Import time module for sleep function
-from Power_Supply_Control import PowerSupply  # Import PowerSupply class from Calibration_Script
+from Power_Supply_Control import PowerSupply, SettleTimeoutError  # Import PowerSupply class from Calibration_Script
 # Add the path to the dlt645 module
 sys.path.append(r'E:\Git\SongYang_PowerSupply_ControlScript\dlt645\dlt645')
 
 import dlt645
+from dlt645.cache import AddressCache
 from dlt645.constants import *
-from Meter_Cal_Control import MeterCalControl  # Import the MeterControl class
+from Meter_Cal_Control import MeterCalControl, register_key, register_labels  # Import the MeterControl class
+from Results_Store import ResultsStore
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Exit codes of the recipe executor
+EXIT_DONE = 0
+EXIT_FAILED = 1  # a gain did not converge or the source did not settle
+EXIT_ERROR = 2  # communication or configuration error
+
+# Registers shown before and after calibration, read in one batch, labelled from register_catalogue
+snapshot_registers = [(register_labels[register_key(addr)], register_key(addr)) for addr in (
+    0x0061, 0x00D9, 0x0065, 0x00DA, 0x0069, 0x00DB,
+    0x0062, 0x00DD, 0x0066, 0x00DE, 0x006A, 0x00DF,
+    0x00B1, 0x00B2, 0x00B3,
+)]
+
+# Extra registers only shown after calibration
+final_registers = [(register_labels[addr], addr) for addr in (0x00F9, 0x00FA, 0x00FB, 0x00F8)]
+
+
+def print_snapshot(meter_control, title, registers):
+    """
+    Read a list of (label, register) entries in one batch and print them.
+
+    :return: {label: value} for the snapshot
+    """
+    start = time.perf_counter()
+    values = meter_control.read_registers([reg for _, reg in registers])
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{title}:\n")
+    snapshot = {}
+    for label, reg in registers:
+        value = snapshot[label] = values[reg]
+        if isinstance(value, int):
+            print(f"{label}: {value:04X}")  # raw gain registers are shown in hex
+        else:
+            print(f"{label}: {value}")
+    logging.info(f"{title}: {len(registers)} values read in {elapsed * 1000:.1f} ms")
+    return snapshot
+
+
+# Live V/I registers used to check the source output through the meter
+phase_registers = [register_key(addr) for addr in (0x00D9, 0x00DA, 0x00DB, 0x00DD, 0x00DE, 0x00DF)]
+
+
+def meter_readback(meter_control):
+    """
+    Read the three phase voltages and currents seen by the meter.
+
+    :return: (V_R, V_Y, V_B, I_R, I_Y, I_B) or None if a register did not answer
+    """
+    values = meter_control.read_registers(phase_registers)
+    if None in values.values():
+        return None
+    return tuple(values[reg] for reg in phase_registers)
+
+
+def wait_for_setpoint(power_supply, meter_control, settle_config, voltage, current):
+    """
+    Wait after a setpoint change, as configured by the "settle" section of config.json.
+
+    mode "sleep" (the default) waits a fixed time, "supply" polls the power supply
+    readback and "meter" polls the meter's live V/I registers. The readback parser
+    (PowerSupply.extract_voltage_and_current) is not validated against the real
+    supply yet, so "supply" is only safe with the simulator.
+
+    :return: Measured settle time in seconds, or None in "sleep" mode
+    :raises SettleTimeoutError: The output did not settle before the timeout
+    """
+    mode = settle_config.get("mode", "sleep")
+    if mode == "sleep":
+        time.sleep(settle_config.get("time", 8))
+        return None
+
+    read_values = None
+    if mode == "meter":
+        read_values = lambda: meter_readback(meter_control)
+    return power_supply.wait_until_settled(
+        (voltage, current),
+        tolerance=settle_config.get("tolerance", 0.01),
+        abs_tolerance=settle_config.get("abs_tolerance", 0.01),
+        timeout=settle_config.get("timeout", 15),
+        interval=settle_config.get("interval", 0.25),
+        samples=settle_config.get("samples", 3),
+        read_values=read_values,
+        min_time=settle_config.get("min_time", 0.0),
+    )
+
+
+# Register sets a recipe "snapshot" step can show
+snapshot_sets = {
+    "snapshot": snapshot_registers,
+    "final": snapshot_registers + final_registers,
+}
+
+# Keys of a "calibrate" step overriding the "solver" section of config.json
+solver_keys = ("tolerance", "max_iterations", "settle", "sampling")
+
+
+def run_recipe(recipe, power_supply, meter_control, settle_config, solver_config, step_hook=None):
+    """
+    Run the steps of a calibration recipe (see recipe.json) without operator input.
+
+    Step types: "setpoint" (supply output, then wait_for_setpoint), "snapshot"
+    (print a register set), "defaults" (write the default calibration),
+    "calibrate" (closed-loop solver on one quantity) and "wait". Any step may
+    add "wait" seconds after it. A calibrate step whose gains do not converge
+    fails the run and, unless the recipe sets "stop_on_failure" to false,
+    stops it. A setpoint the source does not settle on fails and stops the
+    run, the next steps would calibrate against a wrong reference.
+
+    :param step_hook: Optional callable(name, func) running each step, e.g. to time it
+    :return: {"name", "status": "done" or "failed", "steps": [{"name", "type", "result"}]}, a
+        step that failed with an error also has an "error" message
+    """
+    report = {"name": recipe.get("name"), "status": "done", "steps": []}
+
+    def run_step(step):
+        kind = step["type"]
+        if kind == "setpoint":
+            power_supply.set_voltage_and_current_Powerfactor(
+                voltage=step["voltage"], current=step["current"], power_factor=step["power_factor"])
+            return wait_for_setpoint(power_supply, meter_control, dict(settle_config, **step.get("settle", {})),
+                                     step["voltage"], step["current"])
+        if kind == "snapshot":
+            return print_snapshot(meter_control, step.get("title", "SNAPSHOT"),
+                                  snapshot_sets[step.get("registers", "snapshot")])
+        if kind == "defaults":
+            return meter_control.calibration()
+        if kind == "calibrate":
+            solver = dict(solver_config, **{key: step[key] for key in solver_keys if key in step})
+            return meter_control.solve_phases(step["quantity"], step["reference"],
+                                              phases=step.get("phases", ("R", "Y", "B")), **solver)
+        if kind == "wait":
+            return None
+        raise ValueError(f"Unknown recipe step type: {kind}")
+
+    for index, step in enumerate(recipe["steps"]):
+        name = step.get("name", f"{index + 1}:{step['type']}")
+        record = {"name": name, "type": step["type"], "result": None}
+        report["steps"].append(record)
+
+        def func(step=step, record=record):
+            try:
+                record["result"] = run_step(step)
+            except SettleTimeoutError as e:
+                record["error"] = str(e)
+                return
+            time.sleep(step.get("wait", 0))
+
+        logging.info(f"Recipe step {name}")
+        if step_hook is None:
+            func()
+        else:
+            step_hook(name, func)
+
+        if "error" in record:
+            report["status"] = "failed"
+            logging.error(f"Recipe step {name} failed, stopping: {record['error']}")
+            break
+        if step["type"] == "calibrate" and not all(result["converged"] for result in record["result"]):
+            report["status"] = "failed"
+            if recipe.get("stop_on_failure", True):
+                logging.error(f"Recipe step {name} did not converge, stopping")
+                break
+
+    return report
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate one meter by running a recipe, without operator input")
+    parser.add_argument("--recipe", default="recipe.json", help="Recipe file, defaults to recipe.json")
+    parser.add_argument("--config", default="config.json", help="Configuration file, defaults to config.json")
+    parser.add_argument("--meter-port", help="Meter serial port, defaults to the first station of the configuration")
+    parser.add_argument("--output", help="Write the JSON run report to this file")
+    args = parser.parse_args()
+
     power_supply = None  # Initialize variable to avoid NameError in the finally block
     meter_control = None  # Initialize MeterControl object
+    store = None
+    recorder = None
+    status = "error"
+    report = None
+    exit_code = EXIT_ERROR
 
     try:
-        # Load configuration from file
-        with open("config.json", "r") as config_file:
+        # Load configuration and recipe from file
+        with open(args.config, "r") as config_file:
             config = json.load(config_file)
+        with open(args.recipe, "r") as recipe_file:
+            recipe = json.load(recipe_file)
 
         # Extract serial settings from config
         serial_config = config["serial"]
-        settings = config["settings"]
+        station = config["stations"][0]
 
         # Initialize PowerSupply object
         power_supply = PowerSupply(
@@ -38,178 +220,38 @@ if __name__ == "__main__":
         )
 
         # Initialize MeterControl object for the energy meter
-        meter_control = MeterCalControl(port="COM20", baudrate=115200) 
-
-        # Example: Set voltage, current, and power factor from configuration for power supply
-        set_power_supply = input("Do you want to change the power supply values? (yes/no): ").strip().lower()
-
-        if set_power_supply == 'yes':
-            power_supply.set_voltage_and_current_Powerfactor(
-                voltage=settings["voltage"],
-                current=settings["current"],
-                power_factor=settings["power_factor"]
-            )
-
-        # Add a delay of 100ms before getting the response
-            time.sleep(8)
-
-        # Get frame response from the power supply
-        # response = power_supply.get_frame_response()
-        # if response:
-        #     # Extract voltage and current from the response frame
-        #     Voltage, Voltage_Y, Voltage_B, Current, Current_Y, Current_B = power_supply.extract_voltage_and_current(response)
-        #     time.sleep(4)
-
-        # print()
-
-        print("\nBEFORE CALIBRATION DATA:\n")
-        meter_control.get_meter_data1(0x0061)   # Voltage gain Rphase
-        meter_control.get_meter_data(0x00D9, 0x00E9)  # R-Phase //read voltage
-        meter_control.get_meter_data1(0x0065)   # Voltage gain Yphase
-        meter_control.get_meter_data(0x00DA, 0x00EA)  # Y-Phase //read voltage
-        meter_control.get_meter_data1(0x0069)   # Voltage gain Bphase
-        meter_control.get_meter_data(0x00DB, 0x00EB)  # B-Phase //read voltage
-
-        meter_control.get_meter_data1(0x0062)   # Current gain Rphase
-        meter_control.get_meter_data(0x00DD, 0x00ED)  # R-Phase //read current
-        meter_control.get_meter_data1(0x0066)   # Current gain Yphase
-        meter_control.get_meter_data(0x00DE, 0x00EE)  # R-Phase //read current
-        meter_control.get_meter_data1(0x006A)   # Current gain Bphase
-        meter_control.get_meter_data(0x00DF, 0x00EF)  # R-Phase //read current
-
-        meter_control.get_meter_data(0x00B1, 0x00C1)  # R-Phase //read power
-        meter_control.get_meter_data(0x00B2, 0x00C2)  # y-Phase //read power
-        meter_control.get_meter_data(0x00B3, 0x00C3)  # B-Phase //read power
-
-        print()
-
-        # Ask the user if they want to calibrate voltage and current
-        calibrate_vol_cur = input("Do you want to calibrate voltage and current? (yes/no): ").strip().lower()
-
-        if calibrate_vol_cur == 'yes':
-            print("writing default values")
-            meter_control.calibration()
-            time.sleep(2)
-            print("\nCalibrating Voltage and Current...")
-            def check_and_calibrate(phase, voltage, current):
-                result = meter_control.get_meter_data(phase[0], phase[1])  # Read voltage
-                print(f"Phase {phase[2]} result: {result}")
-                if 219.5 <= result <= 220.5:
-                    print(f"Calibration for Voltage Phase {phase[2]} successful.")
-                elif 1.997 <= result <= 2.002:
-                    print(f"Calibration for current Phase {phase[2]} successful.")
-                else:
-                    recalibrate = input("calibration is not accurate do you want to recalibarte it?  (yes/no):").strip().lower()
-                    if recalibrate == 'yes':
-                        print(f"Calibration for Phase {phase[2]} failed, recalibrating...")
-                        meter_control.calibrate_vol_cur(phase[0], phase[1], phase[2], voltage)  # Recalibrate
-                        time.sleep(1)  # Allow time for recalibration
-                        check_and_calibrate(phase, voltage, current)  # Recursively check again
-                    else:
-                        print("voltage and current calibration done")
-
-            # Voltage Calibration for R-Phase
-            meter_control.calibrate_vol_cur(0x00D9, 0x00E9, 0x0061, settings["voltage"])  # Voltage calib Rphase
-            # check_and_calibrate([0x00D9, 0x00E9, 0x0061], Voltage, Current)  # Check R-Phase
-
-            # Voltage Calibration for Y-Phase
-            meter_control.calibrate_vol_cur(0x00DA, 0x00EA, 0x0065, settings["voltage"])  # Voltage calib Yphase
-            # check_and_calibrate([0x00DA, 0x00EA, 0x0065], Voltage_Y, Current_Y)  # Check Y-Phase
-
-            # Voltage Calibration for B-Phase
-            meter_control.calibrate_vol_cur(0x00DB, 0x00EB, 0x0069, settings["voltage"])  # Voltage calib Bphase
-            # check_and_calibrate([0x00DB, 0x00EB, 0x0069], Voltage_B, Current_B)  # Check B-Phase
-
-            # Current Calibration for R-Phase
-            meter_control.calibrate_vol_cur(0x00DD, 0x00ED, 0x0062, settings["current"])  # Current calib Rphase
-            # check_and_calibrate([0x00DD, 0x00ED, 0x0062], Voltage, Current)  # Check R-Phase current
-
-            # Current Calibration for Y-Phase
-            meter_control.calibrate_vol_cur(0x00DE, 0x00EE, 0x0066, settings["current"])  # Current calib Yphase
-            # check_and_calibrate([0x00DE, 0x00EE, 0x0066], Voltage_Y, Current_Y)  # Check Y-Phase current
-
-            # Current Calibration for B-Phase
-            meter_control.calibrate_vol_cur(0x00DF, 0x00EF, 0x006A, settings["current"])  # Current calib Bphase
-            # check_and_calibrate([0x00DF, 0x00EF, 0x006A], Voltage_B, Current_B)  # Check B-Phase current
-
-            time.sleep(3)  # Wait for final calibration process to complete
-
-            # meter_control.checksum()
-        
-            # If not calibrating voltage and current, ask if the user wants to calibrate phase angle
-        calibrate_phase_angle = input("Do you want to calibrate the phase angle? (yes/no): ").strip().lower()
-
-        if calibrate_phase_angle == 'yes':
-            # Set power supply to specific values for phase angle calibration
-            print("\nSetting Power Supply to Voltage: 220V, Current: 2A, Power Factor: 0.5 for Phase Angle Calibration...")
-            power_supply.set_voltage_and_current_Powerfactor(
-                voltage=220.0,  # Set to 220V
-                current=2.0,    # Set to 2A
-                power_factor="0.5L"  # Set power factor to 0.5
-                )
-
-            time.sleep(8)
-                
-            # Call the phase angle calibration function
-            print("\nCalibrating Phase Angle...")
-            meter_control.calibrate_phaseangle(0x0048)  # Voltage gain Rphase
-            meter_control.calibrate_phaseangle(0x004A)  # Voltage gain Yphase
-            meter_control.calibrate_phaseangle(0x004C)  # Voltage gain Bphase
-            time.sleep(3)
-            # meter_control.checksum()
-            
-
-        calibrate_Power = input("Do you want to calibrate the power? (yes/no): ").strip().lower()
-
-        if calibrate_Power == 'yes':
-            # Set power supply to specific values for phase angle calibration
-            print("\nSetting Power Supply to Voltage: 220V, Current: 2A, Power Factor: 1 for Phase Angle Calibration...")
-            power_supply.set_voltage_and_current_Powerfactor(
-                voltage=220.0,  # Set to 220V
-                current=2.0,    # Set to 2A
-                power_factor=1  # Set power factor to 1
-                )
-
-            time.sleep(8)
-                
-            # Call the phase angle calibration function
-            print("\nCalibrating Power...")
-            meter_control.calibrate_power(0x0047)  # power r phase
-            meter_control.calibrate_power(0x0049)  # power y phase
-            meter_control.calibrate_power(0x004B)  # power b phase
-            time.sleep(3)
-            # meter_control.checksum()
-            
-            time.sleep(5)
-
-        print("\nAFTER CALIBRATION DATA:\n")
-        meter_control.get_meter_data1(0x0061)   # Voltage gain Rphase
-        meter_control.get_meter_data(0x00D9, 0x00E9)  # R-Phase //read voltage
-        meter_control.get_meter_data1(0x0065)   # Voltage gain Yphase
-        meter_control.get_meter_data(0x00DA, 0x00EA)  # Y-Phase //read voltage
-        meter_control.get_meter_data1(0x0069)   # Voltage gain Bphase
-        meter_control.get_meter_data(0x00DB, 0x00EB)  # B-Phase //read voltage
-
-        meter_control.get_meter_data1(0x0062)   # Current gain Rphase
-        meter_control.get_meter_data(0x00DD, 0x00ED)  # R-Phase //read current
-        meter_control.get_meter_data1(0x0066)   # Current gain Yphase
-        meter_control.get_meter_data(0x00DE, 0x00EE)  # Y-Phase //read current
-        meter_control.get_meter_data1(0x006A)   # Current gain Bphase
-        meter_control.get_meter_data(0x00DF, 0x00EF)  # B-Phase //read current
-
-        meter_control.get_meter_data(0x00B1, 0x00C1)  # R-Phase //read power
-        meter_control.get_meter_data(0x00B2, 0x00C2)  # y-Phase //read power
-        meter_control.get_meter_data(0x00B3, 0x00C3)  # B-Phase //read power
-
-        meter_control.get_meter_data1(0x00F9)   # PA Rphase
-        meter_control.get_meter_data1(0x00FA)   # PA Yphase
-        meter_control.get_meter_data1(0x00FB)   # PA Bphase
-
-        meter_control.get_meter_data1(0x00F8)   # Frq
-
-        time.sleep(5)
+        addr_cache = AddressCache(config["address_cache"]["path"]) if "address_cache" in config else None
+        meter_control = MeterCalControl(port=args.meter_port or station["port"],
+                                        baudrate=station.get("baudrate", 115200),
+                                        addr_cache=addr_cache, fixture=station.get("fixture"))
+
+        # Record every register read, gain written and step timing of the run
+        store = ResultsStore(config.get("results", {}).get("path", "results.db"))
+        recorder = meter_control.recorder = store.begin_run(meter_control.station_addr, meter_control.ser.port,
+                                                            recipe.get("name"))
+
+        report = run_recipe(recipe, power_supply, meter_control, config.get("settle", {}), config.get("solver", {}),
+                            step_hook=recorder.time_step)
+        report["station_addr"] = meter_control.station_addr
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(report, output, indent=4)
+        status = report["status"]
+        logging.info(f"Recipe {report['name']}: {status}")
+        exit_code = EXIT_DONE if status == "done" else EXIT_FAILED
 
     except serial.SerialException as e:
         logging.error(f"Serial communication error: {e}")
     except Exception as e:
         logging.error(f"An error occurred: {e}")
+    finally:
+        if recorder is not None:
+            recorder.finish(status, report)
+        if store is not None:
+            store.close()
+        if meter_control is not None:
+            meter_control.ser.close()
+        if power_supply is not None:
+            power_supply.close()
+
+    sys.exit(exit_code)
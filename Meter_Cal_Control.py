@@ -1,29 +1,316 @@
 import serial
 import dlt645
+import functools
 import logging
+from dlt645.bus import Bus
+from dlt645.cache import cached_addr
+from dlt645.session import Session
 import math
+import statistics
+import threading
 import time 
+from collections import namedtuple
 from dlt645.constants import *
 
-valid_vol_addresses = (0x00D9, 0x00E9, 0x00DA, 0x00EA, 0x00DB, 0x00EB)
-valid_cur_addresses = (0x00DD, 0x00ED, 0x00DE, 0x00EE, 0x00DF, 0x00EF)
-valid_pwr_addresses = (0x00B1, 0x00C1, 0x00B2, 0x00C2, 0x00B3, 0x00C3)
+# Register catalogue: address -> (name, label, quantity, phase, unit, scale, lsb register, live)
+# A measurement held in an MSB/LSB register pair is listed under its MSB register, its
+# value is msb * scale + (lsb >> 8) * scale / 256. A scale of None leaves the raw value
+# (configuration registers, shown in hex). Live registers are measurements and
+# chip-maintained checksums, never served from the shadow. Unlisted registers are raw
+# configuration registers.
+register_catalogue = {
+    0x00D9: ("voltage_R", "voltage R Phase", "voltage", "R", "V", 0.01, 0x00E9, True),
+    0x00DA: ("voltage_Y", "voltage Y Phase", "voltage", "Y", "V", 0.01, 0x00EA, True),
+    0x00DB: ("voltage_B", "voltage B Phase", "voltage", "B", "V", 0.01, 0x00EB, True),
+    0x00DD: ("current_R", "Current R Phase", "current", "R", "A", 0.001, 0x00ED, True),
+    0x00DE: ("current_Y", "Current Y Phase", "current", "Y", "A", 0.001, 0x00EE, True),
+    0x00DF: ("current_B", "Current B Phase", "current", "B", "A", 0.001, 0x00EF, True),
+    0x00B0: ("power_total", "Pmean(W) Total", "power", None, "W", 4, 0x00C0, True),
+    0x00B1: ("power_R", "Power R Phase", "power", "R", "W", 1, 0x00C1, True),
+    0x00B2: ("power_Y", "Power Y Phase", "power", "Y", "W", 1, 0x00C2, True),
+    0x00B3: ("power_B", "Power B Phase", "power", "B", "W", 1, 0x00C3, True),
+    0x00B4: ("reactive_power_total", "Qmean(VAr) Total", "reactive_power", None, "VAr", 4, 0x00C4, True),
+    0x00B5: ("reactive_power_R", "Qmean(VAr) A", "reactive_power", "R", "VAr", 1, 0x00C5, True),
+    0x00B6: ("reactive_power_Y", "Qmean(VAr) B", "reactive_power", "Y", "VAr", 1, 0x00C6, True),
+    0x00B7: ("reactive_power_B", "Qmean(VAr) C", "reactive_power", "B", "VAr", 1, 0x00C7, True),
+    0x00B8: ("apparent_power_total", "Smean(VA) Total", "apparent_power", None, "VA", 4, 0x00C8, True),
+    0x00B9: ("apparent_power_R", "Smean(VA) A", "apparent_power", "R", "VA", 1, 0x00C9, True),
+    0x00BA: ("apparent_power_Y", "Smean(VA) B", "apparent_power", "Y", "VA", 1, 0x00CA, True),
+    0x00BB: ("apparent_power_B", "Smean(VA) C", "apparent_power", "B", "VA", 1, 0x00CB, True),
+    0x00D0: ("fundamental_power_total", "PmeanF(W) Total", "fundamental_power", None, "W", 4, 0x00E0, True),
+    0x00D1: ("fundamental_power_R", "PmeanF(W) A", "fundamental_power", "R", "W", 1, 0x00E1, True),
+    0x00D2: ("fundamental_power_Y", "PmeanF(W) B", "fundamental_power", "Y", "W", 1, 0x00E2, True),
+    0x00D3: ("fundamental_power_B", "PmeanF(W) C", "fundamental_power", "B", "W", 1, 0x00E3, True),
+    0x00D4: ("harmonic_power_total", "PmeanH(W) Total", "harmonic_power", None, "W", 4, 0x00E4, True),
+    0x00D5: ("harmonic_power_R", "PmeanH(W) A", "harmonic_power", "R", "W", 1, 0x00E5, True),
+    0x00D6: ("harmonic_power_Y", "PmeanH(W) B", "harmonic_power", "Y", "W", 1, 0x00E6, True),
+    0x00D7: ("harmonic_power_B", "PmeanH(W) C", "harmonic_power", "B", "W", 1, 0x00E7, True),
+    0x00BC: ("reg_00BC", "Register 00BC", None, None, None, 0.001, None, True),
+    0x00BD: ("reg_00BD", "Register 00BD", None, None, None, 0.001, None, True),
+    0x00BE: ("reg_00BE", "Register 00BE", None, None, None, 0.001, None, True),
+    0x00BF: ("reg_00BF", "Register 00BF", None, None, None, 0.001, None, True),
+    0x00F8: ("frequency", "freq", "frequency", None, "Hz", 0.01, None, True),
+    0x00F9: ("phase_angle_R", "phase angle R", "phase_angle", "R", "deg", 0.1, None, True),
+    0x00FA: ("phase_angle_Y", "phase angle Y", "phase_angle", "Y", "deg", 0.1, None, True),
+    0x00FB: ("phase_angle_B", "phase angle B", "phase_angle", "B", "deg", 0.1, None, True),
+    0x0061: ("voltage_gain_R", "Voltage Gain R_phase", "voltage_gain", "R", None, None, None, False),
+    0x0065: ("voltage_gain_Y", "Voltage Gain Y_phase", "voltage_gain", "Y", None, None, None, False),
+    0x0069: ("voltage_gain_B", "Voltage Gain B_phase", "voltage_gain", "B", None, None, None, False),
+    0x0062: ("current_gain_R", "Current Gain R_phase", "current_gain", "R", None, None, None, False),
+    0x0066: ("current_gain_Y", "Current Gain Y_phase", "current_gain", "Y", None, None, None, False),
+    0x006A: ("current_gain_B", "Current Gain B_phase", "current_gain", "B", None, None, None, False),
+    0x0047: ("power_gain_R", "Power Gain R_phase", "power_gain", "R", None, None, None, False),
+    0x0049: ("power_gain_Y", "Power Gain Y_phase", "power_gain", "Y", None, None, None, False),
+    0x004B: ("power_gain_B", "Power Gain B_phase", "power_gain", "B", None, None, None, False),
+    0x0048: ("phase_angle_gain_R", "Phase Angle Gain R_phase", "phase_angle_gain", "R", None, None, None, False),
+    0x004A: ("phase_angle_gain_Y", "Phase Angle Gain Y_phase", "phase_angle_gain", "Y", None, None, None, False),
+    0x004C: ("phase_angle_gain_B", "Phase Angle Gain B_phase", "phase_angle_gain", "B", None, None, None, False),
+    0x003B: ("checksum_003B", "Checksum 003B", "checksum", None, None, None, None, True),
+    0x004D: ("checksum_004D", "Checksum 004D", "checksum", None, None, None, None, True),
+    0x0057: ("checksum_0057", "Checksum 0057", "checksum", None, None, None, None, True),
+    0x006F: ("checksum_006F", "Checksum 006F", "checksum", None, None, None, None, True),
+}
+
+RegisterInfo = namedtuple("RegisterInfo", "name label quantity phase unit scale lsb live")
+
+
+def _pair_decoder(scale):
+    lsb_scale = scale / 256
+    return lambda msb_raw, lsb_raw: msb_raw * scale + ((lsb_raw >> 8) & 0xFF) * lsb_scale
+
+
+def _register_decoder(scale):
+    return lambda raw: raw * scale
+
+
+# Tables compiled once from the catalogue, decoding is a single lookup
+registers = {addr: RegisterInfo(*entry) for addr, entry in register_catalogue.items()}
+# (msb, lsb) -> decoder(msb_raw, lsb_raw)
+pair_decoders = {(addr, info.lsb): _pair_decoder(info.scale) for addr, info in registers.items() if info.lsb}
+# single scaled register -> decoder(raw), every other register is returned raw
+register_decoders = {addr: _register_decoder(info.scale) for addr, info in registers.items()
+                     if info.lsb is None and info.scale is not None}
+# register or (msb, lsb) -> display label
+register_labels = {(addr, info.lsb) if info.lsb else addr: info.label for addr, info in registers.items()}
+live_registers = frozenset(
+    [addr for addr, info in registers.items() if info.live]
+    + [info.lsb for info in registers.values() if info.lsb]
+)
+
+# (msb, lsb, gain register, settings key) for the voltage and current calibration
+vol_cur_steps = [
+    (0x00D9, 0x00E9, 0x0061, "voltage"),
+    (0x00DA, 0x00EA, 0x0065, "voltage"),
+    (0x00DB, 0x00EB, 0x0069, "voltage"),
+    (0x00DD, 0x00ED, 0x0062, "current"),
+    (0x00DE, 0x00EE, 0x0066, "current"),
+    (0x00DF, 0x00EF, 0x006A, "current"),
+]
+phase_angle_gains = (0x0048, 0x004A, 0x004C)
+power_gains = (0x0047, 0x0049, 0x004B)
+# gain register -> measured register(s), for the closed-loop solver
+phase_angle_registers = {0x0048: 0x00F9, 0x004A: 0x00FA, 0x004C: 0x00FB}
+power_pairs = {0x0047: (0x00B1, 0x00C1), 0x0049: (0x00B2, 0x00C2), 0x004B: (0x00B3, 0x00C3)}
+
+# phase angle gain per unit of cos error at 60 degrees, see calibrate_phaseangle()
+g_phase = 3763.739
 
 logging.basicConfig(level=logging.DEBUG)
 
+
+def register_id(addr):
+    """Return the DL/T645-1997 data identifier used to access a chip register."""
+    if addr == 0x0070:
+        return addr + 0xE000
+    return addr + 0xD000
+
+
+def register_value(frame):
+    """Return the 16-bit register value carried in the last two data bytes of a reply frame."""
+    return frame.u16(frame.length - 2)
+
+
+def decode_register(addr, raw):
+    """Scale a raw single register value, see register_catalogue."""
+    decoder = register_decoders.get(addr)
+    return raw if decoder is None else decoder(raw)
+
+
+def decode_pair(addr1, addr2, msb_raw, lsb_raw):
+    """Combine the MSB and LSB registers of a measurement pair, see register_catalogue."""
+    return pair_decoders[(addr1, addr2)](msb_raw, lsb_raw)
+
+
+def register_key(addr):
+    """Return the read_registers() key of a catalogued register: its (msb, lsb) pair or the register."""
+    info = registers.get(addr)
+    return (addr, info.lsb) if info is not None and info.lsb else addr
+
+
+def signed16(value):
+    """Interpret a raw 16-bit register value as two's complement."""
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def summarize_samples(values, trim=0.1):
+    """
+    Return mean, median, standard deviation and trimmed mean of measured values.
+
+    :param trim: Fraction of the values dropped at each end for the trimmed mean
+    """
+    ordered = sorted(values)
+    cut = int(len(ordered) * trim)
+    kept = ordered[cut:len(ordered) - cut] or ordered
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "median": statistics.median(ordered),
+        "std": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "trimmed_mean": statistics.fmean(kept),
+    }
+
+
+def reply_matches(data_id):
+    """Return a Session match function accepting the reply to a read of data_id."""
+    def match(frame):
+        if frame.control["response"] != RESPONSE_CORRECT:
+            return True
+        return frame.length >= 4 and frame.u16(0) == data_id
+    return match
+
+
+def serialized(method):
+    """Run a MeterCalControl transaction method holding the port lock, shared by the meters of a Bus."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def open_port(port, baudrate=115200, timeout=2):
+    """Open a meter serial port (8E1)."""
+    return serial.Serial(
+        port=port,
+        baudrate=baudrate,
+        parity=serial.PARITY_EVEN,
+        stopbits=serial.STOPBITS_ONE,
+        bytesize=serial.EIGHTBITS,
+        timeout=timeout
+    )
+
+
+def open_bus(port, baudrate=115200, addresses=None, scan_timeout=0.05, retries=2, preamble=4, idle_gap=1.0,
+             addr_cache=None):
+    """
+    Open a port shared by several meters and find them, see dlt645.bus.
+
+    :param addresses: Station addresses to probe (default: discover every meter on the line)
+    :param scan_timeout: Wait for a silent probe, in seconds
+    :param addr_cache: Optional dlt645.cache.AddressCache; the meters cached for the port are probed
+        instead of discovering the line, which only happens again when one of them does not answer
+    :return: dlt645.bus.Bus, its stations attribute lists the meters found
+    """
+    ser = open_port(port, baudrate)
+    bus = Bus(ser, retries=retries, max_timeout=ser.timeout, preamble=preamble, idle_gap=idle_gap)
+    cached = addr_cache.get(port) if addr_cache is not None and addresses is None else None
+    if cached and len(bus.scan(scan_timeout, cached)) == len(cached):
+        logging.info(f"{port}: cached meters all answered")
+    else:
+        bus.scan(scan_timeout, addresses)
+        if addr_cache is not None and addresses is None:
+            addr_cache.put(port, bus.stations)
+    logging.info(f"{port}: {len(bus.stations)} meter(s) on the bus: {', '.join(bus.stations)}")
+    return bus
+
+
+def is_cacheable(addr):
+    """Return True for configuration registers that may be kept in a RegisterShadow."""
+    return addr not in live_registers
+
+
+class RegisterShadow:
+    """
+    In-memory copy of meter configuration registers, keyed by station address.
+
+    Values written through write_meter_data() or read from the meter are kept for
+    max_age seconds and served instead of a serial round trip. One shadow can be
+    shared by several MeterCalControl instances.
+    """
+
+    def __init__(self, max_age=30.0):
+        self.max_age = max_age
+        self.values = {}  # (station_addr, register) -> (value, time stored)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, station_addr, addr):
+        """Return the shadowed value of a register, or None if unknown or stale."""
+        entry = self.values.get((station_addr, addr))
+        if entry is not None and time.monotonic() - entry[1] <= self.max_age:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def put(self, station_addr, addr, value):
+        self.values[(station_addr, addr)] = (value, time.monotonic())
+
+    def invalidate(self, station_addr=None, addr=None):
+        """Drop shadowed values: everything, one station, or one register of a station."""
+        if station_addr is None:
+            self.values.clear()
+        elif addr is None:
+            for key in [key for key in self.values if key[0] == station_addr]:
+                del self.values[key]
+        else:
+            self.values.pop((station_addr, addr), None)
+
+    def stats(self):
+        """Return hit/miss counters; every hit is a serial round trip saved."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.values)}
+
+
 class MeterCalControl:
-    def __init__(self,port="COM19", baudrate=115200):
-        self.ser = serial.Serial(
-            port=port,
-            baudrate=baudrate,
-            parity=serial.PARITY_EVEN,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            timeout=2
-        )
-        # Get station address (you may already have this function implemented elsewhere)
-        self.station_addr = dlt645.get_addr(self.ser)
+    def __init__(self,port="COM19", baudrate=115200, shadow=None, instrument=False, retries=2,
+                 preamble=4, idle_gap=1.0, speed=None, bus=None, station_addr=None, addr_cache=None, fixture=None):
+        if bus is not None:
+            # One meter of a shared RS-485 bus (see open_bus): the port, the session and the lock are the bus'
+            self.ser = bus.flo
+            self.session = bus.session
+            self.frame_reader = bus.session.reader
+            self.lock = bus.lock
+            self.station_addr = station_addr
+        else:
+            self.ser = open_port(port, baudrate)
+            # Keeps bytes received past the end of a frame for the next read
+            self.frame_reader = dlt645.FrameReader()
+            self.lock = threading.RLock()
+        # Optional RegisterShadow serving configuration register reads
+        self.shadow = shadow
+        # Optional Results_Store.RunRecorder receiving every register read and write
+        self.recorder = None
+        if instrument:
+            # Record latency/error statistics of every transaction (see transaction_stats)
+            dlt645.enable_stats()
+        if bus is None:
+            # Request/reply with adaptive timeouts; reads are retried up to `retries` times and
+            # the `preamble` wake up bytes are only sent after `idle_gap` seconds of silence or an error
+            self.session = Session(self.ser, self.frame_reader, retries=retries, max_timeout=self.ser.timeout,
+                                   preamble=preamble, idle_gap=idle_gap)
+            if addr_cache is not None:
+                # Check the address cached for the fixture (default: the port), broadcast only if it fails
+                self.station_addr = cached_addr(self.ser, fixture or port, addr_cache, self.frame_reader)
+            else:
+                # Get station address (you may already have this function implemented elsewhere)
+                self.station_addr = dlt645.get_addr(self.ser)
         print(f"Station Address: {self.station_addr}")
+        if speed is not None and bus is None:
+            # Switch the meter and the port to the first accepted rate of `speed` (int or list)
+            rate = dlt645.negotiate_speed(self.ser, self.station_addr, speed, compat=DLT645_1997)
+            if rate != baudrate:
+                self.session.estimators.clear()  # round trips measured at the old rate
+            logging.info(f"Meter link at {rate} baud")
 
         self.read_control = {
             "direction": MAIN,
@@ -39,50 +326,18 @@ class MeterCalControl:
             "function": FUNCTION_CODES[DLT645_1997]["WRITE_DATA"],  # Write function code
         }
 
+    @serialized
     def get_meter_data(self,addr1, addr2):
         # Initialize variables to store the results for each register
         reg1_value = None
         reg2_value = None
         # List of addresses to query
         addresses = [addr1, addr2]
-        # dictionary to map address pairs to (msb, lsb) values
-        address_map = {
-            (0x00D9, 0x00E9): (0.01, 0.01),  # Voltage A
-            (0x00DA, 0x00EA): (0.01, 0.01),  # Voltage B
-            (0x00DB, 0x00EB): (0.01, 0.01),  # Voltage C
-            (0x00DD, 0x00ED): (0.001, 0.001),  # Current A
-            (0x00DE, 0x00EE): (0.001, 0.001),  # Current B
-            (0x00DF, 0x00EF): (0.001, 0.001),  # Current C
-            (0x00B0, 0x00C0): (4, 4),  # Pmean(W) Total
-            (0x00B1, 0x00C1): (1, 1),  # Pmean(W) A
-            (0x00B2, 0x00C2): (1, 1),  # Pmean(W) B
-            (0x00B3, 0x00C3): (1, 1),  # Pmean(W) C
-            (0x00B4, 0x00C4): (4, 4),  # Qmean(VAr) Total
-            (0x00B5, 0x00C5): (1, 1),  # Qmean(VAr) A
-            (0x00B6, 0x00C6): (1, 1),  # Qmean(VAr) B
-            (0x00B7, 0x00C7): (1, 1),  # Qmean(VAr) C
-            (0x00B8, 0x00C8): (4, 4),  # Smean(VA) Total
-            (0x00B9, 0x00C9): (1, 1),  # Smean(VA) A
-            (0x00BA, 0x00CA): (1, 1),  # Smean(VA) B
-            (0x00BB, 0x00CB): (1, 1),  # Smean(VA) C
-            (0x00D0, 0x00E0): (4, 4),  # PmeanF(W) Total
-            (0x00D1, 0x00E1): (1, 1),  # PmeanF(W) A
-            (0x00D2, 0x00E2): (1, 1),  # PmeanF(W) B
-            (0x00D3, 0x00E3): (1, 1),  # PmeanF(W) C
-            (0x00D4, 0x00E4): (4, 4),  # PmeanH(W) Total
-            (0x00D5, 0x00E5): (1, 1),  # PmeanH(W) A
-            (0x00D6, 0x00E6): (1, 1),  # PmeanH(W) B
-            (0x00D7, 0x00E7): (1, 1),  # PmeanH(W) C
-        }
-
-        # Use the dictionary to look up msb, lsb values based on the address pair
-        msb, lsb = address_map[(addr1, addr2)]  # No default, will raise error if not found
+        # Look up the decoder of the address pair, see register_catalogue
+        decode = pair_decoders[(addr1, addr2)]  # No default, will raise error if not found
 
         for i, addr in enumerate(addresses):
-            if addr == 0x0070:
-                addr += 0xE000
-            else:
-                addr += 0xD000  # Add 0xD000 to address (as per your original logic)
+            addr = register_id(addr)
             #print(f"Querying address {i + 1}: {hex(addr)}")
 
             # Prepare the frame
@@ -90,118 +345,250 @@ class MeterCalControl:
             frame.data = '%04X' % addr
             #print("Sent frame:     ",frame.dump().hex())
 
-            # Send the frame
-            dlt645.write_frame(self.ser, frame=frame, awaken=True)
-
-            # Read the response
-            frame_data = dlt645.read_frame(dlt645.iogen(self.ser))
+            # Send the frame and read the response
+            frame_data = self.session.request(frame, match=reply_matches(addr))
 
             # Store the received data in separate variables
-            if len(frame_data.data) >= 4:
+            if frame_data is not None and frame_data.length >= 2:
                 if i == 0:
-                    reg1_value = int(frame_data.data[0:4], 16)
+                    reg1_value = register_value(frame_data)
                 elif i == 1:
-                    reg2_value = int(frame_data.data[0:4], 16)
+                    reg2_value = register_value(frame_data)
+                if self.recorder is not None:
+                    self.recorder.register_read(self.station_addr, addresses[i], register_value(frame_data))
             else:
                 print(f"Error: Incomplete data received for address {hex(addr)}")
                 continue
 
-            # Perform conversion logic here using reg1_value and reg2_value for V,A,W,VAr,VA,Fundamental&Harmonic for W
+            # Conversion for V,A,W,VAr,VA,Fundamental&Harmonic for W
             if reg1_value is not None and reg2_value is not None:
-                reg2_value = (reg2_value >> 8) & 0xFF  # Shift right by 8 and mask with 0xFF because we need only higher 8 bits
-                result = (reg1_value * msb) + (reg2_value * lsb / 256)
-                if addr1 and addr2 in valid_vol_addresses:
-                    if addr1 == 0x00D9:
-                        print(f"voltage R Phase: {float(result)}")
-                    elif addr1 == 0x00DA:
-                        print(f"voltage Y Phase: {float(result)}") 
-                    elif addr1 == 0x00DB:
-                        print(f"voltage B Phase: {float(result)}")
-                elif addr1 and addr2 in valid_cur_addresses:
-                    if addr1 == 0x00DD:
-                        print(f"Current R Phase: {float(result)}")
-                    elif addr1 == 0x00DE:
-                        print(f"Current Y Phase: {float(result)}") 
-                    elif addr1 == 0x00DF:
-                        print(f"Current B Phase: {float(result)}")
-                elif addr1 and addr2 in valid_pwr_addresses:
-                    if addr1 == 0x00B1:
-                        print(f"Power R Phase: {float(result)}")
-                    elif addr1 == 0x00B2:
-                        print(f"Power Y Phase: {float(result)}") 
-                    elif addr1 == 0x00B3:
-                        print(f"Power B Phase: {float(result)}")
+                result = decode(reg1_value, reg2_value)
+                info = registers[addr1]
+                if info.quantity in ("voltage", "current", "power") and info.phase is not None:
+                    print(f"{info.label}: {float(result)}")
 
                 return result
             #else:
                 #print("warning: One or more registers did not return valid data to perform conversion.")
                 #print()
 
+    def read_registers(self, registers, window=None):
+        """
+        Read many registers in one batch and return a dict of decoded values.
+
+        Request frames are written back to back and the replies are matched to
+        their register by the data identifier they carry, so a batch costs one
+        round trip per window instead of one per register.
+
+        :param registers: Register addresses; a (msb, lsb) tuple reads a measurement pair
+        :param window: Maximum number of requests in flight (default: the whole batch)
+        :return: {register or (msb, lsb): decoded value}, None for registers that did not answer
+        """
+        addresses = []
+        for reg in registers:
+            addresses.extend(reg if isinstance(reg, tuple) else (reg,))
+        addresses = list(dict.fromkeys(addresses))  # drop duplicates, keep order
+
+        raw = self.read_raw_registers(addresses, window)
+
+        values = {}
+        for reg in registers:
+            if isinstance(reg, tuple):
+                msb_raw, lsb_raw = raw.get(reg[0]), raw.get(reg[1])
+                if msb_raw is None or lsb_raw is None:
+                    values[reg] = None
+                else:
+                    values[reg] = decode_pair(reg[0], reg[1], msb_raw, lsb_raw)
+            else:
+                values[reg] = None if raw.get(reg) is None else decode_register(reg, raw[reg])
+        return values
+
+    def sample_registers(self, registers, samples=10, interval=0.1, trim=0.1, precision=None, min_samples=3, z=1.96):
+        """
+        Read live registers repeatedly and return statistics of the readings.
+
+        Each round reads all the registers in one batch. With a precision, sampling
+        stops early once the confidence interval of every mean (z * std / sqrt(n))
+        is within precision times the mean.
+
+        :param registers: Register addresses; a (msb, lsb) tuple samples a measurement pair
+        :param samples: Maximum number of readings per register
+        :param interval: Seconds between two rounds
+        :param trim: Fraction of the readings dropped at each end for the trimmed mean
+        :param precision: Relative half-width of the confidence interval to stop at, None to take every sample
+        :param min_samples: Readings taken before the early stop is considered
+        :param z: Quantile of the confidence interval (1.96 for 95 %)
+        :return: {register: summarize_samples() result, or None if it never answered}
+        """
+        readings = {reg: [] for reg in registers}
+        for n in range(1, samples + 1):
+            values = self.read_registers(registers)
+            for reg in registers:
+                if values[reg] is not None:
+                    readings[reg].append(values[reg])
+
+            if precision is not None and n >= min_samples and all(
+                len(v) > 1 and z * statistics.stdev(v) / math.sqrt(len(v)) <= precision * abs(statistics.fmean(v))
+                for v in readings.values()
+            ):
+                break
+            if n < samples:
+                time.sleep(interval)
+
+        return {reg: summarize_samples(v, trim) if v else None for reg, v in readings.items()}
+
+    @serialized
+    def read_raw_registers(self, addresses, window=None):
+        """
+        Pipeline read requests for a list of registers, return {register: raw value}.
+
+        :param addresses: Register addresses (without the 0xD000/0xE000 offset)
+        :param window: Maximum number of requests in flight (default: all of them)
+        """
+        raw = {}
+        if self.shadow is not None:
+            for addr in addresses:
+                if is_cacheable(addr):
+                    value = self.shadow.get(self.station_addr, addr)
+                    if value is not None:
+                        raw[addr] = value
+            addresses = [addr for addr in addresses if addr not in raw]
+
+        ids = {register_id(addr): addr for addr in addresses}
+        window = window or len(addresses) or 1
+
+        self.session.set_timeout(self.session.estimator(self.station_addr).timeout)
+        for start in range(0, len(addresses), window):
+            batch = addresses[start:start + window]
+            frames = []
+            for addr in batch:
+                frame = dlt645.Frame(addr=self.station_addr, control=self.read_control)
+                frame.data = '%04X' % register_id(addr)
+                frames.append(frame)
+            dlt645.write_frames(self.ser, frames, awaken=self.session.awaken(self.station_addr))
+            # the line stays awake for the rest of the batch
+            self.session.skip_preambles(len(frames) - 1)
+
+            for _ in batch:
+                frame_data = dlt645.recv_frame(self.ser, self.frame_reader)
+                if frame_data is None:
+                    logging.warning("Timeout while reading batched registers")
+                    self.session.mark_error(self.station_addr)
+                    break
+                self.session.mark_active(self.station_addr)
+                if frame_data.addr != self.station_addr.lower():
+                    logging.warning(f"Reply from another station in batch: {frame_data.addr}")
+                    continue
+                if frame_data.control["response"] != RESPONSE_CORRECT or frame_data.length < 4:
+                    logging.warning(f"Unexpected reply in batch: {frame_data.data}")
+                    continue
+                addr = ids.get(frame_data.u16(0))
+                if addr is not None:
+                    raw[addr] = register_value(frame_data)
+                    if self.shadow is not None and is_cacheable(addr):
+                        self.shadow.put(self.station_addr, addr, raw[addr])
+                    if self.recorder is not None:
+                        self.recorder.register_read(self.station_addr, addr, raw[addr])
+
+        # registers lost from a batch are read again one by one, with retries
+        for addr in addresses:
+            if addr in raw:
+                continue
+            frame = dlt645.Frame(addr=self.station_addr, control=self.read_control)
+            frame.data = '%04X' % register_id(addr)
+            frame_data = self.session.request(frame, match=reply_matches(register_id(addr)))
+            if frame_data is not None and frame_data.control["response"] == RESPONSE_CORRECT:
+                raw[addr] = register_value(frame_data)
+                if self.shadow is not None and is_cacheable(addr):
+                    self.shadow.put(self.station_addr, addr, raw[addr])
+                if self.recorder is not None:
+                    self.recorder.register_read(self.station_addr, addr, raw[addr])
+
+        return raw
+
+    def retry_stats(self):
+        """Return the session retry/preamble counters and the RTT/timeout estimate of the meter."""
+        return self.session.stats()
+
+    def transaction_stats(self):
+        """
+        Return the transaction statistics of this meter, None if instrumentation is off.
+
+        Counters (bytes, checksum/format errors, timeouts) and first/last byte
+        latency histograms in microseconds, see dlt645.stats.
+        """
+        stats = dlt645.get_stats()
+        if stats is None:
+            return None
+        return stats.snapshot(self.station_addr)
+
+    def stream_block(self, data_id, compat=DLT645_2007):
+        """
+        Read a data block (e.g. a load profile or an energy table) and yield its chunks as the follow-up frames arrive.
+
+        The meter lock is held until the generator is exhausted or closed, so the
+        follow-up frames of one block are not interleaved with other transactions.
+
+        :param data_id: Data identifier, 4 bytes for DL/T645-2007
+        :param compat: DL/T645 version of the identifier
+        :return: Generator of bytes chunks in line order (least significant byte first)
+        """
+        with self.lock:
+            yield from dlt645.read_data_stream(self.ser, self.station_addr, data_id, compat,
+                                               request=self.session.request)
+
+    def read_block(self, data_id, compat=DLT645_2007):
+        """Read a whole data block and its follow-up frames, see stream_block."""
+        return b"".join(self.stream_block(data_id, compat))
+
+    @serialized
     def get_meter_data1(self,addr):
         valid_addrs = addr
-        if addr == 0x0070:
-            addr += 0xE000
+        reg1_value = None
+        if self.shadow is not None and is_cacheable(addr):
+            reg1_value = self.shadow.get(self.station_addr, addr)
+        if reg1_value is not None:
+            reg_hex = '%04x' % reg1_value
         else:
-            addr += 0xD000  # Add 0xD000 to address (as per your original logic)
-        # print(f"Querying address: {hex(addr)}")
-        # Prepare the frame
-        frame = dlt645.Frame(addr=self.station_addr, control=self.read_control)
-        frame.data = '%04X' % addr
-        #print("Sent frame:     ", frame.dump().hex())
-        # Send the frame
-        dlt645.write_frame(self.ser, frame=frame, awaken=True)
-        # Read the response
-        frame_data = dlt645.read_frame(dlt645.iogen(self.ser))
-        # Debug: print the received frame
-
-        print("Received frame: ", frame_data.dump().hex())
-        # print(frame_data.data[0:4], end='\n')
-        if(valid_addrs == 0x0061):
-            print("Voltage Gain R_phase: ", frame_data.data[0:4], end='\n')
-        elif(valid_addrs == 0x0065):
-            print("Voltage Gain Y_phase: ", frame_data.data[0:4], end='\n')
-        elif(valid_addrs == 0x0069):
-            print("Voltage Gain B_phase: ", frame_data.data[0:4], end='\n')
-        elif(valid_addrs == 0x0062):
-            print("Current Gain R_phase: ", frame_data.data[0:4], end='\n')
-        elif(valid_addrs == 0x0066):
-            print("Current Gain Y_phase: ", frame_data.data[0:4], end='\n')
-        elif(valid_addrs == 0x006A):
-            print("Current Gain B_phase: ", frame_data.data[0:4], end='\n')
-
-        reg1_value = int(frame_data.data[0:4], 16)
-  
-        valid_addresses = (0x00BC, 0x00BD, 0x00BE, 0x00BF, 0x00F9, 0x00FA, 0x00FB, 0x00F8)
-        if valid_addrs in valid_addresses:
-                # Select the msb multiplier based on the address
-            if addr in (0xD0BC, 0xD0BD, 0xD0BE, 0xD0BF):
-                msb = 0.001
-            elif addr in (0xD0F9, 0xD0FA, 0xD0FB):
-                msb = 0.1
-                name = "phase angle"
-            else:
-                msb = 0.01  # Default case, could be unnecessary given valid_addresses
-                name = "freq"
+            addr = register_id(addr)
+            # print(f"Querying address: {hex(addr)}")
+            # Prepare the frame
+            frame = dlt645.Frame(addr=self.station_addr, control=self.read_control)
+            frame.data = '%04X' % addr
+            #print("Sent frame:     ", frame.dump().hex())
+            # Send the frame and read the response
+            frame_data = self.session.request(frame, match=reply_matches(addr))
+            if frame_data is None:
+                raise dlt645.ReadTimeoutError(f"No reply for address {hex(addr)}")
+            # Debug: print the received frame
 
-                # Ensure reg1_value is not None and perform calculation
-            if reg1_value is not None:
-                result = reg1_value * msb
-                print(f"{name}: {float(result)}\n")
-                return result
-                
-            else:
-                print(f"Address {hex(addr)} is not valid for conversion.")
+            print("Received frame: ", frame_data.view.hex())
+            reg1_value = register_value(frame_data)
+            reg_hex = '%04x' % reg1_value
+            if self.shadow is not None and is_cacheable(valid_addrs):
+                self.shadow.put(self.station_addr, valid_addrs, reg1_value)
+            if self.recorder is not None:
+                self.recorder.register_read(self.station_addr, valid_addrs, reg1_value)
+
+        # print(reg_hex, end='\n')
+        info = registers.get(valid_addrs)
+        if info is not None and info.scale is None and not info.live:
+            print(f"{info.label}: ", reg_hex, end='\n')
+
+        decoder = register_decoders.get(valid_addrs)
+        if decoder is not None:
+            result = decoder(reg1_value)
+            print(f"{info.label}: {float(result)}\n")
+            return result
         else:
-                # No calculation for invalid addresses
-                # print(int(frame_data.data[0:4], 16))
-                print()
-                return reg1_value
+            # No calculation for raw registers
+            print()
+            return reg1_value
 
+    @serialized
     def write_meter_data(self,addr, data_value):
-        if addr == 0x0070:
-            addr += 0xE000
-        else:
-            addr += 0xD000  # Add 0xD000 to address (as per your original logic)
+        reg = addr
+        addr = register_id(addr)
         print(f"Querying address: {hex(addr)}")
         if isinstance(data_value, int):
             data_value = format(data_value, 'X')  # Convert integer to uppercase hex string (without '0x' prefix)
@@ -215,28 +602,34 @@ class MeterCalControl:
         frame.data = frame_data
         # Print the frame for debugging
         #print(f"Sent frame: {frame.dump().hex()}")
-        # Send the frame
-        dlt645.write_frame(self.ser, frame=frame, awaken=True)
-        # Read the response
-        frame_data_received = dlt645.read_frame(dlt645.iogen(self.ser))
+        # Send the frame and read the response (a write is not retried)
+        frame_data_received = self.session.request(frame, idempotent=False)
+        accepted = frame_data_received is not None and frame_data_received.control["response"] == RESPONSE_CORRECT
+        if self.shadow is not None and is_cacheable(reg):
+            if accepted:
+                self.shadow.put(self.station_addr, reg, int_value)
+            else:
+                self.shadow.invalidate(self.station_addr, reg)
+        if self.recorder is not None:
+            self.recorder.register_written(self.station_addr, reg, int_value, accepted)
         #print("Received frame :", frame_data_received.dump().hex(),"\n")
         #print("write completed")
 
-    def calibrate_vol_cur(self,addr1,addr2,gain_addr,ref_value):
+    def calibrate_vol_cur(self,addr1,addr2,gain_addr,ref_value,measured=None):
         const_vol_cur_gain = 0
-        #valid_vol_addresses = (0x00D9, 0x00E9, 0x00DA, 0x00EA, 0x00DB, 0x00EB)
-        #valid_cur_addresses = (0x00DD, 0x00ED, 0x00DE, 0x00EE, 0x00DF, 0x00EF)
+        info = registers.get(addr1)
+        quantity = info.quantity if info is not None and info.lsb == addr2 else None
 
         vol_cur_gain = self.get_meter_data1(gain_addr)
 
-        if addr1 and addr2 in valid_vol_addresses:
+        if quantity == "voltage":
             #ref_value = 220
             if vol_cur_gain == 0:
                 const_vol_cur_gain = 52800
             else:
                 const_vol_cur_gain = vol_cur_gain
 
-        elif addr1 and addr2 in valid_cur_addresses:
+        elif quantity == "current":
             #ref_value = 3.0
             if vol_cur_gain == 0:
                 const_vol_cur_gain = 30000
@@ -246,7 +639,8 @@ class MeterCalControl:
         else:
             print("No valid addresses",'\n')
 
-        vol_cur_measured_value = self.get_meter_data(addr1, addr2)
+        # a value already measured by the caller saves the read
+        vol_cur_measured_value = self.get_meter_data(addr1, addr2) if measured is None else measured
 
         new_vol_cur_gain = ((ref_value/vol_cur_measured_value)*const_vol_cur_gain)
         #print(f"vol_cur gain :{float(new_vol_cur_gain)}")
@@ -259,18 +653,11 @@ class MeterCalControl:
         #self.get_meter_data(addr1, addr2)
 
     def calibrate_power(self,gain_addr):
-        if gain_addr == 0x0047:
-            addr1,addr2 = 0x00B1,0x00C1
-            phase = "R"  # Phase R for gain_addr == 0x0047
-        elif gain_addr == 0x0049:
-            addr1,addr2 = 0x00B2,0x00C2
-            phase = "Y"  # Phase Y for gain_addr == 0x0049
-        elif gain_addr == 0x004B:
-            addr1,addr2 = 0x00B3,0x00C3
-            phase = "B"  # Phase B for gain_addr == 0x004B
-        else:
+        if gain_addr not in power_pairs:
             print("no valid register")
             return
+        addr1, addr2 = power_pairs[gain_addr]
+        phase = registers[gain_addr].phase
  
         measured_power = self.get_meter_data(addr1, addr2)
         error = ((measured_power-440)/440)
@@ -300,20 +687,11 @@ class MeterCalControl:
             return hex_value
  
     def calibrate_phaseangle(self, gain_addr):
-        g_phase: float = 3763.739
- 
-        if gain_addr == 0x0048:
-            addr1 = 0x00F9
-            phase = "R"  # Phase R for gain_addr == 0x0047
-        elif gain_addr == 0x004A:
-            addr1 = 0x00FA
-            phase = "Y"  # Phase R for gain_addr == 0x0047
-        elif gain_addr == 0x004C:
-            addr1 = 0x00FB
-            phase = "B"  # Phase R for gain_addr == 0x0047
-        else:
+        if gain_addr not in phase_angle_registers:
             print("no valid register")
             return
+        addr1 = phase_angle_registers[gain_addr]
+        phase = registers[gain_addr].phase
  
         self.write_meter_data(gain_addr,0x0000)
         measured_angle = self.get_meter_data1(addr1)
@@ -327,6 +705,130 @@ class MeterCalControl:
  
         self.write_meter_data(gain_addr, hex_rep)
 
+    def solve_gains(self, loops, tolerance=0.001, max_iterations=5, settle=1.0, sampling=None):
+        """
+        Closed-loop calibration of gain registers.
+
+        The measured registers of all loops are read in one batch; every loop whose
+        relative error is above tolerance writes its corrected gain, then after a
+        single settle delay the remaining loops are measured again, for at most
+        max_iterations gain writes per loop.
+
+        :param loops: List of (name, measured register, error, correct[, min tolerance]) where
+            error(measured) returns the relative error and correct(measured) writes the
+            corrected gain; a loop whose measurement is too coarse for tolerance gives the
+            smallest error it can resolve as min tolerance
+        :param settle: Seconds to wait after the gain writes before measuring again
+        :param sampling: sample_registers() arguments to measure with the trimmed mean of
+            several readings instead of a single read (None)
+        :return: List of {"name", "iterations", "value", "error", "converged", "tolerance"}, one per loop
+        """
+        results = {loop[0]: {"name": loop[0], "iterations": 0, "value": None, "error": None, "converged": False,
+                             "tolerance": max([tolerance, *loop[4:]])} for loop in loops}
+        active = list(loops)
+        while active:
+            registers = [loop[1] for loop in active]
+            if sampling is None:
+                values = self.read_registers(registers)
+            else:
+                stats = self.sample_registers(registers, **sampling)
+                values = {reg: None if stats[reg] is None else stats[reg]["trimmed_mean"] for reg in registers}
+            pending = []
+            for loop in active:
+                name, reg, error = loop[:3]
+                result = results[name]
+                result["value"] = values[reg]
+                if values[reg] is None:
+                    logging.warning(f"{name}: no measurement")
+                    continue
+                result["error"] = error(values[reg])
+                result["converged"] = abs(result["error"]) <= result["tolerance"]
+                if not result["converged"] and result["iterations"] < max_iterations:
+                    pending.append(loop)
+
+            for loop in pending:
+                name, correct = loop[0], loop[3]
+                correct(results[name]["value"])
+                results[name]["iterations"] += 1
+            if pending:
+                time.sleep(settle)
+            active = pending
+
+        for result in results.values():
+            logging.info(f"{result['name']}: {result['iterations']} gain writes, residual error {result['error']}"
+                         + ("" if result["converged"] else f" (tolerance {result['tolerance']} not reached)"))
+        return list(results.values())
+
+    def vol_cur_loop(self, addr1, addr2, gain_addr, ref_value):
+        """Return the solve_gains() loop of a voltage/current gain."""
+        return (
+            f"gain {gain_addr:04X}",
+            (addr1, addr2),
+            lambda measured: (measured - ref_value) / ref_value,
+            lambda measured: self.calibrate_vol_cur(addr1, addr2, gain_addr, ref_value, measured=measured),
+        )
+
+    def power_loop(self, gain_addr, ref_value=440.0):
+        """
+        Return the solve_gains() loop of a power gain.
+
+        Power scales with (1 + gain / 32768), so each correction composes with the gain in place.
+        """
+        def correct(measured):
+            gain = signed16(self.read_registers([gain_addr])[gain_addr])
+            new_gain = round(((1 + gain / 32768) * ref_value / measured - 1) * 32768)
+            new_gain = max(-0x8000, min(0x7FFF, new_gain))  # the register holds a signed 16-bit value
+            self.write_meter_data(gain_addr, self.dec2hex_64bit(new_gain))
+
+        return (
+            f"power gain {gain_addr:04X}",
+            power_pairs[gain_addr],
+            lambda measured: (measured - ref_value) / ref_value,
+            correct,
+        )
+
+    def phaseangle_loop(self, gain_addr, ref_angle=60.0):
+        """
+        Return the solve_gains() loop of a phase angle gain.
+
+        The error is the relative error of cos(angle), as in calibrate_phaseangle(),
+        added to the gain in place instead of replacing it. The angle register resolves
+        0.1 degree, so the loop's minimum tolerance is the cos error of one register step
+        (about 0.003 at 60 degrees).
+        """
+        ref_cos = math.cos(math.radians(ref_angle))
+        step = registers[phase_angle_registers[gain_addr]].scale
+        min_tolerance = abs(math.cos(math.radians(ref_angle + step)) - ref_cos) / abs(ref_cos)
+
+        def error(measured):
+            return (math.cos(math.radians(measured)) - ref_cos) / ref_cos
+
+        def correct(measured):
+            gain = signed16(self.read_registers([gain_addr])[gain_addr])
+            self.write_meter_data(gain_addr, self.dec2hex_64bit(gain + round(error(measured) * g_phase)))
+
+        return (f"phase angle gain {gain_addr:04X}", phase_angle_registers[gain_addr], error, correct, min_tolerance)
+
+    def solve_phases(self, quantity, ref_value, phases=("R", "Y", "B"), **solver):
+        """
+        Closed-loop calibration of a quantity on the three phases at once, see solve_gains().
+
+        :param quantity: "voltage", "current", "power" or "angle"
+        :param ref_value: Value applied by the source (V, A, W or degrees)
+        :param phases: Phases to calibrate among "R", "Y" and "B"
+        :return: List of solve_gains() results, one per phase
+        """
+        if quantity in ("voltage", "current"):
+            loops = [self.vol_cur_loop(addr1, addr2, gain_addr, ref_value)
+                     for addr1, addr2, gain_addr, key in vol_cur_steps if key == quantity]
+        elif quantity == "power":
+            loops = [self.power_loop(gain_addr, ref_value) for gain_addr in power_gains]
+        elif quantity == "angle":
+            loops = [self.phaseangle_loop(gain_addr, ref_value) for gain_addr in phase_angle_gains]
+        else:
+            raise ValueError(f"Unknown quantity: {quantity}")
+        loops = [loop for phase, loop in zip("RYB", loops) if phase in phases]
+        return self.solve_gains(loops, **solver)
 
     # def calibration(self):
     #     self.write_meter_data(0x0003, 0x0000)
@@ -0,0 +1,253 @@
+import argparse
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from array import array
+# Add the path to the dlt645 module
+sys.path.append(r'E:\Git\SongYang_PowerSupply_ControlScript\dlt645\dlt645')
+
+import dlt645
+from Meter_Cal_Control import MeterCalControl, register_key, registers
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Live registers polled by the monitor: channel name -> register or (msb, lsb) pair, from register_catalogue
+monitor_channels = {registers[addr].name: register_key(addr) for addr in (
+    0x00D9, 0x00DA, 0x00DB, 0x00DD, 0x00DE, 0x00DF,
+    0x00B0, 0x00B1, 0x00B2, 0x00B3,
+    0x00F9, 0x00FA, 0x00FB, 0x00F8,
+)}
+
+# 8E1 framing: start bit, 8 data bits, parity and stop bit per byte
+BITS_PER_BYTE = 11
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of (timestamp, value) samples backed by two preallocated arrays.
+
+    Once full, each new sample overwrites the oldest one, so memory stays constant
+    however long the monitor runs. Missing readings are stored as NaN.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.next = 0  # index written by the next append
+        self.count = 0
+
+    def append(self, timestamp, value):
+        self.times[self.next] = timestamp
+        self.values[self.next] = math.nan if value is None else value
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def window(self, last=None):
+        """
+        Return copies of the latest samples, oldest first.
+
+        :param last: Number of samples (default: every sample held)
+        :return: (times, values) arrays of type "d"
+        """
+        count = self.count if last is None else min(last, self.count)
+        start = (self.next - count) % self.capacity
+        if start + count <= self.capacity:
+            return self.times[start:start + count], self.values[start:start + count]
+        end = start + count - self.capacity
+        return (self.times[start:] + self.times[:end], self.values[start:] + self.values[:end])
+
+
+class Monitor:
+    """
+    Poll the live registers of a meter continuously into one RingBuffer per channel.
+
+    Every channel is read in one batch per cycle (see MeterCalControl.read_registers)
+    by a background thread; readers get the latest window with window() or are
+    called after each cycle through subscribe(). A cycle failing with an exception
+    (e.g. the port went away) is logged and counted, and the thread backs off before
+    polling again, so the monitor survives a meter or port being replugged.
+    """
+
+    def __init__(self, meter_control, channels=None, capacity=3000, interval=0.0, retry_delay=1.0,
+                 max_retry_delay=30.0):
+        """
+        :param meter_control: Connected MeterCalControl
+        :param channels: {name: register or (msb, lsb)} (default: monitor_channels)
+        :param capacity: Samples kept per channel
+        :param interval: Minimum time between the starts of two cycles, 0 to poll as fast as the line allows
+        :param retry_delay: Seconds to wait after a failed cycle, doubled on each consecutive failure
+        :param max_retry_delay: Upper bound of the wait after a failed cycle
+        """
+        self.meter_control = meter_control
+        self.channels = dict(channels or monitor_channels)
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.buffers = {name: RingBuffer(capacity) for name in self.channels}
+        # start time of the recent cycles, for the achieved rate
+        self.cycles = RingBuffer(256)
+        self.registers = list(self.channels.values())
+        self.register_count = sum(len(reg) if isinstance(reg, tuple) else 1 for reg in self.registers)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.total_cycles = 0
+        self.failed_reads = 0
+        self.poll_errors = 0
+        self.last_error = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="monitor", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        delay = self.retry_delay
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                self.poll()
+            except Exception as e:
+                with self.lock:
+                    self.poll_errors += 1
+                    self.last_error = e
+                logging.error(f"Monitor cycle failed, polling again in {delay:.1f} s: {e!r}")
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            delay = self.retry_delay
+            elapsed = time.perf_counter() - start
+            if self.interval > elapsed:
+                self.stop_event.wait(self.interval - elapsed)
+
+    def poll(self):
+        """Read every channel once and append the readings, timestamped with the middle of the cycle."""
+        start = time.time()
+        values = self.meter_control.read_registers(self.registers)
+        timestamp = (start + time.time()) / 2
+        with self.lock:
+            for name, reg in self.channels.items():
+                value = values[reg]
+                if value is None:
+                    self.failed_reads += 1
+                self.buffers[name].append(timestamp, value)
+            self.cycles.append(start, 1)
+            self.total_cycles += 1
+        for callback in list(self.subscribers):
+            callback(self, timestamp)
+
+    def subscribe(self, callback):
+        """
+        Call callback(monitor, timestamp) from the polling thread after each cycle.
+
+        :return: Function removing the subscription
+        """
+        self.subscribers.append(callback)
+        return lambda: self.subscribers.remove(callback)
+
+    def window(self, channels=None, last=None):
+        """
+        Return the latest samples of some channels.
+
+        :param channels: Channel names (default: every channel)
+        :param last: Number of samples per channel (default: every sample held)
+        :return: {name: (times, values)} arrays, oldest first
+        """
+        with self.lock:
+            return {name: self.buffers[name].window(last) for name in (channels or self.channels)}
+
+    def line_limit(self):
+        """Return the register reads per second the line allows, from the frame sizes and the baud rate."""
+        frame = dlt645.Frame(addr=self.meter_control.station_addr, control=self.meter_control.read_control)
+        frame.data = "%04X" % 0xD0D9
+        request = len(frame.dump())
+        reply = request + 2  # the reply carries the data identifier and the 16-bit value
+        return self.meter_control.ser.baudrate / BITS_PER_BYTE / (request + reply)
+
+    def rate(self):
+        """
+        Return the achieved polling rate over the recent cycles and the share of the line it uses.
+
+        :return: {"cycles_per_s", "registers_per_s", "line_limit", "utilization", "cycles", "failed_reads",
+            "poll_errors", "last_error"}
+        """
+        with self.lock:
+            times, _ = self.cycles.window()
+            total_cycles, failed_reads = self.total_cycles, self.failed_reads
+            poll_errors, last_error = self.poll_errors, self.last_error
+        cycles_per_s = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        registers_per_s = cycles_per_s * self.register_count
+        limit = self.line_limit()
+        return {
+            "cycles_per_s": cycles_per_s,
+            "registers_per_s": registers_per_s,
+            "line_limit": limit,
+            "utilization": registers_per_s / limit,
+            "cycles": total_cycles,
+            "failed_reads": failed_reads,
+            "poll_errors": poll_errors,
+            "last_error": None if last_error is None else repr(last_error),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch the live registers of a meter")
+    parser.add_argument("--port", help="Meter serial port, defaults to the first station of config.json")
+    parser.add_argument("--config", default="config.json", help="Configuration file, defaults to config.json")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds (default: until Ctrl-C)")
+    parser.add_argument("--report", type=float, default=5.0, help="Seconds between two reports, defaults to 5")
+    parser.add_argument("--simulate", action="store_true", help="Monitor a simulated meter")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as config_file:
+        config = json.load(config_file)
+    monitor_config = config.get("monitor", {})
+    station = config["stations"][0]
+
+    simulator = None
+    port = args.port or station["port"]
+    if args.simulate:
+        from Station_Simulator import Simulator
+
+        simulator = Simulator(meters=1, noise=config.get("simulator", {}).get("noise", 0.0)).start()
+        port = simulator.meter_ports[0]
+
+    meter_control = None
+    monitor = None
+    try:
+        meter_control = MeterCalControl(port=port, baudrate=station.get("baudrate", 115200))
+        channels = {name: monitor_channels[name] for name in monitor_config.get("channels", monitor_channels)}
+        monitor = Monitor(meter_control, channels, capacity=monitor_config.get("capacity", 3000),
+                          interval=monitor_config.get("interval", 0.0)).start()
+
+        deadline = None if args.duration is None else time.monotonic() + args.duration
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(args.report if deadline is None else max(0.0, min(args.report, deadline - time.monotonic())))
+            rate = monitor.rate()
+            latest = {name: values[-1] for name, (_, values) in monitor.window(last=1).items() if len(values)}
+            logging.info(f"{rate['cycles_per_s']:.1f} cycles/s, {rate['registers_per_s']:.0f} registers/s "
+                         f"({rate['utilization']:.0%} of the {rate['line_limit']:.0f}/s line limit), "
+                         f"{rate['failed_reads']} failed reads, {rate['poll_errors']} failed cycles")
+            logging.info(", ".join(f"{name} {value:.3f}" for name, value in latest.items()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if monitor is not None:
+            monitor.stop()
+        if meter_control is not None:
+            meter_control.ser.close()
+        if simulator is not None:
+            simulator.stop()
@@ -0,0 +1,217 @@
+import json
+import logging
+import serial
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from Power_Supply_Control import PowerSupply, SettleTimeoutError
+# Add the path to the dlt645 module
+sys.path.append(r'E:\Git\SongYang_PowerSupply_ControlScript\dlt645\dlt645')
+
+from Meter_Cal_Control import MeterCalControl, open_bus
+from Calibration_Control import print_snapshot, snapshot_registers, final_registers, wait_for_setpoint
+from Results_Store import ResultsStore
+from dlt645.cache import AddressCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(threadName)s - %(levelname)s - %(message)s")
+
+
+class Station:
+    """
+    One meter of the rack and the result record of its calibration run.
+
+    Meters sharing an RS-485 bus are given the dlt645.bus.Bus and their station address.
+    """
+
+    def __init__(self, port, baudrate=115200, store=None, bus=None, station_addr=None, addr_cache=None,
+                 fixture=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.store = store
+        self.bus = bus
+        self.addr_cache = addr_cache
+        self.fixture = fixture
+        self.recorder = None
+        self.meter = None
+        self.result = {
+            "port": port,
+            "station_addr": station_addr,
+            "status": "pending",
+            "error": None,
+            "steps": {},  # step name -> duration in seconds
+            "before": None,
+            "after": None,
+        }
+
+    def open(self):
+        self.meter = MeterCalControl(port=self.port, baudrate=self.baudrate, bus=self.bus,
+                                     station_addr=self.result["station_addr"], addr_cache=self.addr_cache,
+                                     fixture=self.fixture)
+        self.result["station_addr"] = self.meter.station_addr
+        if self.store is not None:
+            self.recorder = self.meter.recorder = self.store.begin_run(self.meter.station_addr, self.port)
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.finish(self.result["status"], self.result)
+            self.recorder = None
+        if self.meter is not None and self.bus is None:
+            self.meter.ser.close()
+
+
+def run_step(executor, stations, name, func):
+    """
+    Run func(station) on every station still in the run, concurrently.
+
+    A station whose step raises is marked failed and skipped by later steps.
+    """
+    active = [station for station in stations if station.result["status"] != "failed"]
+
+    def timed(station):
+        start = time.perf_counter()
+        try:
+            func(station)
+        except Exception as e:
+            logging.error(f"{station.port}: {name} failed: {e}")
+            station.result["status"] = "failed"
+            station.result["error"] = f"{name}: {e}"
+        finally:
+            elapsed = station.result["steps"][name] = time.perf_counter() - start
+            if station.recorder is not None:
+                station.recorder.step_done(name, elapsed)
+
+    list(executor.map(timed, active))
+
+
+def set_supply(power_supply, stations, settle_config, voltage, current, power_factor):
+    """
+    Change the shared source once for every station and wait for it to settle.
+
+    Calibrating against an unsettled source would write wrong gains, so if the
+    output does not settle every station still in the run is marked failed. Once
+    every station has failed, the source is left alone.
+    """
+    if all(station.result["status"] == "failed" for station in stations):
+        logging.warning(f"No station left in the run, setpoint {voltage}V {current}A PF {power_factor} skipped")
+        return
+    power_supply.set_voltage_and_current_Powerfactor(voltage=voltage, current=current, power_factor=power_factor)
+    if settle_config.get("mode") == "meter":
+        # every meter sees the same source, there is no single meter to poll
+        settle_config = dict(settle_config, mode="supply")
+    try:
+        wait_for_setpoint(power_supply, None, settle_config, voltage, current)
+    except SettleTimeoutError as e:
+        logging.error(f"Setpoint {voltage}V {current}A PF {power_factor}: {e}")
+        for station in stations:
+            if station.result["status"] != "failed":
+                station.result["status"] = "failed"
+                station.result["error"] = f"setpoint: {e}"
+
+
+def record_solver(station, results):
+    """Keep the solver results in the station record, fail the station if a gain did not converge."""
+    station.result.setdefault("solver", []).extend(results)
+    failed = [result["name"] for result in results if not result["converged"]]
+    if failed:
+        raise RuntimeError(f"not converged: {', '.join(failed)}")
+
+
+def calibrate_vol_cur(station, settings, solver_config):
+    station.meter.calibration()
+    for quantity in ("voltage", "current"):
+        record_solver(station, station.meter.solve_phases(quantity, settings[quantity], **solver_config))
+
+
+def calibrate_phase_angle(station, solver_config):
+    record_solver(station, station.meter.solve_phases("angle", 60.0, **solver_config))
+
+
+def calibrate_power(station, solver_config):
+    record_solver(station, station.meter.solve_phases("power", 220.0 * 2.0, **solver_config))
+
+
+def run_stations(power_supply, stations, settings, settle_config, solver_config=None):
+    """
+    Calibrate every station against the shared power supply, return the result records.
+
+    :raises ValueError: No station to calibrate (e.g. an empty bus scan)
+    """
+    if not stations:
+        raise ValueError("No station to calibrate, check the stations of config.json and the bus scans")
+    solver_config = solver_config or {}
+    with ThreadPoolExecutor(max_workers=len(stations), thread_name_prefix="station") as executor:
+        run_step(executor, stations, "open", Station.open)
+
+        set_supply(power_supply, stations, settle_config,
+                   settings["voltage"], settings["current"], settings["power_factor"])
+        run_step(executor, stations, "before", lambda s: s.result.update(
+            before=print_snapshot(s.meter, f"{s.port} BEFORE CALIBRATION DATA", snapshot_registers)))
+        run_step(executor, stations, "vol_cur", lambda s: calibrate_vol_cur(s, settings, solver_config))
+
+        set_supply(power_supply, stations, settle_config, 220.0, 2.0, "0.5L")
+        run_step(executor, stations, "phase_angle", lambda s: calibrate_phase_angle(s, solver_config))
+
+        set_supply(power_supply, stations, settle_config, 220.0, 2.0, 1)
+        run_step(executor, stations, "power", lambda s: calibrate_power(s, solver_config))
+        run_step(executor, stations, "after", lambda s: s.result.update(
+            after=print_snapshot(s.meter, f"{s.port} AFTER CALIBRATION DATA", snapshot_registers + final_registers)))
+
+    for station in stations:
+        if station.result["status"] != "failed":
+            station.result["status"] = "done"
+    return [station.result for station in stations]
+
+
+if __name__ == "__main__":
+    power_supply = None
+    store = None
+    stations = []
+    buses = []
+
+    try:
+        with open("config.json", "r") as config_file:
+            config = json.load(config_file)
+
+        serial_config = config["serial"]
+        settings = config["settings"]
+        store = ResultsStore(config.get("results", {}).get("path", "results.db"))
+        addr_cache = AddressCache(config["address_cache"]["path"]) if "address_cache" in config else None
+        for s in config["stations"]:
+            if s.get("bus"):
+                # several meters on one port, listed in "addresses" or discovered
+                bus = open_bus(s["port"], s.get("baudrate", 115200), s.get("addresses"), addr_cache=addr_cache)
+                buses.append(bus)
+                stations += [Station(s["port"], s.get("baudrate", 115200), store, bus, addr) for addr in bus.stations]
+            else:
+                stations.append(Station(s["port"], s.get("baudrate", 115200), store, addr_cache=addr_cache,
+                                        fixture=s.get("fixture")))
+
+        power_supply = PowerSupply(
+            port=serial_config["port"],
+            baudrate=serial_config.get("baudrate", 9600),
+            timeout=serial_config.get("timeout", 1)
+        )
+
+        start = time.perf_counter()
+        results = run_stations(power_supply, stations, settings, config.get("settle", {}), config.get("solver", {}))
+        elapsed = time.perf_counter() - start
+
+        done = sum(1 for result in results if result["status"] == "done")
+        print(json.dumps(results, indent=4))
+        logging.info(f"{done}/{len(results)} meters calibrated in {elapsed:.1f} s "
+                     f"({done * 3600 / elapsed:.0f} meters/hour)")
+
+    except serial.SerialException as e:
+        logging.error(f"Serial communication error: {e}")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+    finally:
+        for station in stations:
+            station.close()
+        for bus in buses:
+            bus.flo.close()
+        if store is not None:
+            store.close()
+        if power_supply is not None:
+            power_supply.close()
@@ -1,29 +1,141 @@
 import logging
+import math
 import serial
+import time
+from functools import lru_cache
 #import json
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Define a lookup table for frames based on voltage, current, and power factor
-lookup_table = {
-    (0, 0, 0): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 00 00 00 00 00 00 05 f5 e1 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 2e e0 5d c0 00 00 99 57",
+# Fixed parts of the setpoint frame: wake-up preamble, write-registers header
+# (station B1, function 10, start register 0002, 16 registers, 32 data bytes)
+# and the trailing range registers that are never changed by the scripts.
+FRAME_PREAMBLE = bytes.fromhex("f9 f9 f9 f9 f9")
+FRAME_HEADER = bytes.fromhex("b1 10 00 02 00 10 20")
+FRAME_TRAILER = bytes.fromhex("2e e0 5d c0 00 00")
+FRAME_CACHE_SIZE = 256
 
-    (220, 2, 1): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 00 00 00 00 00 00 2e e0 5d c0 00 00 05 66 ",
+# Read back the 56 output registers of the supply (station 37, function 03)
+READBACK_REQUEST = bytes.fromhex("37 03 00 00 00 38 41 8E")
+
+# Power factor shorthands used by the calibration scripts (L = lagging, C = leading)
+power_factor_angles = {
+    1: 0.0,
+    "0.5L": 60.0,
+    "0.5C": 300.0,
+    "0.8L": 36.87,
+    "0.8C": 323.13,
+}
+
+# Frames captured from the vendor software, reference vectors for encode_frame() (see tests)
+golden_frames = {
+    (220, 2, 1): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 00 00 00 00 00 00 2e e0 5d c0 00 00 05 66",
     (220, 2, "0.5L"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 17 70 17 70 17 70 2e e0 5d c0 00 00 7f 33",
     (220, 2, "0.5C"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 75 30 75 30 75 30 2e e0 5d c0 00 00 06 37",
-    (220, 2, "0.8C"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 7e 39 7e 39 7e 39 2e e0 5d c0 00 00 0e 76 ",
-    (220, 2, "0.8L"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 0e 67 0e 67 0e 67 2e e0 5d c0 00 00 70 49 ",
+    (220, 2, "0.8C"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 7e 39 7e 39 7e 39 2e e0 5d c0 00 00 0e 76",
+    (220, 2, "0.8L"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 4e 20 00 00 4e 20 00 00 4e 20 0e 67 0e 67 0e 67 2e e0 5d c0 00 00 70 49",
 
     (220, 3, 1): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 75 30 00 00 75 30 00 00 75 30 00 00 00 00 00 00 2e e0 5d c0 00 00 aa d4",
     (220, 3, "0.8L"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 75 30 00 00 75 30 00 00 75 30 0e 67 0e 67 0e 67 2e e0 5d c0 00 00 df fb",
     (220, 3, "0.8C"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 75 30 00 00 75 30 00 00 75 30 7e 39 7e 39 7e 39 2e e0 5d c0 00 00 a1 c4",
     (220, 3, "0.5L"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 75 30 00 00 75 30 00 00 75 30 17 70 17 70 17 70 2e e0 5d c0 00 00 d0 81",
-    (220, 2, "0.5C"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 75 30 00 00 75 30 00 00 75 30 75 30 75 30 75 30 2e e0 5d c0 00 00 a9 85",
+    (220, 3, "0.5C"): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 55 f0 55 f0 55 f0 00 00 75 30 00 00 75 30 00 00 75 30 75 30 75 30 75 30 2e e0 5d c0 00 00 a9 85",
 
     (200, 2, 1): "f9 f9 f9 f9 f9 b1 10 00 02 00 10 20 13 88 4e 20 4e 20 4e 20 00 00 4e 20 00 00 4e 20 00 00 4e 20 00 00 00 00 00 00 2e e0 5d c0 00 00 2f 9f",
 }
 
+
+class SettleTimeoutError(RuntimeError):
+    """Raised when the output does not settle at its setpoint within the timeout."""
+
+
+def crc16_modbus(data):
+    """
+    Calculate the CRC-16/MODBUS checksum used by the power supply.
+
+    :param data: Byte-like object to checksum
+    :return: CRC as an integer (sent little-endian on the wire)
+    """
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+def power_factor_to_angle(power_factor):
+    """
+    Convert a power factor to the phase angle in degrees expected by the power supply.
+
+    :param power_factor: 1, a shorthand such as "0.5L"/"0.8C", or a float (treated as lagging)
+    :return: Phase angle in degrees (0 <= angle < 360)
+    """
+    if power_factor in power_factor_angles:
+        return power_factor_angles[power_factor]
+
+    text = str(power_factor).strip().upper()
+    leading = text.endswith("C")
+    value = float(text.rstrip("LC"))
+    if not 0 <= value <= 1:
+        raise ValueError(f"Power factor {power_factor} out of range.")
+
+    angle = math.degrees(math.acos(value))
+    if leading and angle:
+        angle = 360.0 - angle
+    return angle
+
+
+@lru_cache(maxsize=FRAME_CACHE_SIZE)
+def encode_frame(voltage, current, power_factor, frequency=50.0):
+    """
+    Build the frame setting the same voltage, current and power factor on all three phases.
+
+    Encoded frames are kept in an LRU cache, so repeated setpoints cost a dictionary lookup.
+
+    :param voltage: Phase voltage in V (0.01 V resolution)
+    :param current: Phase current in A (0.0001 A resolution)
+    :param power_factor: Power factor, see power_factor_to_angle()
+    :param frequency: Output frequency in Hz (0.01 Hz resolution)
+    :return: Complete frame as bytes, including preamble and CRC
+    """
+    scaled_voltage = round(voltage * 100)
+    scaled_current = round(current * 10000)
+    scaled_angle = round(power_factor_to_angle(power_factor) * 100)
+    scaled_frequency = round(frequency * 100)
+
+    if not 0 <= scaled_voltage <= 0xFFFF:
+        raise ValueError(f"Voltage {voltage}V out of range.")
+    if not 0 <= scaled_current <= 0xFFFFFFFF:
+        raise ValueError(f"Current {current}A out of range.")
+    if not 0 <= scaled_frequency <= 0xFFFF:
+        raise ValueError(f"Frequency {frequency}Hz out of range.")
+
+    body = (
+        FRAME_HEADER
+        + scaled_frequency.to_bytes(2, "big")
+        + 3 * scaled_voltage.to_bytes(2, "big")
+        + 3 * scaled_current.to_bytes(4, "big")
+        + 3 * (scaled_angle % 36000).to_bytes(2, "big")
+        + FRAME_TRAILER
+    )
+    return FRAME_PREAMBLE + body + crc16_modbus(body).to_bytes(2, "little")
+
+
+def precompute_frames(setpoints):
+    """
+    Encode a list of (voltage, current, power_factor) setpoints ahead of a sweep.
+
+    :param setpoints: Iterable of (voltage, current, power_factor) tuples
+    """
+    for voltage, current, power_factor in setpoints:
+        encode_frame(voltage, current, power_factor)
+
+
 class PowerSupply:
     def __init__(self, port, baudrate=9600, timeout=1):
         """
@@ -40,6 +152,10 @@ class PowerSupply:
             logging.error(f"Failed to open serial port: {e}")
             raise
 
+        self.settle_times = []  # Measured settle time of every wait_until_settled() call
+        self.setpoint_time = None  # time.monotonic() of the last setpoint frame, for the settle min_time
+        self.rx_buffer = bytearray()  # Bytes received after the last complete response
+
     def send_frame(self, frame):
         """
         Send a binary frame to the power supply.
@@ -55,68 +171,77 @@ class PowerSupply:
             logging.error(f"Error sending frame: {e}")
             raise
 
-    def calculate_hex_values(self, value):
+    def set_voltage_and_current_Powerfactor(self, voltage, current, power_factor):
         """
-        Calculate the hex representation of a value based on its scaling factor.
-        
-        :param value: The actual value (e.g., voltage or current).
-        :return: Hexadecimal string of the scaled value.
-        """
-        # Ensure the value is within the acceptable range
-        if value < 0:
-            raise ValueError("Value cannot be negative.")
-
-        # Choose the scaling factor
-        if value < 10:
-            scale = 10000  # Scale for very small values (1 digit)
-        elif value < 1000:
-            scale = 100   # Scale for values between 10 and 99 (2 digits)
-        elif value < 100:
-            scale = 10    # Scale for values between 100 and 999 (3 digits)
-        else:
-            raise ValueError("Value is too large for this scaling logic.")
+        Send a frame to set voltage, current, and power factor on the power supply.
+        The frame is built by encode_frame() and cached for repeated setpoints.
+        """
+        try:
+            frame = encode_frame(voltage, current, power_factor)
+        except ValueError as e:
+            logging.error(f"Cannot encode {voltage}V, {current}A, {power_factor} power factor: {e}")
+            raise
 
-        # Scale the value and return as a 4-digit hex
-        scaled_value = int(value * scale)
-        
-        # Ensure the hex string is always 4 digits long, even if the value is small
-        return f"{scaled_value:04X}"  # Format as 4-digit hex
+        logging.info(f"Sending frame to set voltage: {voltage}V, current: {current}A, and power factor: {power_factor}")
+        self.send_frame(frame)
+        self.setpoint_time = time.monotonic()
 
-    def get_power_factor_hex(self, power_factor):
+    def read_output(self):
         """
-        Map the power factor to its corresponding hex value.
+        Read back the output of the power supply.
 
-        :param power_factor: The power factor value (e.g., 1, 0.5L, 0.5C, etc.)
-        :return: The hex string corresponding to the power factor.
+        :return: (V_R, V_Y, V_B, I_R, I_Y, I_B) or None if no response.
         """
-        power_factor_map = {
-            1: "00 00",
-            "0.5L": "17 70",  # 60
-            "0.5C": "75 30",  # 30
-            "0.8C": "7E 39",  # 32.3
-            "0.8L": "0E 67"   # 36.8
-        }
-        
-        return power_factor_map.get(power_factor, "00 00")  # Default to "00 00" if power factor is not found
+        response = self.get_frame_response()
+        if response is None:
+            return None
+        return self.extract_voltage_and_current(response)
 
-    def set_voltage_and_current_Powerfactor(self, voltage, current, power_factor):
+    def wait_until_settled(self, target, tolerance=0.01, timeout=15.0, interval=0.25, samples=3, read_values=None,
+                           min_time=0.0, abs_tolerance=0.01):
         """
-        Send a frame to set voltage, current, and power factor on the power supply,
-        using a lookup table for predefined frames.
+        Poll the output until all three phases are within tolerance of the target.
+
+        :param target: (voltage, current) setpoint
+        :param tolerance: Allowed relative error (0.01 = 1 %)
+        :param abs_tolerance: Allowed error in V or A whatever the target, so a 0 V or 0 A target
+            does not need an exact 0 reading
+        :param timeout: Maximum time to wait in seconds
+        :param interval: Time between two polls in seconds
+        :param samples: Number of consecutive in-tolerance polls required
+        :param read_values: Callable returning (V_R, V_Y, V_B, I_R, I_Y, I_B), defaults to read_output()
+        :param min_time: Minimum time between the last setpoint frame and the first poll, for changes the
+            readback does not show (power factor); time already spent since the setpoint counts
+            towards it
+        :return: Settle time in seconds
+        :raises SettleTimeoutError: The output was not within tolerance when the timeout was reached
         """
-        # Create the lookup key tuple
-        key = (voltage, current, power_factor)
+        if read_values is None:
+            read_values = self.read_output
+        voltage, current = target
+        expected = (voltage,) * 3 + (current,) * 3
 
-        # Check if the combination exists in the lookup table
-        if key in lookup_table:
-            # Fetch the corresponding frame from the lookup table
-            frame = bytes.fromhex(lookup_table[key])
-            logging.info(f"Sending frame to set voltage: {voltage}V, current: {current}A, and power factor: {power_factor}")
-            print(f"Frame to set voltage {voltage}V, current {current}A, and power factor {power_factor}: {frame.hex().upper()}")
-            self.send_frame(frame)
-        else:
-            logging.error(f"Configuration for voltage {voltage}V, current {current}A, and power factor {power_factor} not found in the lookup table.")
-            raise ValueError(f"Configuration not found for {voltage}V, {current}A, {power_factor} power factor")
+        start = time.monotonic()
+        in_tolerance = 0
+        changed_at = start if self.setpoint_time is None else self.setpoint_time
+        time.sleep(max(0.0, changed_at + min_time - start))
+        while True:
+            values = read_values()
+            elapsed = time.monotonic() - start
+            if values is not None and all(abs(value - ref) <= max(tolerance * abs(ref), abs_tolerance)
+                                          for value, ref in zip(values, expected)):
+                in_tolerance += 1
+                if in_tolerance >= samples:
+                    self.settle_times.append(elapsed)
+                    logging.info(f"Output settled at {voltage}V, {current}A in {elapsed:.2f} s")
+                    return elapsed
+            else:
+                in_tolerance = 0
+
+            if elapsed >= timeout:
+                raise SettleTimeoutError(f"Output did not settle at {voltage}V, {current}A within {timeout} s "
+                                         f"(last readback: {values})")
+            time.sleep(interval)
 
     def reset_power_supply(self):
         """
@@ -134,12 +259,11 @@ class PowerSupply:
 
         :return: The response from the power supply or None if no response.
         """
-        request_frame = bytes.fromhex("37 03 00 00 00 38 41 8E")
-        self.send_frame(request_frame)
+        self.send_frame(READBACK_REQUEST)
 
         # Wait for a response
         try:
-            response = self.connection.read(1024)  # Read up to 128 bytes (adjust as needed)
+            response = self.read_response()
             if response:
                 logging.info(f"Received response: {response.hex().upper()}")
                 return response
@@ -153,6 +277,52 @@ class PowerSupply:
             logging.error(f"Error receiving response: {e}")
             return None
 
+    def read_response(self, header=None):
+        """
+        Read one framed response: header, byte count, data and CRC.
+
+        Only the bytes still missing are requested from the port, so the call
+        returns as soon as the frame is complete instead of waiting for the
+        serial timeout. Bytes received after the frame stay buffered for the
+        next call, and frames with a bad CRC are skipped.
+
+        :param header: Station and function code bytes (default: readback reply header)
+        :return: The complete response frame as bytes, or None on timeout.
+        """
+        if header is None:
+            header = READBACK_REQUEST[:2]
+        buffer = self.rx_buffer
+
+        while True:
+            start = buffer.find(header)
+            if start < 0:
+                # keep a possible partial header at the end of the buffer
+                del buffer[:max(0, len(buffer) - len(header) + 1)]
+            elif start:
+                del buffer[:start]
+                start = 0
+
+            if start == 0 and len(buffer) > len(header):
+                size = len(header) + 1 + buffer[len(header)] + 2
+                if len(buffer) >= size:
+                    frame = bytes(buffer[:size])
+                    if crc16_modbus(frame[:-2]).to_bytes(2, "little") == frame[-2:]:
+                        del buffer[:size]
+                        return frame
+                    logging.warning(f"CRC error in response: {frame.hex().upper()}")
+                    del buffer[:1]
+                    continue
+                missing = size - len(buffer)
+            elif start == 0:
+                missing = len(header) + 1 - len(buffer)
+            else:
+                missing = len(header) + 1
+
+            data = self.connection.read(max(missing, self.connection.in_waiting))
+            if not data:
+                return None
+            buffer += data
+
     def close(self):
         """
         Close the connection to the power supply.
@@ -233,3 +403,4 @@ class PowerSupply:
         #logging.info(f"Power Factor (Hex): {power_factor_hex}, Extracted Power Factor: {power_factor_value} -> {power_factor}")
         
         return voltage, voltage_Y, voltage_B, current, current_Y, current_B
+
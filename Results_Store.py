@@ -0,0 +1,240 @@
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    station_addr TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    status TEXT,
+    recipe TEXT,
+    port TEXT,
+    report TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_station ON runs (station_addr, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+
+CREATE TABLE IF NOT EXISTS reads (
+    run_id INTEGER NOT NULL,
+    station_addr TEXT NOT NULL,
+    ts REAL NOT NULL,
+    reg INTEGER NOT NULL,
+    raw INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reads_station ON reads (station_addr, ts);
+
+CREATE TABLE IF NOT EXISTS writes (
+    run_id INTEGER NOT NULL,
+    station_addr TEXT NOT NULL,
+    ts REAL NOT NULL,
+    reg INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    accepted INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS writes_station ON writes (station_addr, reg, ts);
+
+CREATE TABLE IF NOT EXISTS timings (
+    run_id INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timings_run ON timings (run_id);
+"""
+
+
+class RunRecorder:
+    """
+    Record the register reads, register writes and step timings of one calibration run.
+
+    Set it as MeterCalControl.recorder. The run is stored with the status "running" when
+    it begins, register writes are appended as they happen and reads in batches of
+    batch_size rows or at the end of each step, so a crashed run keeps what it did;
+    finish() sets its status and report.
+    """
+
+    def __init__(self, store, run_id, station_addr, batch_size=64):
+        self.store = store
+        self.run_id = run_id
+        self.station_addr = station_addr
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.reads = []  # pending (station_addr, ts, register, raw)
+        self.read_count = 0
+        self.write_count = 0
+
+    def register_read(self, station_addr, addr, raw):
+        with self.lock:
+            self.reads.append((station_addr, time.time(), addr, raw))
+            self.read_count += 1
+            full = len(self.reads) >= self.batch_size
+        if full:
+            self.flush()
+
+    def register_written(self, station_addr, addr, value, accepted=True):
+        with self.lock:
+            self.write_count += 1
+        self.store.append_rows(self.run_id, writes=[(station_addr, time.time(), addr, value, int(accepted))])
+
+    def step_done(self, name, seconds):
+        """Record the duration of a step and store the reads made so far."""
+        self.flush()
+        self.store.append_rows(self.run_id, timings=[(name, seconds)])
+
+    def time_step(self, name, func):
+        """Run a step and record its duration, usable as run_recipe(step_hook=...)."""
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            self.step_done(name, time.perf_counter() - start)
+
+    def flush(self):
+        """Append the pending reads to the store."""
+        with self.lock:
+            reads, self.reads = self.reads, []
+        if reads:
+            self.store.append_rows(self.run_id, reads=reads)
+
+    def finish(self, status, report=None):
+        """Store the remaining reads, the status and report of the run, return its id."""
+        self.flush()
+        self.store.finish_run(self.run_id, status, report)
+        logging.info(f"Run {self.run_id} of {self.station_addr} stored: {self.read_count} reads, "
+                     f"{self.write_count} writes")
+        return self.run_id
+
+
+class ResultsStore:
+    """
+    Append-only calibration history in an SQLite database (WAL mode).
+
+    Runs, register reads, register writes and step timings are indexed by station
+    address and time, so the gains of one meter or the runs of a time range are
+    read without scanning the whole history. One store can be shared by threads.
+    """
+
+    def __init__(self, path="results.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def begin_run(self, station_addr, port=None, recipe=None):
+        """Store a new run with the status "running", return its RunRecorder."""
+        started = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (station_addr, started, finished, status, recipe, port) VALUES (?, ?, ?, ?, ?, ?)",
+                (station_addr, started, started, "running", recipe, port),
+            )
+        return RunRecorder(self, cursor.lastrowid, station_addr)
+
+    def append_rows(self, run_id, reads=(), writes=(), timings=()):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO reads (run_id, station_addr, ts, reg, raw) VALUES (?, ?, ?, ?, ?)",
+                [(run_id,) + row for row in reads],
+            )
+            self.connection.executemany(
+                "INSERT INTO writes (run_id, station_addr, ts, reg, value, accepted) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id,) + row for row in writes],
+            )
+            self.connection.executemany(
+                "INSERT INTO timings (run_id, step, seconds) VALUES (?, ?, ?)",
+                [(run_id,) + row for row in timings],
+            )
+
+    def finish_run(self, run_id, status, report=None):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE runs SET finished = ?, status = ?, report = ? WHERE id = ?",
+                (time.time(), status, None if report is None else json.dumps(report, separators=(",", ":"), default=str),
+                 run_id),
+            )
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def latest_gains(self, station_addr):
+        """Return {register: (value, time written)} of the last accepted write of each register of a meter."""
+        rows = self.query(
+            "SELECT reg, value, MAX(ts) FROM writes WHERE station_addr = ? AND accepted = 1 GROUP BY reg",
+            (station_addr,),
+        )
+        return {reg: (value, ts) for reg, value, ts in rows}
+
+    def runs(self, station_addr=None, since=None, until=None):
+        """Return the runs of a meter and/or a time range (epoch seconds), oldest first."""
+        sql = "SELECT id, station_addr, started, finished, status, recipe, port FROM runs WHERE started >= ? AND started < ?"
+        params = [since or 0.0, until or float("inf")]
+        if station_addr is not None:
+            sql += " AND station_addr = ?"
+            params.append(station_addr)
+        columns = ("id", "station_addr", "started", "finished", "status", "recipe", "port")
+        return [dict(zip(columns, row)) for row in self.query(sql + " ORDER BY started", params)]
+
+    def reads(self, station_addr, since=None, until=None, addr=None):
+        """Return (time, register, raw value) of the reads of a meter in a time range."""
+        sql = "SELECT ts, reg, raw FROM reads WHERE station_addr = ? AND ts >= ? AND ts < ?"
+        params = [station_addr, since or 0.0, until or float("inf")]
+        if addr is not None:
+            sql += " AND reg = ?"
+            params.append(addr)
+        return self.query(sql + " ORDER BY ts", params)
+
+    def timings(self, run_id):
+        """Return {step: seconds} of a run."""
+        return dict(self.query("SELECT step, seconds FROM timings WHERE run_id = ?", (run_id,)))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def parse_time(value):
+    """Parse an ISO date/time from the command line into epoch seconds."""
+    return None if value is None else datetime.fromisoformat(value).timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the calibration results store")
+    parser.add_argument("--db", default="results.db", help="Database file, defaults to results.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    gains = commands.add_parser("gains", help="Last gains written to a meter")
+    gains.add_argument("station_addr")
+    runs = commands.add_parser("runs", help="Runs of a meter and/or a time range")
+    runs.add_argument("--addr", dest="station_addr")
+    reads = commands.add_parser("reads", help="Register reads of a meter")
+    reads.add_argument("station_addr")
+    reads.add_argument("--register", type=lambda value: int(value, 0), help="Only this register, e.g. 0x61")
+    for command in (runs, reads):
+        command.add_argument("--since", help="ISO date/time, e.g. 2024-05-01")
+        command.add_argument("--until", help="ISO date/time")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    try:
+        if args.command == "gains":
+            for reg, (value, ts) in sorted(store.latest_gains(args.station_addr).items()):
+                print(f"{reg:04X}: {value:04X}  ({datetime.fromtimestamp(ts).isoformat(timespec='seconds')})")
+        elif args.command == "runs":
+            for run in store.runs(args.station_addr, parse_time(args.since), parse_time(args.until)):
+                print(json.dumps(run))
+        else:
+            for ts, reg, raw in store.reads(args.station_addr, parse_time(args.since), parse_time(args.until),
+                                            args.register):
+                print(f"{datetime.fromtimestamp(ts).isoformat(timespec='milliseconds')} {reg:04X}: {raw:04X}")
+    finally:
+        store.close()
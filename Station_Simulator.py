@@ -0,0 +1,415 @@
+import functools
+import json
+import logging
+import math
+import operator
+import os
+import random
+import select
+import sys
+import threading
+import time
+# Add the path to the dlt645 module
+sys.path.append(r'E:\Git\SongYang_PowerSupply_ControlScript\dlt645\dlt645')
+
+import dlt645
+from dlt645.constants import *
+from dlt645.bus import addr_matches
+from Power_Supply_Control import FRAME_PREAMBLE, FRAME_HEADER, READBACK_REQUEST, crc16_modbus
+from Meter_Cal_Control import register_id, registers
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SETPOINT_FRAME_SIZE = 46
+# Data bytes of a DL/T645-2007 reply frame: data identifier, data and follow-up frame number
+BLOCK_FRAME_SIZE = 200
+
+# gain register -> (quantity, phase index) for the V/I gains
+vol_cur_gains = {
+    0x0061: ("voltage", 0), 0x0065: ("voltage", 1), 0x0069: ("voltage", 2),
+    0x0062: ("current", 0), 0x0066: ("current", 1), 0x006A: ("current", 2),
+}
+power_gains = {0x0047: 0, 0x0049: 1, 0x004B: 2}
+phase_angle_gains = {0x0048: 0, 0x004A: 1, 0x004C: 2}
+# checksum register -> configuration registers it covers
+checksum_blocks = {
+    0x003B: range(0x0030, 0x003B),
+    0x004D: range(0x0040, 0x004D),
+    0x0057: range(0x0050, 0x0057),
+    0x006F: range(0x0060, 0x006F),
+}
+# measurement pair MSB register -> (quantity, phase index)
+measurement_pairs = {
+    0x00D9: ("voltage", 0), 0x00DA: ("voltage", 1), 0x00DB: ("voltage", 2),
+    0x00DD: ("current", 0), 0x00DE: ("current", 1), 0x00DF: ("current", 2),
+    0x00B1: ("power", 0), 0x00B2: ("power", 1), 0x00B3: ("power", 2),
+}
+# data identifier -> register, and LSB register -> MSB register of measurement pairs
+register_ids = {register_id(addr): addr for addr in range(0x0100)}
+lsb_pairs = {info.lsb: msb for msb, info in registers.items() if info.lsb}
+# phase angle change (rad) per unit of phase angle gain, matches calibrate_phaseangle()
+PHASE_GAIN_SLOPE = 1 / (2 * math.sin(math.pi / 3) * 3763.739)
+
+
+def signed16(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+class SupplyModel:
+    """
+    Model of the programmable source: setpoint frames in, readback frames out.
+
+    The output moves linearly from the previous setpoint to the new one over
+    settle_time seconds, with optional relative noise on the readback.
+    """
+
+    def __init__(self, settle_time=2.0, noise=0.0):
+        self.settle_time = settle_time
+        self.noise = noise
+        self.start = (0.0, 0.0, 0.0)  # (voltage, current, angle) before the last change
+        self.target = (0.0, 0.0, 0.0)
+        self.changed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def output(self):
+        """Return the (voltage, current, angle in degrees) applied to every phase now."""
+        with self.lock:
+            if self.settle_time <= 0:
+                return self.target
+            progress = min(1.0, (time.monotonic() - self.changed_at) / self.settle_time)
+            return tuple(s + (t - s) * progress for s, t in zip(self.start, self.target))
+
+    def set_target(self, voltage, current, angle):
+        start = self.output()
+        with self.lock:
+            self.start = start
+            self.target = (voltage, current, angle)
+            self.changed_at = time.monotonic()
+
+    def handle(self, buffer):
+        """
+        Consume complete requests from the buffer, return the reply bytes (may be empty).
+        """
+        reply = b""
+        while True:
+            setpoint = buffer.find(FRAME_PREAMBLE + FRAME_HEADER[:2])
+            readback = buffer.find(READBACK_REQUEST)
+            if readback >= 0 and (setpoint < 0 or readback < setpoint):
+                del buffer[:readback + len(READBACK_REQUEST)]
+                reply += self.readback_frame()
+            elif setpoint >= 0 and len(buffer) - setpoint >= SETPOINT_FRAME_SIZE:
+                frame = bytes(buffer[setpoint:setpoint + SETPOINT_FRAME_SIZE])
+                del buffer[:setpoint + SETPOINT_FRAME_SIZE]
+                self.load_setpoint(frame)
+            else:
+                return reply
+
+    def load_setpoint(self, frame):
+        body = frame[len(FRAME_PREAMBLE):-2]
+        if crc16_modbus(body).to_bytes(2, "little") != frame[-2:]:
+            logging.warning(f"Simulated supply: CRC error in {frame.hex().upper()}")
+            return
+        voltage = int.from_bytes(frame[14:16], "big") / 100
+        current = int.from_bytes(frame[20:24], "big") / 10000
+        angle = int.from_bytes(frame[32:34], "big") / 100
+        logging.info(f"Simulated supply: {voltage}V {current}A {angle} deg")
+        self.set_target(voltage, current, angle)
+
+    def readback_frame(self):
+        """Build the readback reply in the layout decoded by extract_voltage_and_current()."""
+        voltage, current, angle = self.output()
+        data = bytearray(112)
+        for i, offset in enumerate((14, 18, 22)):
+            value = voltage * (1 + random.gauss(0, self.noise)) - (3.2 if i == 2 else 0)
+            data[offset - 3:offset] = int(max(0, value) * 10000).to_bytes(3, "big")
+        for offset in (26, 30, 34):
+            value = current * (1 + random.gauss(0, self.noise)) * 2
+            data[offset - 3:offset] = int(max(0, value) * 1000000).to_bytes(3, "big")
+        frame = READBACK_REQUEST[:2] + bytes([len(data)]) + bytes(data)
+        return frame + crc16_modbus(frame).to_bytes(2, "little")
+
+
+class MeterModel:
+    """
+    Model of the metering chip behind a DL/T645-1997 port.
+
+    Each meter gets random per-phase errors, so calibration has something to
+    correct. Measurements follow the gain registers the way MeterCalControl
+    expects: V/I scale with gain / 0x8000, power with (1 + gain / 32768) and
+    the phase angle shifts with the phase angle gain. DL/T645-2007 reads of the
+    data identifiers in blocks are answered in follow-up frames.
+    """
+
+    def __init__(self, station_addr, supply, noise=0.0, error=0.05, seed=None):
+        rng = random.Random(seed)
+        self.station_addr = station_addr
+        self.supply = supply
+        self.noise = noise
+        self.registers = {}
+        self.latched = {}  # MSB register -> value of the last MSB read
+        self.blocks = {}  # DL/T645-2007 data identifier -> data block, served in follow-up frames
+        self.errors = {
+            "voltage": [1 + rng.uniform(-error, error) for _ in range(3)],
+            "current": [1 + rng.uniform(-error, error) for _ in range(3)],
+            "power": [1 + rng.uniform(-error, error) for _ in range(3)],
+            "angle": [rng.uniform(-1.0, 1.0) for _ in range(3)],
+        }
+
+    def gain(self, addr, default=0x8000):
+        return self.registers.get(addr, default)
+
+    def measure(self, quantity, phase):
+        """Return the value the chip reports for a quantity on a phase."""
+        voltage, current, angle = self.supply.output()
+        if quantity == "angle":
+            gain = signed16(self.gain(phase_angle_gains_by_phase[phase], 0))
+            return angle + self.errors["angle"][phase] + math.degrees(gain * PHASE_GAIN_SLOPE)
+
+        noise = 1 + random.gauss(0, self.noise)
+        if quantity == "power":
+            gain = signed16(self.gain(power_gains_by_phase[phase], 0))
+            measured_angle = self.measure("angle", phase)
+            power = voltage * current * math.cos(math.radians(measured_angle))
+            return power * self.errors["power"][phase] * (1 + gain / 32768) * noise
+
+        value = voltage if quantity == "voltage" else current
+        gain_addr = vol_cur_gain_by_quantity[quantity][phase]
+        return value * self.errors[quantity][phase] * self.gain(gain_addr) / 0x8000 * noise
+
+    def read(self, addr):
+        """Return the raw 16-bit content of a register."""
+        if addr in measurement_pairs:
+            value = self.measure(*measurement_pairs[addr])
+            # the LSB register read next belongs to the same measurement
+            self.latched[addr] = value
+            msb = registers[addr].scale
+            return int(max(0, value) / msb) & 0xFFFF
+        if addr in lsb_pairs and lsb_pairs[addr] in measurement_pairs:
+            msb_addr = lsb_pairs[addr]
+            value = self.latched.pop(msb_addr, None)
+            if value is None:
+                value = self.measure(*measurement_pairs[msb_addr])
+            value = max(0, value)
+            msb = registers[msb_addr].scale
+            fraction = value / msb - int(value / msb)
+            return min(255, int(fraction * 256)) << 8
+        if addr in (0x00F9, 0x00FA, 0x00FB):
+            return int(round(self.measure("angle", addr - 0x00F9) * 10)) % 3600
+        if addr == 0x00F8:
+            return 5000
+        if addr in checksum_blocks:
+            return sum(self.registers.get(reg, 0) for reg in checksum_blocks[addr]) & 0xFFFF
+        return self.registers.get(addr, 0)
+
+    def write(self, addr, value):
+        self.registers[addr] = value & 0xFFFF
+
+    def handle(self, frame):
+        """Return the reply frame to a request frame, or None if not addressed to this meter."""
+        function = frame.control["function"]
+        # AA bytes of the address are wildcards (broadcast and shortened addresses)
+        if not addr_matches(frame.addr, self.station_addr):
+            return None
+        if function == FUNCTION_CODES[DLT645_2007]["READ_ADDR"]:
+            reply = dlt645.Frame(self.station_addr, control=reply_control(function))
+            return reply
+        if function in (FUNCTION_CODES[DLT645_2007]["READ_DATA"], FUNCTION_CODES[DLT645_2007]["READ_FOLLOW_DATA"]):
+            return self.block_reply(frame)
+
+        addr = register_ids.get(frame.u16(0)) if frame.length >= 2 else None
+        reply = dlt645.Frame(self.station_addr, control=reply_control(function))
+        if addr is None:
+            reply.control["response"] = RESPONSE_INCORRECT
+            reply.data = "01"
+        elif function == FUNCTION_CODES[DLT645_1997]["READ_DATA"]:
+            reply.data = "%04X%04X" % (self.read(addr), frame.u16(0))
+        elif function == FUNCTION_CODES[DLT645_1997]["WRITE_DATA"]:
+            self.write(addr, frame.u16(frame.length - 2))
+        else:
+            reply.control["response"] = RESPONSE_INCORRECT
+            reply.data = "01"
+        return reply
+
+    def block_reply(self, frame):
+        """Return the frame of a data block asked by a DL/T645-2007 read or follow-up read."""
+        function = frame.control["function"]
+        payload = frame.payload_bytes
+        data_id = int.from_bytes(payload[:4], "little")
+        seq = payload[4] if function == FUNCTION_CODES[DLT645_2007]["READ_FOLLOW_DATA"] and len(payload) > 4 else 0
+        reply = dlt645.Frame(self.station_addr, control=reply_control(function))
+        reply.compat = DLT645_2007
+        chunk_size = BLOCK_FRAME_SIZE - 5
+        block = self.blocks.get(data_id)
+        if block is None or seq * chunk_size >= max(len(block), 1):
+            reply.control["response"] = RESPONSE_INCORRECT
+            reply.data = "02"  # no such data
+            return reply
+        chunk = block[seq * chunk_size:(seq + 1) * chunk_size]
+        if (seq + 1) * chunk_size < len(block):
+            reply.control["more"] = MORE_DATA
+        line = payload[:4] + chunk + (bytes([seq]) if seq else b"")
+        reply.data = line[::-1].hex().upper()
+        return reply
+
+
+phase_angle_gains_by_phase = {phase: addr for addr, phase in phase_angle_gains.items()}
+power_gains_by_phase = {phase: addr for addr, phase in power_gains.items()}
+vol_cur_gain_by_quantity = {
+    quantity: {phase: addr for addr, (q, phase) in vol_cur_gains.items() if q == quantity}
+    for quantity in ("voltage", "current")
+}
+
+
+def reply_control(function):
+    return {
+        "direction": STATION,
+        "response": RESPONSE_CORRECT,
+        "more": NO_MORE_DATA,
+        "function": function,
+    }
+
+
+class PtyDevice:
+    """
+    Serve a device model on a pty; port is the path to open with pyserial.
+
+    Replies are delayed by response_delay plus byte_latency per reply byte to
+    mimic the line speed. The pty is opened by start(), ptys are POSIX only: the
+    device models work everywhere, serving them on a port does not work on Windows.
+    """
+
+    def __init__(self, name, handler, byte_latency=0.0, response_delay=0.0):
+        self.name = name
+        self.handler = handler
+        self.byte_latency = byte_latency
+        self.response_delay = response_delay
+        self.master = self.slave = None
+        self.port = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        import tty
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name=self.name, daemon=True)
+        self.thread.start()
+        logging.info(f"{self.name} listening on {self.port}")
+
+    def serve(self):
+        buffer = bytearray()
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self.master, 4096)
+            except OSError:
+                break
+            reply = self.handler(buffer)
+            if reply:
+                time.sleep(self.response_delay + self.byte_latency * len(reply))
+                os.write(self.master, reply)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.master is not None:
+            os.close(self.master)
+            os.close(self.slave)
+            self.master = self.slave = None
+
+
+def meter_handler(meters):
+    """Build a pty handler answering DL/T645 requests for the meters sharing a line."""
+    reader = dlt645.FrameReader()
+
+    def handle(buffer):
+        reader.buffer += buffer
+        buffer.clear()
+        reply = b""
+        while True:
+            try:
+                frame = reader.next_frame()
+            except dlt645.exceptions.DLT645Error as e:
+                logging.warning(f"Simulated meter: {e}")
+                continue
+            if frame is None:
+                return reply
+            answers = [answer.dump() for answer in (meter.handle(frame) for meter in meters) if answer is not None]
+            if len(answers) == 1:
+                reply += answers[0]
+            elif answers:
+                # meters answering at once collide and garble the line
+                reply += bytes(functools.reduce(operator.xor, column) for column in zip(*answers))
+
+    return handle
+
+
+class Simulator:
+    """
+    A simulated power supply and one simulated meter per station, each on its own pty.
+
+    With bus=True the meters share a single pty instead, as on an RS-485 bus.
+    """
+
+    def __init__(self, meters=1, settle_time=2.0, noise=0.0, byte_latency=0.0, response_delay=0.0, seed=None,
+                 bus=False):
+        self.supply = SupplyModel(settle_time=settle_time, noise=noise)
+        self.supply_device = PtyDevice("supply", self.supply.handle, byte_latency, response_delay)
+        self.meters = []
+        self.meter_devices = []
+        for i in range(meters):
+            meter = MeterModel("%012d" % (i + 1), self.supply, noise=noise,
+                               seed=None if seed is None else seed + i)
+            self.meters.append(meter)
+            if not bus:
+                self.meter_devices.append(
+                    PtyDevice(f"meter{i + 1}", meter_handler([meter]), byte_latency, response_delay))
+        if bus:
+            self.meter_devices.append(PtyDevice("bus", meter_handler(self.meters), byte_latency, response_delay))
+
+    def start(self):
+        for device in [self.supply_device] + self.meter_devices:
+            device.start()
+        return self
+
+    def stop(self):
+        for device in [self.supply_device] + self.meter_devices:
+            device.stop()
+
+    @property
+    def supply_port(self):
+        return self.supply_device.port
+
+    @property
+    def meter_ports(self):
+        return [device.port for device in self.meter_devices]
+
+
+if __name__ == "__main__":
+    with open("config.json", "r") as config_file:
+        sim_config = json.load(config_file).get("simulator", {})
+
+    simulator = Simulator(
+        meters=sim_config.get("meters", 1),
+        settle_time=sim_config.get("settle_time", 2.0),
+        noise=sim_config.get("noise", 0.0),
+        byte_latency=sim_config.get("byte_latency", 0.0),
+        response_delay=sim_config.get("response_delay", 0.0),
+    ).start()
+    print(f"Power supply port: {simulator.supply_port}")
+    for port in simulator.meter_ports:
+        print(f"Meter port: {port}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -23,7 +23,7 @@ Usage:
     frame = dlt645.Frame(station_addr)
     frame.data = "00000000"
     ser.write(frame.dump())
-    framedata = dlt645.read_frame(dlt645.iogen(ser))
+    framedata = dlt645.recv_frame(ser)
     # the data will be the full payload (energy valu and data identification)
     print(framedata.data)
 
@@ -31,24 +31,71 @@ Usage:
     dlt645.get_active_energy(station_addr, ser)
 
 """
+import logging
+import time
+
 from .__meta__ import __version__  # noqa: F401
 from .constants import (
     AWAKEN,
     BROADCAST_ADDR,
+    DATA_ID_SIZES,
     DLT645_2007,
     END,
+    FOLLOW_UP_FUNCTIONS,
     FUNCTION_CODES,
     MAIN,
+    MORE_DATA,
     NO_MORE_DATA,
     RESPONSE_CORRECT,
+    SPEED_CODES,
     START,
 )
-from .exceptions import FrameChecksumError, FrameFormatError, ReadTimeoutError
+from .exceptions import DLT645Error, FrameChecksumError, FrameFormatError, ReadTimeoutError, ResponseError
+from .stats import TransactionStats
+
+logger = logging.getLogger(__name__)
 
 b_awaken = AWAKEN.to_bytes(1, byteorder="big")
 b_start = START.to_bytes(1, byteorder="big")
 b_end = END.to_bytes(1, byteorder="big")
 
+# data bytes are sent with a 0x33 offset, see load_data/dump_data
+_load_table = bytes((byte - 0x33) & 0xFF for byte in range(256))
+_dump_table = bytes((byte + 0x33) & 0xFF for byte in range(256))
+
+# TransactionStats instance while instrumentation is enabled, see enable_stats
+_stats = None
+
+
+def enable_stats(stats=None):
+    """Start recording transaction statistics, return the
+    :class:`~dlt645.stats.TransactionStats` instance receiving them.
+
+    Requests written with :func:`write_frame` / :func:`write_frames` are
+    paired with the replies read by :func:`recv_frame` on the same file-like
+    object.
+
+    :param TransactionStats stats: instance to record into, the current one
+        (or a new one) if ``None``
+    """
+    global _stats
+    if stats is None:
+        stats = _stats if _stats is not None else TransactionStats()
+    _stats = stats
+    return stats
+
+
+def disable_stats():
+    """Stop recording transaction statistics."""
+    global _stats
+    _stats = None
+
+
+def get_stats():
+    """Return the :class:`~dlt645.stats.TransactionStats` instance in use,
+    ``None`` if instrumentation is disabled."""
+    return _stats
+
 
 def iogen(flo):
     """Simple data generator for a file-like object, returns bytes one by one.
@@ -62,88 +109,334 @@ def iogen(flo):
         yield byte
 
 
-def read_frame(readgen):
+def read_frame(readgen, reader=None):
     """Read a frame from a data generator, return a :class:`Frame` instance.
 
-    :param generator readgen: a generator returning data one byte at a time
+    The generator may return data one byte at a time or in chunks of any
+    size, the frame boundary is taken from the length field.
+
+    :param generator readgen: a generator returning data
+    :param FrameReader reader: parser state to use, keeps trailing bytes
+        between calls
     """
-    firstbyte = False
-    framedata = bytearray()
-    for byte in readgen:
-        if byte == b"":
+    if reader is None:
+        reader = FrameReader()
+
+    frame = reader.next_frame()
+    if frame is not None:
+        return frame
+
+    for data in readgen:
+        if data == b"":
             raise ReadTimeoutError
 
-        if firstbyte is False and byte == b_awaken:
-            continue
+        frame = reader.feed(data)
+        if frame is not None:
+            return frame
+
+
+def recv_frame(flo, reader=None):
+    """Read a frame from a file-like object, return a :class:`Frame` instance
+    or ``None`` on timeout.
+
+    Each read asks for exactly the number of bytes still missing from the
+    frame (or everything already waiting on a serial port), so a frame is
+    usually received in two or three reads instead of one read per byte.
+
+    :param flo: a file-like object instance
+    :param FrameReader reader: parser state to use, keeps trailing bytes
+        between calls
+    """
+    if reader is None:
+        reader = FrameReader()
+    if _stats is not None:
+        return _recv_frame_stats(flo, reader, _stats)
+
+    frame = reader.next_frame()
+    while frame is None:
+        size = max(reader.needed(), getattr(flo, "in_waiting", 0))
+        data = flo.read(size)
+        if not data:
+            return None
+        frame = reader.feed(data)
+    return frame
+
+
+def _recv_frame_stats(flo, reader, stats):
+    """:func:`recv_frame` recording the transaction in a
+    :class:`~dlt645.stats.TransactionStats` instance."""
+    first_byte = None
+    received = 0
+    try:
+        frame = reader.next_frame()
+        while frame is None:
+            size = max(reader.needed(), getattr(flo, "in_waiting", 0))
+            data = flo.read(size)
+            if not data:
+                stats.reply_received(flo, first_byte, time.perf_counter(), received, "timeout")
+                return None
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            received += len(data)
+            frame = reader.feed(data)
+    except FrameChecksumError:
+        stats.reply_received(flo, first_byte, time.perf_counter(), received, "checksum")
+        raise
+    except FrameFormatError:
+        stats.reply_received(flo, first_byte, time.perf_counter(), received, "format")
+        raise
+
+    last_byte = time.perf_counter()
+    # a frame already buffered by an earlier read arrived "now"
+    stats.reply_received(flo, first_byte or last_byte, last_byte, received, reply=frame)
+    return frame
+
+
+class FrameReader:
+    """Incremental frame parser.
+
+    Data is fed in chunks of any size; a :class:`Frame` is returned as soon as
+    the last byte of a frame has been received. Bytes following the frame are
+    kept for the next one.
+    """
 
-        firstbyte = True
+    #: Bytes before the data field: start, address, start, control, length
+    header_size = 10
 
-        framedata.extend(bytearray(byte))
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received data, return a :class:`Frame` if one is complete.
+
+        :param bytes data: received data
+        """
+        self.buffer += data
+        return self.next_frame()
+
+    def _sync(self):
+        """Drop the bytes before the first plausible frame header: wake up
+        bytes, noise and start bytes not followed by the second start byte of
+        a header."""
+        buffer = self.buffer
+        while True:
+            start = buffer.find(b_start)
+            if start < 0:
+                buffer.clear()
+                return
+            if start:
+                del buffer[:start]
+            if len(buffer) < 8 or buffer[7] == START:
+                return
+            # stray start byte, its "length" is meaningless
+            del buffer[:1]
+
+    def needed(self):
+        """Number of bytes still missing to complete the current frame."""
+        self._sync()
+        received = len(self.buffer)
+        if not received:
+            return 1
+        if received < self.header_size:
+            return self.header_size - received
+        return self.header_size + self.buffer[9] + 2 - received
+
+    def next_frame(self):
+        """Return the next complete :class:`Frame` in the buffer, or ``None``.
+
+        A frame with a bad checksum or end byte may be noise looking like a
+        header, or hide a valid frame: only its first byte is dropped before
+        looking for the next header, and the error is raised if no valid frame
+        follows in the buffer.
+
+        :raises FrameChecksumError: a complete frame has a bad checksum
+        :raises FrameFormatError: a complete frame has a bad end byte
+        """
+        buffer = self.buffer
+        error = None
+        while True:
+            self._sync()
+            if len(buffer) < self.header_size:
+                break
+            size = self.header_size + buffer[9] + 2
+            if len(buffer) < size:
+                break
 
-        if byte == b_end:
             frame = Frame()
-            frame.load(framedata)
+            try:
+                frame.load(bytearray(buffer[:size]))
+            except (FrameChecksumError, FrameFormatError) as e:
+                error = error or e
+                del buffer[:1]
+                continue
+            del buffer[:size]
             return frame
 
+        if error is not None:
+            raise error
+        return None
+
+    def reset(self):
+        """Drop any buffered data."""
+        self.buffer.clear()
+
+
+def preamble(awaken):
+    """Return the wake up bytes to send before a frame.
+
+    :param awaken: ``True`` for the usual four wake up bytes, ``False`` or
+        ``0`` for none, or a number of wake up bytes
+    """
+    if awaken is True:
+        return 4 * b_awaken
+    if not awaken:
+        return b""
+    return awaken * b_awaken
+
 
 def write_frame(flo, frame, awaken=True):
     """Write a frame to byte form to be written on a data line
 
     :param flo: a file-like object instance
     :param dlt645.Frame frame: a :class:`Frame` instance
-    :param bool awaken: whether to prefix the message with wake up bytes
+    :param awaken: whether to prefix the message with wake up bytes, or the
+        number of wake up bytes (see :func:`preamble`)
     """
-    if awaken is True:
-        payload = 4 * b_awaken + frame.dump()
-    else:
-        payload = frame.dump()
+    payload = preamble(awaken) + frame.dump()
 
     flo.write(payload)
+    if _stats is not None:
+        _stats.request_sent(flo, frame, len(payload))
+
+
+def write_frames(flo, frames, awaken=True):
+    """Write several frames in a single write, for pipelined requests.
+
+    The wake up bytes are only sent before the first frame, the station is
+    awake for the ones following it on the line.
+
+    :param flo: a file-like object instance
+    :param frames: :class:`Frame` instances
+    :param awaken: whether to prefix the first message with wake up bytes,
+        or the number of wake up bytes (see :func:`preamble`)
+    """
+    dumps = [frame.dump() for frame in frames]
+    if dumps:
+        dumps[0] = preamble(awaken) + dumps[0]
+    flo.write(b"".join(dumps))
+    if _stats is not None:
+        start = time.perf_counter()
+        for frame, payload in zip(frames, dumps):
+            _stats.request_sent(flo, frame, len(payload), start)
 
 
 class Frame:
     """DL/T645 frame representation with mechanisms to load/dump a frame
     from/into a data byte string.
 
+    A loaded frame keeps the raw bytes and only decodes the address, control
+    code and data when they are accessed. :attr:`view`, :attr:`addr_bytes`,
+    :attr:`payload_bytes` and :meth:`u16` give access to the content without
+    going through hex strings.
+
     :param str addr: station address
     :param dict control: a constrol code representation
     """
 
-    #: Protocol compatibitilty
-    #:
-    #: :meta hide-value:
-    compat = DLT645_2007
-    #: Raw frame data
-    #:
-    #: :meta hide-value:
-    frame = None
-    #: Station address
-    #:
-    #: :meta hide-value:
-    addr = None
-    #: Structure representing the control code portion of a frame in a more
-    #: human readable way
-    #:
-    #: :meta hide-value:
-    control = {
-        "direction": MAIN,
-        "response": RESPONSE_CORRECT,
-        "more": NO_MORE_DATA,
-        "function": FUNCTION_CODES[DLT645_2007]["READ_DATA"],
-    }
-    #: data portion of a frame
-    #:
-    #: :meta hide-value:
-    data = None
+    __slots__ = ("compat", "frame", "_view", "_addr", "_control", "_data")
 
     def __init__(self, addr=None, control=None):
-        self.addr = addr
-        if control is not None:
-            self.control = control
+        #: Protocol compatibitilty
+        self.compat = DLT645_2007
+        #: Raw frame data
+        self.frame = None
+        self._view = None
+        self._addr = addr
+        self._control = control
+        self._data = None
 
     def __str__(self):
         return bytetostr(self.frame)
 
+    @property
+    def addr(self):
+        """Station address"""
+        if self._addr is None and self._view is not None:
+            self._addr = bytetostr(load_addr(self._view[1:7]))
+        return self._addr
+
+    @addr.setter
+    def addr(self, value):
+        self._addr = value
+
+    @property
+    def control(self):
+        """Structure representing the control code portion of a frame in a
+        more human readable way"""
+        if self._control is None:
+            if self._view is not None:
+                self._control = load_ctrl(self._view[8])
+            else:
+                self._control = {
+                    "direction": MAIN,
+                    "response": RESPONSE_CORRECT,
+                    "more": NO_MORE_DATA,
+                    "function": FUNCTION_CODES[DLT645_2007]["READ_DATA"],
+                }
+        return self._control
+
+    @control.setter
+    def control(self, value):
+        self._control = value
+
+    @property
+    def data(self):
+        """data portion of a frame, as a hex string (most significant byte
+        first)"""
+        if self._data is None and self._view is not None:
+            self._data = bytetostr(self.payload_bytes[::-1])
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def view(self):
+        """``memoryview`` over the raw frame, ``None`` until a frame is
+        loaded"""
+        return self._view
+
+    @property
+    def addr_bytes(self):
+        """Station address as sent on the line (least significant byte
+        first)"""
+        return self._view[1:7]
+
+    @property
+    def length(self):
+        """Length of the data portion"""
+        return self._view[9]
+
+    @property
+    def payload_bytes(self):
+        """Data portion with the 0x33 offset removed, in line order (least
+        significant byte first)"""
+        return self._view[10 : 10 + self._view[9]].tobytes().translate(_load_table)
+
+    def u16(self, offset):
+        """Return the unsigned 16-bit little-endian value at an offset of the
+        data portion.
+
+        :param int offset: byte offset in the data portion
+        """
+        view = self._view
+        if offset < 0 or offset + 2 > view[9]:
+            raise IndexError(f"Offset {offset} out of data range")
+        low = view[10 + offset]
+        high = view[11 + offset]
+        return (((high - 0x33) & 0xFF) << 8) | ((low - 0x33) & 0xFF)
+
     def load(self, framedata):
         """Load a payload into a frame.
 
@@ -153,12 +446,13 @@ class Frame:
             raise FrameFormatError(f"Format error in frame ({framedata})")
 
         self.frame = framedata
+        self._view = memoryview(framedata)
         if self.is_valid() is False:
             raise FrameChecksumError(f"Checksum error in frame ({framedata})")
-        self.addr = bytetostr(load_addr(framedata[1:7]))
-        self.control = load_ctrl(framedata[8])
-        length = framedata[9]
-        self.data = bytetostr(load_data(framedata[10 : 10 + length]))
+        # decoded lazily from the raw frame
+        self._addr = None
+        self._control = None
+        self._data = None
 
     def dump(self):
         """Dump a frame as a byte-like object."""
@@ -182,7 +476,7 @@ class Frame:
         """Frame checksum"""
         if self.frame is None:
             return None
-        calc_checksum = checksum(self.frame[:-2])
+        calc_checksum = checksum(self._view[:-2])
         #print("calculated checksum",calc_checksum)
         return calc_checksum
 
@@ -211,11 +505,7 @@ def bytetostr(bdata):
 
     :param bytearray bdata: a byte-like payload
     """
-    data = ""
-    for byte in bdata:
-        hex_str = hex(byte)[2:]
-        data += hex_str.zfill(2)
-    return data
+    return bytes(bdata).hex()
 
 
 def load_addr(data):
@@ -234,7 +524,7 @@ def dump_addr(addr):
 
     :param str addr: a station address
     """
-    bdata = bytearray([int(addr[i : i + 2], 16) for i in range(0, len(addr), 2)])
+    bdata = bytearray.fromhex(addr)
     bdata.reverse()
     return bdata
 
@@ -243,9 +533,9 @@ def load_ctrl(data):
     """Read control code information, return a dict structure representing the
     different control code parts.
 
-    :param bytearray data: a byte-like payload
+    :param data: the control byte, as an integer or a byte-like payload
     """
-    ctrl = bytearray(data)[0]
+    ctrl = data if isinstance(data, int) else data[0]
     return {
         "direction": ctrl >> 7,
         "response": ctrl >> 6 & 0b01,
@@ -273,30 +563,24 @@ def load_data(data):
 
     :param bytearray data: a byte-like payload
     """
-    bdata = bytearray(data)
+    bdata = bytearray(data).translate(_load_table)
     bdata.reverse()
-    retdata = bytearray()
-    for byte in bdata:
-        if byte < 0x33:
-            byte += 0x100
-        retdata.append(byte - 0x33)
-
-    return retdata
+    return bdata
 
 
 def dump_data(data):
     """Dump a data payload to a byte-like object.
 
-    :param str data: a data payload
+    :param data: a data payload, as a hex string or a byte-like object
     """
     if data is None:
         return b""
 
-    # Ensure data is a bytes-like object
-    if isinstance(data, bytes):
-        data = data.hex()  # Convert bytes to a hex string
-
-    bdata = bytearray([(int(data[i : i + 2], 16) + 0x33) % 256 for i in range(0, len(data), 2)])
+    if isinstance(data, str):
+        bdata = bytearray.fromhex(data)
+    else:
+        bdata = bytearray(data)
+    bdata = bdata.translate(_dump_table)
     bdata.reverse()
     return bdata
 
@@ -313,8 +597,13 @@ def get_addr(flo, r_flo=None):
     # request address using broadcast target address
     payload = b"\xfe\xfe\xfe\xfe\x68\xaa\xaa\xaa\xaa\xaa\xaa\x68\x13\x00\xdf\x16"
     flo.write(payload)
+    if _stats is not None:
+        request = Frame(bytetostr(BROADCAST_ADDR), control=load_ctrl(payload[12]))
+        _stats.request_sent(flo, request, len(payload))
 
-    resp = read_frame(iogen(r_flo))
+    resp = recv_frame(r_flo)
+    if resp is None:
+        raise ReadTimeoutError("No reply to the address request")
     return resp.addr
 
 
@@ -339,7 +628,227 @@ def get_active_energy(addr, flo, r_flo=None):
     frame.data = "00000000"
     write_frame(flo, frame)
 
-    resp = read_frame(iogen(r_flo))
+    resp = recv_frame(r_flo)
     # test the data identification
     if resp.data[-8:] == "00000000":
         return int(resp.data[:-8]) / 100
+
+
+def read_request(addr, data_id, seq=0, compat=DLT645_2007):
+    """Return the request reading a data item, or its follow up frame number
+    ``seq``.
+
+    :param str addr: a station address
+    :param int data_id: data identifier (4 bytes for DL/T645-2007, 2 bytes
+        for DL/T645-1997)
+    :param int seq: follow up frame number, 0 for the first frame
+    :param int compat: DL/T645 version of the station
+    """
+    function = FUNCTION_CODES[compat][FOLLOW_UP_FUNCTIONS[compat] if seq else "READ_DATA"]
+    frame = Frame(
+        addr,
+        control={
+            "direction": MAIN,
+            "response": RESPONSE_CORRECT,
+            "more": NO_MORE_DATA,
+            "function": function,
+        },
+    )
+    frame.compat = compat
+    data = "%0*X" % (2 * DATA_ID_SIZES[compat], data_id)
+    if seq and compat == DLT645_2007:
+        # the frame number follows the data identifier
+        data = "%02X" % (seq & 0xFF) + data
+    frame.data = data
+    return frame
+
+
+def reply_payload(reply, data_id, seq=0, compat=DLT645_2007):
+    """Check a reply to :func:`read_request` and return its data, without
+    the data identifier and frame number, in line order (least significant
+    byte first).
+
+    :param dlt645.Frame reply: the reply
+    :param int data_id: data identifier requested
+    :param int seq: follow up frame number requested
+    :param int compat: DL/T645 version of the station
+    :raises ResponseError: the station answered with an error
+    :raises FrameFormatError: the reply does not answer the request
+    """
+    payload = reply.payload_bytes
+    if reply.control["response"] != RESPONSE_CORRECT:
+        raise ResponseError(f"Error response from {reply.addr}: {payload.hex()}")
+    size = DATA_ID_SIZES[compat]
+    if len(payload) < size or int.from_bytes(payload[:size], "little") != data_id:
+        raise FrameFormatError(f"Reply does not carry data identifier {data_id:0{2 * size}X}")
+    if seq and compat == DLT645_2007:
+        if not payload[size:] or payload[-1] != seq & 0xFF:
+            raise FrameFormatError(f"Reply does not carry follow up frame number {seq}")
+        return payload[size:-1]
+    return payload[size:]
+
+
+def read_data_stream(flo, addr, data_id, compat=DLT645_2007, reader=None, request=None, max_frames=256):
+    """Read a data item, yield the data of each reply frame as it arrives.
+
+    A station that cannot fit a data item (e.g. a load profile or an energy
+    table) in one frame sets the follow up flag of its reply; the next frames
+    are requested until a reply without the flag. Each chunk is in line order
+    (least significant byte first), without the data identifier and frame
+    number.
+
+    :param flo: a file-like object instance
+    :param str addr: a station address
+    :param int data_id: data identifier
+    :param int compat: DL/T645 version of the station
+    :param FrameReader reader: parser state to use
+    :param request: callable sending a request frame and returning the reply
+        or ``None`` (e.g. :meth:`Session.request
+        <dlt645.session.Session.request>` for retries), by default the
+        request is written to ``flo`` and the reply read from it
+    :param int max_frames: maximum number of frames of a data item
+    :raises ReadTimeoutError: a reply is missing
+    :raises ResponseError: the station answered with an error
+    """
+    if request is None:
+
+        def request(frame):
+            write_frame(flo, frame)
+            return recv_frame(flo, reader)
+
+    for seq in range(max_frames):
+        reply = request(read_request(addr, data_id, seq, compat))
+        if reply is None:
+            raise ReadTimeoutError(f"No reply to frame {seq} of data {data_id:X}")
+        yield reply_payload(reply, data_id, seq, compat)
+        if reply.control["more"] != MORE_DATA:
+            return
+    raise FrameFormatError(f"Data {data_id:X} not complete after {max_frames} frames")
+
+
+def read_data(flo, addr, data_id, compat=DLT645_2007, reader=None, request=None):
+    """Read a data item and its follow up frames, return the data in line
+    order (least significant byte first), see :func:`read_data_stream`.
+    """
+    return b"".join(read_data_stream(flo, addr, data_id, compat, reader, request))
+
+
+def _link_up(ser, reader, verify, addr):
+    """Send the ``verify`` request and tell whether the station at ``addr``
+    answered it, an error response proves the link as well."""
+    try:
+        ser.reset_input_buffer()
+        reader.reset()
+        write_frame(ser, verify)
+        reply = recv_frame(ser, reader)
+    except Exception:
+        # port refusing the rate or no valid reply at it
+        return False
+    return reply is not None and reply.addr == addr.lower()
+
+
+def negotiate_speed(ser, addr, target, compat=DLT645_2007, switch_delay=0.1):
+    """Utility function to switch a station and the local serial port to a
+    faster baud rate, returns the baud rate in use afterwards.
+
+    Each target rate faster than the port's current one is requested in turn
+    with a SET_SPEED frame (slower or equal rates are skipped, with a warning
+    if none is left); when the station accepts one, the port is reconfigured
+    at the new rate and the link is verified with a request addressed to the
+    station, so no other station on the bus can answer it: a read address
+    request for DL/T645-2007, a read of the total active energy for
+    DL/T645-1997, which has no read address function.
+
+    A station that acknowledged SET_SPEED has already switched, so if the
+    verification fails it is asked to go back to the previous rate, and the
+    link is checked at the previous rate, then at the new one again. If the
+    station answers at neither, negotiation stops with a warning.
+
+    :param serial.Serial ser: an open serial port
+    :param str addr: a station address
+    :param target: a baud rate, or baud rates to try in order of preference
+        (see :data:`~dlt645.constants.SPEED_CODES`)
+    :param int compat: DL/T645 version of the station
+    :param float switch_delay: seconds to wait for the station to switch
+        after its reply
+    """
+    targets = [target] if isinstance(target, int) else list(target)
+    for rate in targets:
+        if rate not in SPEED_CODES:
+            raise ValueError(f"Unsupported baud rate: {rate}")
+    if all(rate <= ser.baudrate for rate in targets):
+        logger.warning("No target rate above %d baud for %s, keeping it", ser.baudrate, addr)
+        return ser.baudrate
+
+    control = {
+        "direction": MAIN,
+        "response": RESPONSE_CORRECT,
+        "more": NO_MORE_DATA,
+        "function": FUNCTION_CODES[compat]["SET_SPEED"],
+    }
+    if compat == DLT645_2007:
+        verify = Frame(
+            addr,
+            control={
+                "direction": MAIN,
+                "response": RESPONSE_CORRECT,
+                "more": NO_MORE_DATA,
+                "function": FUNCTION_CODES[DLT645_2007]["READ_ADDR"],
+            },
+        )
+    else:
+        verify = read_request(addr, 0x9010, compat=compat)
+    reader = FrameReader()
+
+    def set_speed(rate):
+        frame = Frame(addr, control=control)
+        frame.data = "%02X" % SPEED_CODES[rate]
+        write_frame(ser, frame)
+        try:
+            resp = recv_frame(ser, reader)
+        except DLT645Error:
+            resp = None
+        reader.reset()
+        return (
+            resp is not None
+            and resp.control["response"] == RESPONSE_CORRECT
+            and resp.payload_bytes[:1] == bytes([SPEED_CODES[rate]])
+        )
+
+    for rate in targets:
+        if rate <= ser.baudrate:
+            continue
+        if not set_speed(rate):
+            # station refused this rate, try the next one at the current rate
+            continue
+
+        previous = ser.baudrate
+        time.sleep(switch_delay)
+        try:
+            ser.baudrate = rate
+        except Exception:
+            # port refusing the new rate, the station still has to come back
+            pass
+        else:
+            if _link_up(ser, reader, verify, addr):
+                return rate
+            # the station may hear the new rate even though its replies do
+            # not get through, ask it to go back
+            if previous in SPEED_CODES:
+                set_speed(previous)
+                time.sleep(switch_delay)
+
+        ser.baudrate = previous
+        if _link_up(ser, reader, verify, addr):
+            continue
+        try:
+            ser.baudrate = rate
+            if _link_up(ser, reader, verify, addr):
+                return rate
+        except Exception:
+            pass
+        ser.baudrate = previous
+        logger.warning("Lost the link to %s switching from %d to %d baud", addr, previous, rate)
+        break
+
+    return ser.baudrate
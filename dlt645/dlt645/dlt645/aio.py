@@ -0,0 +1,300 @@
+"""Asyncio transport for DL/T645 stations
+
+The blocking helpers in :mod:`dlt645` need one thread per serial port. This
+module provides the same operations as coroutines so that a single event loop
+can drive many stations. Frames are parsed with the same
+:class:`~dlt645.FrameReader` as the blocking API.
+
+Usage:
+
+.. code-block:: python
+
+    import asyncio
+    import dlt645
+    from dlt645 import aio
+
+
+    async def main():
+        conn = await aio.open_serial("/dev/ttyUSB0", baudrate=1200)
+        station_addr = await conn.get_addr()
+        print(await conn.get_active_energy(station_addr))
+        conn.close()
+
+    asyncio.run(main())
+
+"""
+import asyncio
+import logging
+import os
+
+from . import FrameReader, Frame, preamble, read_request, reply_payload
+from .bus import addr_matches
+from .constants import DLT645_2007, FUNCTION_CODES, MAIN, MORE_DATA, NO_MORE_DATA, RESPONSE_CORRECT, STATION
+from .exceptions import DLT645Error, FrameFormatError, ReadTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+def reply_matcher(frame):
+    """Return a function telling whether a frame answers a request: a
+    station reply with the request's function code, from the addressed
+    station (any station for a broadcast or wildcard address).
+
+    :param dlt645.Frame frame: the request
+    """
+    addr = frame.addr
+    function = frame.control["function"]
+
+    def match(reply):
+        if reply.control["direction"] != STATION or reply.control["function"] != function:
+            return False
+        return addr is None or addr_matches(addr, reply.addr)
+
+    return match
+
+
+class PipeWriter(asyncio.Protocol):
+    """Write side of a pipe transport with flow control, the part of
+    :class:`asyncio.StreamWriter` a :class:`Connection` uses.
+
+    :meth:`drain` waits while the transport's buffer is above its high water
+    mark.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.paused = False
+        self.waiters = []
+        self.exception = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.exception = exc or ConnectionResetError("Connection lost")
+        self._wake()
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self._wake()
+
+    def _wake(self):
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        """Wait until the transport accepts more data."""
+        while self.paused and self.exception is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            await waiter
+        if self.exception is not None:
+            raise self.exception
+
+    def close(self):
+        self.transport.close()
+
+
+class Connection:
+    """A DL/T645 link driven by an asyncio stream pair.
+
+    Requests on one connection are serialized, concurrent requests to several
+    stations should use one connection per port.
+
+    :param asyncio.StreamReader reader: stream to read frames from
+    :param writer: stream to write frames to, an
+        :class:`asyncio.StreamWriter` or a :class:`PipeWriter`
+    :param float timeout: default timeout in seconds for :meth:`request`
+    """
+
+    def __init__(self, reader, writer, timeout=1.0):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.frame_reader = FrameReader()
+        self.lock = asyncio.Lock()
+        #: read side transport when the reader is fed by a pipe transport
+        self.read_transport = None
+        #: object closed along with the connection (e.g. a ``serial.Serial``)
+        self.owner = None
+
+    async def read_frame(self, timeout=None):
+        """Read a frame, return a :class:`~dlt645.Frame` instance.
+
+        :param float timeout: timeout in seconds, ``None`` waits forever
+        :raises ReadTimeoutError: no complete frame before the timeout or the
+            end of the stream
+        """
+        try:
+            return await asyncio.wait_for(self._read_frame(), timeout)
+        except asyncio.TimeoutError:
+            raise ReadTimeoutError("No frame received before timeout") from None
+
+    async def _read_frame(self):
+        frame = self.frame_reader.next_frame()
+        while frame is None:
+            data = await self.reader.read(4096)
+            if not data:
+                raise ReadTimeoutError("Stream closed")
+            frame = self.frame_reader.feed(data)
+        return frame
+
+    async def write_frame(self, frame, awaken=True):
+        """Write a frame to the stream.
+
+        :param dlt645.Frame frame: a :class:`~dlt645.Frame` instance
+        :param awaken: whether to prefix the message with wake up bytes, or
+            the number of wake up bytes (see :func:`~dlt645.preamble`)
+        """
+        payload = preamble(awaken) + frame.dump()
+        self.writer.write(payload)
+        await self.writer.drain()
+
+    async def request(self, frame, timeout=None, awaken=True, match=None):
+        """Send a frame and return the station's reply.
+
+        Frames that do not answer the request (e.g. a late reply to an earlier
+        request that timed out) are skipped. On a timeout or an invalid frame
+        the parser state is dropped, so a partial reply does not leak into
+        the next request.
+
+        :param dlt645.Frame frame: request frame
+        :param float timeout: timeout in seconds, defaults to the connection
+            timeout
+        :param bool awaken: whether to prefix the message with wake up bytes
+        :param match: callable telling whether a frame answers the request,
+            by default :func:`reply_matcher`
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if match is None:
+            match = reply_matcher(frame)
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            await self.write_frame(frame, awaken=awaken)
+            deadline = None if timeout is None else loop.time() + timeout
+            try:
+                while True:
+                    reply = await self.read_frame(None if deadline is None else max(0.0, deadline - loop.time()))
+                    if match(reply):
+                        return reply
+                    logger.debug("Skipping unmatched reply %s", reply)
+            except DLT645Error:
+                self.frame_reader.reset()
+                raise
+
+    async def get_addr(self, timeout=None):
+        """Read a station's address using the broadcast address, returns the
+        address.
+        """
+        frame = Frame(
+            control={
+                "direction": MAIN,
+                "response": RESPONSE_CORRECT,
+                "more": NO_MORE_DATA,
+                "function": FUNCTION_CODES[DLT645_2007]["READ_ADDR"],
+            }
+        )
+        resp = await self.request(frame, timeout)
+        return resp.addr
+
+    async def get_active_energy(self, addr, timeout=None):
+        """Read the active energy field, returns the energy value in kWh.
+
+        :param str addr: a station address
+        """
+        frame = Frame(addr)
+        # Data identification for active energy
+        frame.data = "00000000"
+        resp = await self.request(frame, timeout)
+        # test the data identification
+        if resp.data[-8:] == "00000000":
+            return int(resp.data[:-8]) / 100
+
+    async def read_data_stream(self, addr, data_id, compat=DLT645_2007, timeout=None, max_frames=256):
+        """Read a data item, yield the data of each reply frame as it arrives,
+        see :func:`dlt645.read_data_stream`.
+
+        :param str addr: a station address
+        :param int data_id: data identifier
+        :param int compat: DL/T645 version of the station
+        :param float timeout: timeout of each reply in seconds
+        :param int max_frames: maximum number of frames of a data item
+        """
+        for seq in range(max_frames):
+            reply = await self.request(read_request(addr, data_id, seq, compat), timeout)
+            yield reply_payload(reply, data_id, seq, compat)
+            if reply.control["more"] != MORE_DATA:
+                return
+        raise FrameFormatError(f"Data {data_id:X} not complete after {max_frames} frames")
+
+    async def read_data(self, addr, data_id, compat=DLT645_2007, timeout=None):
+        """Read a data item and its follow up frames, return the data in line
+        order, see :meth:`read_data_stream`.
+        """
+        return b"".join([chunk async for chunk in self.read_data_stream(addr, data_id, compat, timeout)])
+
+    def close(self):
+        """Close the streams and the underlying port if the connection opened
+        it."""
+        self.writer.close()
+        if self.read_transport is not None:
+            self.read_transport.close()
+            self.read_transport = None
+        if self.owner is not None:
+            self.owner.close()
+            self.owner = None
+
+
+async def open_fd(fd, timeout=1.0):
+    """Wrap a serial or pty file descriptor into a :class:`Connection`.
+
+    The descriptor is switched to non-blocking mode and stays owned by the
+    caller.
+
+    :param int fd: an open file descriptor
+    :param float timeout: default request timeout in seconds
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    read_transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader),
+        os.fdopen(fd, "rb", buffering=0, closefd=False),
+    )
+    _, writer = await loop.connect_write_pipe(PipeWriter, os.fdopen(fd, "wb", buffering=0, closefd=False))
+    conn = Connection(reader, writer, timeout)
+    conn.read_transport = read_transport
+    return conn
+
+
+async def open_serial(port, timeout=1.0, **kwargs):
+    """Open a serial port with pyserial and wrap it into a :class:`Connection`.
+
+    Keyword arguments are passed to ``serial.Serial`` and default to the
+    common DL/T645 settings: 1200 baud, 8 bits, parity even, 1 stop bit.
+    Requires the ``cli`` extra (pyserial).
+
+    :param str port: serial port name
+    :param float timeout: default request timeout in seconds
+    """
+    import serial
+
+    settings = {
+        "baudrate": 1200,
+        "bytesize": serial.EIGHTBITS,
+        "parity": serial.PARITY_EVEN,
+        "stopbits": serial.STOPBITS_ONE,
+    }
+    settings.update(kwargs)
+    ser = serial.Serial(port, **settings)
+    conn = await open_fd(ser.fileno(), timeout)
+    conn.owner = ser
+    return conn
@@ -0,0 +1,197 @@
+"""Benchmarks for the DL/T645 implementation
+
+``codec`` measures the per-frame cost of encoding and decoding, compared with
+the byte-by-byte implementation used up to 0.1.4. ``aio`` runs concurrent
+transactions against loopback stations served over pty pairs, so no hardware
+is needed (POSIX only).
+
+Usage:
+
+.. code-block:: shell
+
+    $ python -m dlt645.bench codec aio --requests 200
+"""
+import argparse
+import asyncio
+import os
+import time
+import timeit
+
+from . import Frame, bytetostr, dump_addr, dump_data, load_data
+from .aio import open_fd
+from .constants import DLT645_2007, FUNCTION_CODES, RESPONSE_CORRECT, STATION
+
+#: Active energy returned by the loopback stations (kWh * 100)
+LOOPBACK_ENERGY = "00025970"
+
+
+# Codec functions as implemented up to 0.1.4, baseline for codec()
+def legacy_bytetostr(bdata):
+    data = ""
+    for byte in bdata:
+        hex_str = hex(byte)[2:]
+        data += hex_str.zfill(2)
+    return data
+
+
+def legacy_dump_addr(addr):
+    bdata = bytearray([int(addr[i : i + 2], 16) for i in range(0, len(addr), 2)])
+    bdata.reverse()
+    return bdata
+
+
+def legacy_load_data(data):
+    bdata = bytearray(data)
+    bdata.reverse()
+    retdata = bytearray()
+    for byte in bdata:
+        if byte < 0x33:
+            byte += 0x100
+        retdata.append(byte - 0x33)
+    return retdata
+
+
+def legacy_dump_data(data):
+    if data is None:
+        return b""
+    if isinstance(data, bytes):
+        data = data.hex()
+    bdata = bytearray([(int(data[i : i + 2], 16) + 0x33) % 256 for i in range(0, len(data), 2)])
+    bdata.reverse()
+    return bdata
+
+
+def codec(number=20000):
+    """Time the encode (address + data) and decode (data + string) steps of a
+    frame with the current and the legacy codec functions.
+
+    :param int number: frames per measurement
+    :return: {name: (legacy seconds per frame, current seconds per frame)}
+    """
+    addr = "000022076396"
+    data = "00025970" + "00000000"
+    payload = bytes(dump_data(data))
+
+    cases = {
+        "encode": (
+            lambda: (legacy_dump_addr(addr), legacy_dump_data(data)),
+            lambda: (dump_addr(addr), dump_data(data)),
+        ),
+        "decode": (
+            lambda: legacy_bytetostr(legacy_load_data(payload)),
+            lambda: bytetostr(load_data(payload)),
+        ),
+    }
+    results = {}
+    for name, (legacy, current) in cases.items():
+        assert legacy() == current()
+        results[name] = tuple(
+            min(timeit.repeat(func, number=number, repeat=5)) / number for func in (legacy, current)
+        )
+    return results
+
+
+def loopback_reply(frame, addr):
+    """Build the reply of a loopback station to a request frame.
+
+    :param dlt645.Frame frame: the request
+    :param str addr: the loopback station's address
+    """
+    control = dict(frame.control, direction=STATION, response=RESPONSE_CORRECT)
+    reply = Frame(addr, control=control)
+    if frame.control["function"] != FUNCTION_CODES[DLT645_2007]["READ_ADDR"]:
+        reply.data = LOOPBACK_ENERGY + frame.data
+    return reply
+
+
+async def loopback_station(conn, addr):
+    """Answer requests on a connection until it is closed."""
+    while True:
+        frame = await conn.read_frame()
+        await conn.write_frame(loopback_reply(frame, addr), awaken=False)
+
+
+async def aio_loopback(stations, requests):
+    """Run concurrent clients against loopback stations, one pty per station.
+
+    :param int stations: number of concurrent stations
+    :param int requests: active energy requests per station
+    :return: elapsed time in seconds
+    """
+    # POSIX only, the codec benchmark must stay importable on Windows
+    import tty
+
+    conns = []
+    fds = []
+    tasks = []
+    try:
+        for i in range(stations):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            fds += [master, slave]
+            server = await open_fd(master)
+            client = await open_fd(slave)
+            conns += [server, client]
+            tasks.append(asyncio.ensure_future(loopback_station(server, "%012d" % (i + 1))))
+
+        async def run_client(conn):
+            addr = await conn.get_addr()
+            for _ in range(requests):
+                await conn.get_active_energy(addr)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_client(conn) for conn in conns[1::2]))
+        return time.perf_counter() - start
+    finally:
+        for task in tasks:
+            task.cancel()
+        for conn in conns:
+            conn.close()
+        for fd in fds:
+            os.close(fd)
+
+
+def main():
+    description = "Benchmark the DL/T645 codec and asyncio transport"
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        default=["codec", "aio"],
+        choices=["codec", "aio"],
+        help="Benchmarks to run, defaults to all",
+    )
+    parser.add_argument(
+        "-n",
+        "--stations",
+        default=[1, 8, 32],
+        type=int,
+        nargs="+",
+        help="Numbers of concurrent stations to compare, defaults to 1 8 32",
+    )
+    parser.add_argument(
+        "-r", "--requests", default=200, type=int, help="Requests per station, defaults to 200"
+    )
+    args = parser.parse_args()
+
+    if "codec" in args.benchmarks:
+        for name, (legacy, current) in codec().items():
+            print(
+                f"{name}: {legacy * 1e6:6.2f} us per frame before, "
+                f"{current * 1e6:6.2f} us after ({legacy / current:.1f}x)"
+            )
+
+    if "aio" not in args.benchmarks:
+        return
+    for stations in args.stations:
+        elapsed = asyncio.run(aio_loopback(stations, args.requests))
+        total = stations * args.requests
+        print(
+            f"{stations:3d} stations: {total:6d} transactions in {elapsed:.3f} s, "
+            f"{total / elapsed:9.0f} transactions/s, "
+            f"{elapsed / args.requests * 1e6:8.1f} us per station round trip"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Multi-drop RS-485 bus: station discovery and shared transactions
+
+Several stations may share one line, each one only answering the frames
+carrying its address. A broadcast read address request is answered by every
+station at once, the replies collide, so :func:`discover` walks the address
+space with wildcard addresses instead: DL/T645 stations accept an address
+whose high order bytes are ``AA``, so ``AAAAAAAAAA17`` reaches the stations
+whose address ends with ``17``. A probe answered by a single station gives its
+address, a silent probe prunes the whole subtree, and only probes whose
+replies collide are split on the next byte. :func:`scan_addresses` probes a
+list of exact addresses instead, e.g. a known range of serial numbers.
+
+A :class:`Bus` then runs the transactions of every station over the port,
+one at a time.
+
+Usage:
+
+.. code-block:: python
+
+    import serial
+    import dlt645
+    from dlt645.bus import Bus
+
+    ser = serial.Serial("/dev/ttyUSB0", baudrate=1200, parity=serial.PARITY_EVEN, timeout=2)
+    bus = Bus(ser)
+    print(bus.scan())
+    for addr in bus.stations:
+        frame = dlt645.Frame(addr)
+        frame.data = "00000000"
+        print(bus.request(frame))
+    print(bus.stats())
+
+"""
+import logging
+import threading
+
+from . import FrameReader, Frame, b_awaken, get_stats, preamble
+from .constants import DLT645_2007, FUNCTION_CODES, MAIN, NO_MORE_DATA, RESPONSE_CORRECT, START, STATION
+from .exceptions import DLT645Error
+from .session import Session
+
+logger = logging.getLogger(__name__)
+
+#: Address byte matching any value
+WILDCARD = "aa"
+
+#: Values of an address byte (BCD digits)
+BCD_BYTES = tuple("%02d" % value for value in range(100))
+
+
+def addr_matches(pattern, addr):
+    """Tell whether a station address matches an address pattern, where
+    ``AA`` bytes match any value.
+
+    :param str pattern: address pattern, e.g. ``"AAAAAAAAAA17"``
+    :param str addr: station address
+    """
+    pattern = pattern.lower()
+    addr = addr.lower()
+    return all(
+        pattern[i : i + 2] in (WILDCARD, addr[i : i + 2]) for i in range(0, 12, 2)
+    )
+
+
+def read_addr_frame(pattern):
+    """Return a read address request to an address pattern.
+
+    :param str pattern: address pattern, see :func:`addr_matches`
+    """
+    return Frame(
+        pattern,
+        control={
+            "direction": MAIN,
+            "response": RESPONSE_CORRECT,
+            "more": NO_MORE_DATA,
+            "function": FUNCTION_CODES[DLT645_2007]["READ_ADDR"],
+        },
+    )
+
+
+def parse_replies(data, pattern):
+    """Split the bytes received after a probe into replies.
+
+    :param bytes data: every byte received until the line went quiet
+    :param str pattern: probed address pattern
+    :return: (set of addresses, whether replies collided), a collision being
+        any byte that is not part of a valid frame or a wake up byte
+    """
+    addresses = set()
+    reader = FrameReader()
+    reader.buffer += data
+    buffer = reader.buffer
+    while True:
+        del buffer[: len(buffer) - len(buffer.lstrip(b_awaken))]
+        if not buffer:
+            return addresses, False
+        if buffer[0] != START:
+            return addresses, True
+        received = len(buffer)
+        try:
+            frame = reader.next_frame()
+        except DLT645Error:
+            return addresses, True
+        if frame is None:
+            # truncated frame
+            return addresses, True
+        if frame.control["direction"] == STATION and addr_matches(pattern, frame.addr):
+            addresses.add(frame.addr)
+        if received - len(buffer) != len(frame.frame):
+            # the reader skipped garbled bytes to get to this frame
+            return addresses, True
+
+
+def probe(flo, pattern):
+    """Send a read address request to an address pattern and collect the
+    replies until the line stays quiet for the read timeout of ``flo``.
+
+    :param flo: a file-like object instance
+    :param str pattern: address pattern, see :func:`addr_matches`
+    :return: (set of addresses, whether replies collided)
+    """
+    # written directly: the replies are read below without recv_frame, a
+    # request recorded by the transaction statistics would stay pending
+    flo.write(preamble(True) + read_addr_frame(pattern).dump())
+    data = bytearray()
+    while True:
+        chunk = flo.read(max(1, getattr(flo, "in_waiting", 0)))
+        if not chunk:
+            break
+        data += chunk
+    return parse_replies(data, pattern)
+
+
+def discover(flo, values=BCD_BYTES):
+    """Return the addresses of every station on a line.
+
+    Probes are only split on the next (more significant) address byte when
+    their replies collide, so a few stations cost a few hundred probes at
+    most instead of one probe per possible address.
+
+    :param flo: a file-like object instance, its read timeout bounds the
+        wait for a silent probe
+    :param values: possible values of an address byte, as 2 hex digit strings
+    """
+    found = set()
+    pending = [""]  # known low order bytes of the patterns to probe
+    probes = 0
+    while pending:
+        suffix = pending.pop()
+        pattern = WILDCARD * (6 - len(suffix) // 2) + suffix
+        addresses, collided = probe(flo, pattern)
+        probes += 1
+        found |= addresses
+        if collided and len(suffix) < 12:
+            pending.extend(value + suffix for value in values)
+        elif collided:
+            logger.warning("Unreadable reply from %s", pattern)
+    logger.info("%d station(s) found in %d probes", len(found), probes)
+    return sorted(found)
+
+
+def scan_addresses(flo, addresses):
+    """Return the addresses of a list answering a read address request.
+
+    :param flo: a file-like object instance, use a short read timeout
+    :param addresses: exact station addresses to probe
+    """
+    return [addr for addr in addresses if probe(flo, addr)[0]]
+
+
+class Bus:
+    """Stations sharing one port.
+
+    Transactions of the stations are serialized by :attr:`lock`, which
+    callers running several requests in a row (e.g. pipelined reads) hold
+    themselves; it is reentrant.
+
+    :param flo: a file-like object instance
+    :param stations: known station addresses, see :meth:`scan` otherwise
+    :param Session session: transaction layer to use, by default a
+        :class:`~dlt645.session.Session` built with ``session_args``
+    """
+
+    def __init__(self, flo, stations=None, session=None, **session_args):
+        self.flo = flo
+        self.session = session if session is not None else Session(flo, **session_args)
+        self.lock = threading.RLock()
+        self.stations = list(stations or ())
+
+    def scan(self, timeout=0.05, addresses=None, values=BCD_BYTES):
+        """Find the stations on the line, see :func:`discover` and
+        :func:`scan_addresses`.
+
+        :param float timeout: wait for a silent probe, in seconds
+        :param addresses: only probe these exact addresses
+        :param values: possible values of an address byte
+        :return: the station addresses, also kept in :attr:`stations`
+        """
+        with self.lock:
+            previous = getattr(self.flo, "timeout", None)
+            self._set_timeout(timeout)
+            try:
+                if addresses is None:
+                    self.stations = discover(self.flo, values)
+                else:
+                    self.stations = scan_addresses(self.flo, addresses)
+            finally:
+                self._set_timeout(previous)
+            # probe replies left in the parser would be taken for replies
+            self.session.reader.reset()
+        return self.stations
+
+    def _set_timeout(self, timeout):
+        if timeout is None or getattr(self.flo, "timeout", timeout) == timeout:
+            return
+        try:
+            self.flo.timeout = timeout
+        except Exception as e:
+            logger.warning("Cannot change the read timeout, keeping %s s: %s", self.flo.timeout, e)
+
+    def request(self, frame, **kwargs):
+        """Run a transaction with the station addressed by a frame, see
+        :meth:`Session.request <dlt645.session.Session.request>`."""
+        with self.lock:
+            return self.session.request(frame, **kwargs)
+
+    def stats(self):
+        """Return the request counters and timing estimates (see
+        :meth:`Session.stats <dlt645.session.Session.stats>`) and, if enabled,
+        the transaction statistics (see :func:`dlt645.enable_stats`) of each
+        station."""
+        with self.lock:
+            session_stats = self.session.stats()["stations"]
+            transactions = get_stats()
+            return {
+                addr: {
+                    "session": session_stats.get(addr),
+                    "transactions": None if transactions is None else transactions.snapshot(addr),
+                }
+                for addr in self.stations
+            }
@@ -0,0 +1,122 @@
+"""Persistent station address cache
+
+Reading a station's address costs a broadcast round trip (and the whole read
+timeout when no station answers) each time a port is opened. An
+:class:`AddressCache` remembers the address found behind each port or fixture
+in a JSON file; :func:`cached_addr` checks it with a request addressed to that
+station only, and falls back to the broadcast when the station does not
+answer (e.g. the meter was swapped).
+
+Usage:
+
+.. code-block:: python
+
+    import serial
+    from dlt645.cache import AddressCache, cached_addr
+
+    ser = serial.Serial("/dev/ttyUSB0", baudrate=1200, parity=serial.PARITY_EVEN, timeout=2)
+    addr = cached_addr(ser, "/dev/ttyUSB0", AddressCache())
+
+"""
+import json
+import logging
+import os
+import threading
+
+from . import get_addr, recv_frame, write_frame
+from .bus import read_addr_frame
+from .exceptions import DLT645Error
+
+logger = logging.getLogger(__name__)
+
+#: Cache file used when none is given
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".dlt645_addresses.json")
+
+
+class AddressCache:
+    """Station addresses keyed by port name or fixture identifier, stored
+    in a JSON file. The value of a port shared by several stations is the
+    list of their addresses.
+
+    The file is rewritten atomically on each change, one instance may be
+    shared by threads.
+
+    :param str path: cache file, created on the first change
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.addresses = {}
+        try:
+            with open(path, "r") as cache_file:
+                self.addresses = json.load(cache_file)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            logger.warning("Ignoring unreadable address cache %s: %s", path, e)
+
+    def get(self, key):
+        """Return the address cached for a port or fixture, or ``None``."""
+        with self.lock:
+            return self.addresses.get(key)
+
+    def put(self, key, addr):
+        """Cache the address found behind a port or fixture."""
+        with self.lock:
+            if self.addresses.get(key) == addr:
+                return
+            self.addresses[key] = addr
+            self._save()
+
+    def invalidate(self, key):
+        """Forget the address of a port or fixture."""
+        with self.lock:
+            if self.addresses.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump(self.addresses, cache_file, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def validate_addr(flo, addr, reader=None, awaken=True):
+    """Tell whether a station answers a request addressed to it.
+
+    :param flo: a file-like object instance
+    :param str addr: station address
+    :param FrameReader reader: parser state to use
+    :param awaken: wake up bytes to send, see :func:`~dlt645.preamble`
+    """
+    write_frame(flo, read_addr_frame(addr), awaken=awaken)
+    try:
+        reply = recv_frame(flo, reader)
+    except DLT645Error as e:
+        logger.debug("Invalid reply from %s: %s", addr, e)
+        if reader is not None:
+            reader.reset()
+        return False
+    return reply is not None and reply.addr == addr.lower()
+
+
+def cached_addr(flo, key, cache, reader=None):
+    """Return the address of the station behind a port or fixture: the
+    cached address if the station answers it, else the address read with
+    :func:`~dlt645.get_addr`, which is then cached.
+
+    :param flo: a file-like object instance
+    :param str key: port name or fixture identifier
+    :param AddressCache cache: the address cache
+    :param FrameReader reader: parser state to use for the validation
+    """
+    addr = cache.get(key)
+    if addr is not None:
+        if validate_addr(flo, addr, reader):
+            return addr
+        logger.info("Station %s no longer answers on %s, reading the address", addr, key)
+        cache.invalidate(key)
+    addr = get_addr(flo)
+    cache.put(key, addr)
+    return addr
@@ -8,7 +8,10 @@ import sys
 
 import serial
 
-from . import get_active_energy, get_addr
+from . import get_active_energy, get_addr, negotiate_speed
+from .bus import Bus
+from .cache import DEFAULT_PATH, AddressCache, cached_addr
+from .constants import SPEED_CODES
 
 
 def ser_args(parser):
@@ -52,6 +55,47 @@ def ser_args(parser):
     )
 
 
+def speed_args(parser):
+    parser.add_argument(
+        "-S",
+        "--speed",
+        default=None,
+        type=str,
+        help="Switch to this baud rate once the station's address is known, "
+        "'max' for the fastest rate the station accepts",
+    )
+
+
+def cache_args(parser):
+    parser.add_argument(
+        "-c",
+        "--cache",
+        default=DEFAULT_PATH,
+        type=str,
+        help=f"Station address cache file, defaults to '{DEFAULT_PATH}'",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the station address cache",
+    )
+
+
+def speed_targets(speed):
+    """Return the baud rates to try for a ``--speed`` value."""
+    if speed == "max":
+        return sorted(SPEED_CODES, reverse=True)
+    return int(speed)
+
+
+def switch_speed(ser, addr, speed):
+    """Negotiate the ``--speed`` baud rate, if any, and report the rate in use."""
+    if speed is None:
+        return
+    rate = negotiate_speed(ser, addr, speed_targets(speed))
+    sys.stdout.write(f"Baud rate: {rate}\n")
+
+
 def getaddr():
     """Entry point for CLI requesting a station's address through serial port.
 
@@ -68,6 +112,8 @@ def getaddr():
     description = "Get station's DL/T645 address through serial port"
     parser = argparse.ArgumentParser(description=description)
     ser_args(parser)
+    speed_args(parser)
+    cache_args(parser)
     args = parser.parse_args()
 
     try:
@@ -86,6 +132,9 @@ def getaddr():
 
     addr = get_addr(ser)
     sys.stdout.write(f"Station address: {addr}\n")
+    if not args.no_cache:
+        AddressCache(args.cache).put(args.port, addr)
+    switch_speed(ser, addr, args.speed)
 
 
 def getaen():
@@ -105,11 +154,13 @@ def getaen():
     description = "Get station's DL/T645 address through serial port"
     parser = argparse.ArgumentParser(description=description)
     ser_args(parser)
+    speed_args(parser)
+    cache_args(parser)
     parser.add_argument(
         "address",
         nargs="?",
         type=str,
-        help="Station's address, if not provided, request it.",
+        help="Station's address, if not provided, use the cached address or request it.",
     )
     args = parser.parse_args()
 
@@ -128,10 +179,65 @@ def getaen():
         sys.exit(1)
 
     if args.address is None:
-        addr = get_addr(ser)
+        if args.no_cache:
+            addr = get_addr(ser)
+        else:
+            addr = cached_addr(ser, args.port, AddressCache(args.cache))
         sys.stdout.write(f"Station address: {addr}\n")
     else:
         addr = args.address
+    switch_speed(ser, addr, args.speed)
 
     value = get_active_energy(addr, ser)
     sys.stdout.write(f"Active energy: {value} kWh\n")
+
+
+def scan():
+    """Entry point for CLI listing the stations sharing a serial line (RS-485
+    bus), see :mod:`dlt645.bus`.
+
+    By default, use the USB port '``/dev/ttyUSB0``' and common serial
+    communication definition: 1200 baud, 8bits, parity even, 1 stop bit.
+
+    Usage:
+
+    .. code-block:: shell
+
+        $ dlt645_scan
+        Station address: 000022076396
+        Station address: 000022076402
+    """
+    description = "List the DL/T645 stations sharing a serial line"
+    parser = argparse.ArgumentParser(description=description)
+    ser_args(parser)
+    parser.add_argument(
+        "-w",
+        "--wait",
+        default=0.1,
+        type=float,
+        help="Wait for the reply to a probe in seconds, defaults to 0.1",
+    )
+    parser.add_argument(
+        "addresses",
+        nargs="*",
+        type=str,
+        help="Only probe these station addresses, if not provided, discover them.",
+    )
+    args = parser.parse_args()
+
+    try:
+        ser = serial.Serial(
+            args.port,
+            baudrate=args.baudrate,
+            bytesize=args.bytesize,
+            parity=args.parity,
+            stopbits=args.stopbits,
+            timeout=args.timeout,
+            write_timeout=args.timeout,
+        )
+    except serial.serialutil.SerialException as e:
+        sys.stderr.write("{}\n".format(str(e)))
+        sys.exit(1)
+
+    for addr in Bus(ser).scan(args.wait, args.addresses or None):
+        sys.stdout.write(f"Station address: {addr}\n")
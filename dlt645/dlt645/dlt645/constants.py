@@ -53,6 +53,7 @@ MORE_DATA = 1
 FUNCTION_CODES = {
     DLT645_2007: {
         "READ_DATA": 0b10001,
+        "READ_FOLLOW_DATA": 0b10010,
         "READ_ADDR": 0b10011,
         "WRITE_DATA": 0b10100,
         "WRITE_ADDR": 0b10101,
@@ -72,3 +73,31 @@ FUNCTION_CODES = {
         "RESET_DEMAND": 0b10000,
     },
 }
+
+#: Function code reading the follow up frames of a READ_DATA reply
+#:
+#: :meta hide-value:
+FOLLOW_UP_FUNCTIONS = {
+    DLT645_2007: "READ_FOLLOW_DATA",
+    DLT645_1997: "READ_MORE",
+}
+
+#: Size in bytes of a data identifier
+#:
+#: :meta hide-value:
+DATA_ID_SIZES = {
+    DLT645_2007: 4,
+    DLT645_1997: 2,
+}
+
+#: Communication rate characteristic byte of a SET_SPEED request, per baud rate
+#:
+#: :meta hide-value:
+SPEED_CODES = {
+    600: 0b00000010,
+    1200: 0b00000100,
+    2400: 0b00001000,
+    4800: 0b00010000,
+    9600: 0b00100000,
+    19200: 0b01000000,
+}
@@ -20,3 +20,9 @@ class FrameChecksumError(DLT645Error):
     """Raised when the checksum test fails"""
 
     pass
+
+
+class ResponseError(DLT645Error):
+    """Raised when a station answers a request with an error response"""
+
+    pass
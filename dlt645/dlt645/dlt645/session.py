@@ -0,0 +1,253 @@
+"""Transaction layer with adaptive timeouts and retries
+
+A :class:`Session` sends a request frame and waits for the matching reply,
+with a read timeout derived from the round trip times measured on each
+station (smoothed RTT and RTT variance, as TCP does, RFC 6298). Idempotent
+requests are retried on timeout or corrupted reply, the timeout doubling on
+each retry up to a bound, so a lost frame costs a few round trips instead of
+the port's fixed timeout.
+
+The session also remembers when each station last answered: the wake up
+preamble is only sent to a station idle for longer than ``idle_gap`` seconds,
+or after an error on it.
+
+Usage:
+
+.. code-block:: python
+
+    import serial
+    import dlt645
+    from dlt645.session import Session
+
+    ser = serial.Serial("/dev/ttyUSB0", baudrate=1200, parity=serial.PARITY_EVEN, timeout=2)
+    session = Session(ser)
+    frame = dlt645.Frame(dlt645.get_addr(ser))
+    frame.data = "00000000"
+    reply = session.request(frame)
+    print(session.stats())
+
+"""
+import logging
+import math
+import time
+
+from . import FrameReader, preamble, recv_frame, write_frame
+from .exceptions import FrameChecksumError, FrameFormatError
+
+logger = logging.getLogger(__name__)
+
+
+class RttEstimator:
+    """Smoothed round trip time and retransmission timeout of one station.
+
+    :param float initial: timeout used until a round trip has been measured
+    :param float min_timeout: lower bound of the timeout
+    :param float max_timeout: upper bound of the timeout, also bounds the
+        backoff
+    """
+
+    #: Gain of the smoothed RTT
+    alpha = 1 / 8
+    #: Gain of the RTT variance
+    beta = 1 / 4
+    #: Number of variances added to the smoothed RTT
+    k = 4
+
+    def __init__(self, initial=1.0, min_timeout=0.05, max_timeout=2.0):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.rto = min(max(initial, min_timeout), max_timeout)
+
+    def update(self, rtt):
+        """Add a round trip time measurement, in seconds."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.rto = min(max(self.srtt + self.k * self.rttvar, self.min_timeout), self.max_timeout)
+
+    def backoff(self):
+        """Double the timeout after a lost reply, up to ``max_timeout``."""
+        self.rto = min(self.rto * 2, self.max_timeout)
+
+    @property
+    def timeout(self):
+        """Current read timeout in seconds"""
+        return self.rto
+
+
+class Session:
+    """Request/reply transactions over a file-like object.
+
+    :param flo: a file-like object instance, its ``timeout`` attribute (if
+        any) is adjusted before each request
+    :param FrameReader reader: parser state to use, keeps trailing bytes
+        between calls
+    :param int retries: number of retries of an idempotent request
+    :param float initial_timeout: timeout used on a station until a round
+        trip has been measured
+    :param float min_timeout: lower bound of the timeout
+    :param float max_timeout: upper bound of the timeout
+    :param int preamble: number of wake up bytes sent to an idle station
+    :param float idle_gap: seconds without reply after which a station is
+        considered idle, ``0`` to always send the preamble
+    """
+
+    #: Timeouts are rounded up to this step (seconds) to limit port
+    #: reconfigurations
+    timeout_step = 0.01
+
+    def __init__(self, flo, reader=None, retries=2, initial_timeout=1.0, min_timeout=0.05, max_timeout=2.0,
+                 preamble=4, idle_gap=1.0):
+        self.flo = flo
+        self.reader = reader if reader is not None else FrameReader()
+        self.retries = retries
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.preamble = preamble
+        self.idle_gap = idle_gap
+        self.estimators = {}
+        # station address -> time.perf_counter() of its last valid reply
+        self.last_reply = {}
+        #: Whether the read timeout of the file-like object is adjusted
+        self.adaptive = True
+        self.counters = {"requests": 0, "retries": 0, "timeouts": 0, "errors": 0, "failures": 0,
+                         "preambles": 0, "preamble_bytes_saved": 0}
+        # station address -> request, retry and failure counters of the station
+        self.station_counters = {}
+
+    def estimator(self, addr):
+        """Return the :class:`RttEstimator` of a station address."""
+        estimator = self.estimators.get(addr)
+        if estimator is None:
+            estimator = RttEstimator(self.initial_timeout, self.min_timeout, self.max_timeout)
+            self.estimators[addr] = estimator
+        return estimator
+
+    def awaken(self, addr):
+        """Return the number of wake up bytes to send before a request to a
+        station, and count them.
+
+        :param str addr: station address
+        """
+        last = self.last_reply.get(addr)
+        if last is None or time.perf_counter() - last > self.idle_gap:
+            if self.preamble:
+                self.counters["preambles"] += 1
+            return self.preamble
+        self.skip_preambles(1)
+        return 0
+
+    def skip_preambles(self, count):
+        """Count the wake up bytes saved by sending frames without the
+        preamble, none when no preamble is configured.
+
+        :param int count: number of frames sent without the preamble
+        """
+        self.counters["preamble_bytes_saved"] += count * len(preamble(self.preamble))
+
+    def mark_active(self, addr):
+        """Record a valid reply from a station."""
+        self.last_reply[addr] = time.perf_counter()
+
+    def mark_error(self, addr):
+        """Record a lost or invalid reply, the next request to the station is
+        sent with the preamble."""
+        self.last_reply.pop(addr, None)
+
+    def set_timeout(self, timeout):
+        """Set the read timeout of the file-like object, if it has one."""
+        if not self.adaptive or not hasattr(self.flo, "timeout"):
+            return
+        timeout = math.ceil(timeout / self.timeout_step) * self.timeout_step
+        if self.flo.timeout != timeout:
+            try:
+                self.flo.timeout = timeout
+            except Exception as e:
+                # e.g. a pty refusing the line settings when the port is reconfigured
+                logger.warning("Cannot change the read timeout, keeping %s s: %s", self.flo.timeout, e)
+                self.adaptive = False
+
+    def request(self, frame, idempotent=True, awaken=None, match=None):
+        """Send a request and return the reply :class:`~dlt645.Frame`, or
+        ``None`` if no valid reply was received.
+
+        :param dlt645.Frame frame: the request
+        :param bool idempotent: whether the request may be sent again when
+            the reply is lost or corrupted (reads, not writes)
+        :param awaken: wake up bytes to send (see :func:`~dlt645.preamble`),
+            by default only when the station is idle or after an error
+        :param match: callable telling whether a reply answers this request,
+            replies that do not match (e.g. late replies to an earlier
+            attempt) are skipped; by default the station address must match
+        """
+        if match is None:
+            match = self._match_addr(frame)
+        estimator = self.estimator(frame.addr)
+        attempts = 1 + (self.retries if idempotent else 0)
+        self.counters["requests"] += 1
+        station = self.station_counters.get(frame.addr)
+        if station is None:
+            station = self.station_counters[frame.addr] = {"requests": 0, "retries": 0, "failures": 0}
+        station["requests"] += 1
+
+        for attempt in range(attempts):
+            if attempt:
+                self.counters["retries"] += 1
+                station["retries"] += 1
+            self.set_timeout(estimator.timeout)
+            start = time.perf_counter()
+            write_frame(self.flo, frame, awaken=self.awaken(frame.addr) if awaken is None else awaken)
+            try:
+                reply = recv_frame(self.flo, self.reader)
+                while reply is not None and not match(reply):
+                    logger.debug("Skipping unmatched reply %s", reply)
+                    reply = recv_frame(self.flo, self.reader)
+            except (FrameChecksumError, FrameFormatError) as e:
+                self.counters["errors"] += 1
+                logger.warning("Invalid reply from %s (attempt %d): %s", frame.addr, attempt + 1, e)
+                self.reader.reset()
+                self.mark_error(frame.addr)
+                continue
+
+            if reply is not None:
+                self.mark_active(frame.addr)
+                if attempt == 0:
+                    # only unambiguous round trips are measured (Karn's algorithm)
+                    estimator.update(time.perf_counter() - start)
+                return reply
+
+            self.counters["timeouts"] += 1
+            estimator.backoff()
+            self.reader.reset()
+            self.mark_error(frame.addr)
+            logger.warning("No reply from %s (attempt %d/%d)", frame.addr, attempt + 1, attempts)
+
+        self.counters["failures"] += 1
+        station["failures"] += 1
+        return None
+
+    @staticmethod
+    def _match_addr(frame):
+        addr = frame.addr
+        if addr is None or addr.lower() == "aaaaaaaaaaaa":
+            return lambda reply: True
+        addr = addr.lower()
+        return lambda reply: reply.addr == addr
+
+    def stats(self):
+        """Return the retry and preamble counters, and the counters and timing
+        estimates per station."""
+        return {
+            "counters": dict(self.counters),
+            "stations": {
+                addr: dict(self.station_counters.get(addr, {}), srtt=est.srtt, rttvar=est.rttvar,
+                           timeout=est.timeout)
+                for addr, est in self.estimators.items()
+            },
+        }
@@ -0,0 +1,317 @@
+"""Transaction latency statistics
+
+Collected by :func:`dlt645.write_frame` / :func:`dlt645.recv_frame` once
+enabled with :func:`dlt645.enable_stats`. When disabled, the only cost left in
+those functions is a test against ``None``.
+
+Usage:
+
+.. code-block:: python
+
+    import dlt645
+
+    stats = dlt645.enable_stats()
+    # ... transactions ...
+    print(stats.snapshot()["by_station"])
+
+"""
+import threading
+import time
+import weakref
+
+from .constants import RESPONSE_CORRECT, STATION
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integer values, HDR style.
+
+    Values are grouped in power-of-two ranges, each range split into
+    ``2 ** precision_bits`` linear buckets, so the relative error of a
+    recorded value is below ``2 ** -precision_bits`` whatever its magnitude.
+    Only the buckets in use are stored.
+
+    :param int precision_bits: number of bits of precision kept
+    """
+
+    def __init__(self, precision_bits=5):
+        self.precision_bits = precision_bits
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """Record a value.
+
+        :param int value: value to record, negative values count as 0
+        """
+        value = max(0, int(value))
+        shift = max(0, value.bit_length() - self.precision_bits - 1)
+        bucket = (value >> shift) << shift
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Return the value below which a percentage of the recorded values
+        fall (bucket lower bound), or ``None`` if the histogram is empty.
+
+        :param float percent: percentage, between 0 and 100
+        """
+        if self.count == 0:
+            return None
+        threshold = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return max(bucket, self.min)
+        return self.max
+
+    def snapshot(self):
+        """Return a summary of the histogram as a dict."""
+        return {
+            "count": self.count,
+            "min": self.min,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class TransactionCounters:
+    """Counters and latency histograms (microseconds) for a group of
+    transactions."""
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.checksum_errors = 0
+        self.format_errors = 0
+        self.timeouts = 0
+        # replies answering no pending request: late replies to timed out
+        # requests or replies to requests recorded by other means
+        self.late_replies = 0
+        self.first_byte = Histogram()
+        self.last_byte = Histogram()
+
+    def snapshot(self):
+        return {
+            "transactions": self.transactions,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "checksum_errors": self.checksum_errors,
+            "format_errors": self.format_errors,
+            "timeouts": self.timeouts,
+            "late_replies": self.late_replies,
+            "first_byte_us": self.first_byte.snapshot(),
+            "last_byte_us": self.last_byte.snapshot(),
+        }
+
+
+def _data_id(frame):
+    """Return the first data bytes of a request in line order, the data
+    identifier its reply starts with."""
+    data = frame.data
+    if not data:
+        return b""
+    data = bytes.fromhex(data) if isinstance(data, str) else bytes(data)
+    return data[::-1][:4]
+
+
+def _answers(request, reply):
+    """Tell whether a reply answers a pending request.
+
+    :param tuple request: (station address, function, data identifier)
+    :param dlt645.Frame reply: the reply
+    """
+    addr, function, data_id = request
+    if reply.control["direction"] != STATION or reply.control["function"] != function:
+        return False
+    if addr is not None:
+        addr = addr.lower()
+        # AA address bytes are wildcards (broadcast and shortened addresses)
+        if not all(addr[i : i + 2] in ("aa", reply.addr[i : i + 2]) for i in range(0, 12, 2)):
+            return False
+    if reply.control["response"] != RESPONSE_CORRECT:
+        return True
+    reply_id = reply.payload_bytes[: len(data_id)]
+    return data_id[: len(reply_id)] == reply_id
+
+
+class TransactionStats:
+    """Per station address and per function code transaction statistics.
+
+    Requests written to a file-like object are kept pending until a reply
+    read from it answers them: same station address, function code and data
+    identifier, so pipelined requests are paired whatever the order of the
+    replies. A timeout completes every request still pending on the
+    file-like object; a reply to one of them arriving later is counted as a
+    late reply, and the latency of a request sent again meanwhile is not
+    recorded since its reply is ambiguous (Karn's algorithm). One instance
+    may be shared by threads driving different ports. The state of a
+    file-like object is dropped along with it (kept until :meth:`reset` when
+    it cannot be weakly referenced). Reads with no request pending at all
+    (e.g. requests written by other means) are only counted in
+    ``unpaired_replies``.
+
+    :param float late_window: seconds during which a reply to a timed out
+        request is still expected
+    """
+
+    def __init__(self, late_window=10.0):
+        self.late_window = late_window
+        self.by_station = {}
+        self.by_function = {}
+        # file-like object -> (pending requests, requests timed out recently)
+        self.ports = weakref.WeakKeyDictionary()
+        self.strong_ports = {}
+        self.unpaired_replies = 0
+        self.lock = threading.Lock()
+
+    def _groups(self, station, function):
+        if station not in self.by_station:
+            self.by_station[station] = TransactionCounters()
+        if function not in self.by_function:
+            self.by_function[function] = TransactionCounters()
+        return self.by_station[station], self.by_function[function]
+
+    def _port(self, flo):
+        """Return the (pending, expired) request lists of a file-like object."""
+        ports = self.ports
+        try:
+            port = ports.get(flo)
+        except TypeError:
+            # not weakly referenceable
+            ports = self.strong_ports
+            port = ports.get(flo)
+        if port is None:
+            port = ports[flo] = ([], [])
+        return port
+
+    def _expired(self, expired, now):
+        expired[:] = [entry for entry in expired if now - entry[0] <= self.late_window]
+        return expired
+
+    def request_sent(self, flo, frame, bytes_out, start=None):
+        """Record a request written to a file-like object.
+
+        :param flo: the file-like object the request was written to
+        :param dlt645.Frame frame: the request
+        :param int bytes_out: number of bytes written, wake up bytes included
+        :param float start: ``time.perf_counter()`` value when the request
+            was written
+        """
+        if start is None:
+            start = time.perf_counter()
+        request = (frame.addr, frame.control["function"], _data_id(frame))
+        with self.lock:
+            pending, expired = self._port(flo)
+            expired = self._expired(expired, start)
+            # a late reply to an earlier attempt would be taken for this one's
+            ambiguous = any(entry[1] == request for entry in expired)
+            pending.append((start, request, bytes_out, ambiguous))
+
+    def reply_received(self, flo, first_byte, last_byte, bytes_in, error=None, reply=None):
+        """Complete the pending request of a file-like object answered by a
+        reply, or the oldest one when the reply could not be decoded.
+
+        :param flo: the file-like object the reply was read from
+        :param float first_byte: ``time.perf_counter()`` value when the first
+            byte of the reply arrived, ``None`` if nothing arrived
+        :param float last_byte: ``time.perf_counter()`` value when the reply
+            ended
+        :param int bytes_in: number of bytes read
+        :param str error: ``"checksum"``, ``"format"`` or ``"timeout"``
+        :param dlt645.Frame reply: the reply, when one was decoded
+        """
+        with self.lock:
+            queue, expired = self._port(flo)
+            entry = None
+            if queue and reply is not None:
+                for index, (_, request, _, _) in enumerate(queue):
+                    if _answers(request, reply):
+                        entry = queue.pop(index)
+                        break
+            elif queue:
+                entry = queue.pop(0)
+
+            if entry is None and reply is not None:
+                # late reply to a timed out request, or reply to a request
+                # written by other means
+                key = (reply.addr, reply.control["function"])
+                expired = self._expired(expired, last_byte)
+                for index, (_, request) in enumerate(expired):
+                    if _answers(request, reply):
+                        del expired[index]
+                        key = request[:2]
+                        break
+                self._record(key, None, None, None, 0, bytes_in, "late")
+                return
+            if entry is None:
+                # nothing pending (e.g. written by other means)
+                if error != "timeout":
+                    self.unpaired_replies += 1
+                return
+
+            start, request, bytes_out, ambiguous = entry
+            if error == "timeout":
+                # nothing more is coming for the requests still in flight
+                for _, other, other_out, _ in queue:
+                    self._record(other[:2], None, None, None, other_out, 0, error)
+                    expired.append((last_byte, other))
+                expired.append((last_byte, request))
+                queue.clear()
+            self._record(request[:2], None if ambiguous else start, first_byte, last_byte, bytes_out, bytes_in,
+                         error)
+
+    def _record(self, key, start, first_byte, last_byte, bytes_out, bytes_in, error):
+        for counters in self._groups(*key):
+            if error == "late":
+                counters.late_replies += 1
+                counters.bytes_in += bytes_in
+                continue
+            counters.transactions += 1
+            counters.bytes_out += bytes_out
+            counters.bytes_in += bytes_in
+            if error == "checksum":
+                counters.checksum_errors += 1
+            elif error == "format":
+                counters.format_errors += 1
+            elif error == "timeout":
+                counters.timeouts += 1
+            if start is not None and error is None:
+                counters.first_byte.record((first_byte - start) * 1e6)
+                counters.last_byte.record((last_byte - start) * 1e6)
+
+    def reset(self):
+        """Drop all the statistics collected so far."""
+        with self.lock:
+            self.by_station = {}
+            self.by_function = {}
+            self.ports = weakref.WeakKeyDictionary()
+            self.strong_ports = {}
+            self.unpaired_replies = 0
+
+    def snapshot(self, station=None):
+        """Return the statistics as a dict.
+
+        :param str station: only return the statistics of this station address
+        """
+        with self.lock:
+            if station is not None:
+                counters = self.by_station.get(station)
+                return counters.snapshot() if counters is not None else None
+            return {
+                "by_station": {k: v.snapshot() for k, v in self.by_station.items()},
+                "by_function": {k: v.snapshot() for k, v in self.by_function.items()},
+                "unpaired_replies": self.unpaired_replies,
+            }
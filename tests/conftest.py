@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The scripts live at the top of the repository, the dlt645 package under dlt645/dlt645
+sys.path[:0] = [ROOT, os.path.join(ROOT, "dlt645", "dlt645")]
+
+
+@pytest.fixture
+def simulator():
+    """Start a Station_Simulator with one meter, stop it after the test."""
+    pytest.importorskip("tty")
+    from Station_Simulator import Simulator
+
+    sim = Simulator(meters=1, settle_time=0.0, seed=1).start()
+    yield sim
+    sim.stop()
+
+
+@pytest.fixture
+def meter_serial(simulator):
+    """Serial port on the simulated meter, without the 8E1 settings a pty refuses to change."""
+    import serial
+
+    ser = serial.Serial(simulator.meter_ports[0], 115200, timeout=0.2)
+    yield ser
+    ser.close()
+
+
+@pytest.fixture
+def meter_control(simulator, monkeypatch):
+    """MeterCalControl connected to the simulated meter."""
+    import serial
+    import Meter_Cal_Control
+
+    monkeypatch.setattr(Meter_Cal_Control, "open_port",
+                        lambda port, baudrate=115200, timeout=2: serial.Serial(port, baudrate, timeout=0.5))
+    meter = Meter_Cal_Control.MeterCalControl(port=simulator.meter_ports[0])
+    yield meter
+    meter.ser.close()
@@ -0,0 +1,24 @@
+import time
+
+from Calibration_Benchmark import Counters, TimedSleep, summarize
+
+
+def test_failed_run_has_no_throughput():
+    steps = {"setpoint": {"wall": 1.0, "serial_io": 0.1, "wait": 0.8, "compute": 0.1, "transactions": 3}}
+    assert summarize(steps, "done", 1, 2.0)["meters_per_hour"] == 1800
+    assert summarize(steps, "failed", 1, 2.0)["meters_per_hour"] is None
+
+
+def test_skip_sleeps_keeps_settle_detection():
+    counters = Counters()
+    with TimedSleep(counters, skip=True) as timed_sleep:
+        start = time.perf_counter()
+        time.sleep(0.2)
+        assert time.perf_counter() - start < 0.1
+
+        settle = timed_sleep.keep(lambda: time.sleep(0.1))
+        start = time.perf_counter()
+        settle()
+        assert time.perf_counter() - start >= 0.1
+    assert time.sleep is timed_sleep.sleep
+    assert counters.wait >= 0.1
@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.fixture
+def slow_simulator():
+    """Simulated bench whose source takes longer to settle than the recipe waits."""
+    pytest.importorskip("tty")
+    from Station_Simulator import Simulator
+
+    sim = Simulator(meters=1, settle_time=10.0, seed=1).start()
+    yield sim
+    sim.stop()
+
+
+def test_setpoint_timeout_fails_the_run(slow_simulator, monkeypatch):
+    import serial
+    import Meter_Cal_Control
+    from Calibration_Control import run_recipe
+    from Power_Supply_Control import PowerSupply
+
+    monkeypatch.setattr(Meter_Cal_Control, "open_port",
+                        lambda port, baudrate=115200, timeout=2: serial.Serial(port, baudrate, timeout=0.5))
+    supply = PowerSupply(slow_simulator.supply_port, timeout=0.2)
+    meter_control = Meter_Cal_Control.MeterCalControl(port=slow_simulator.meter_ports[0])
+    recipe = {"name": "settle", "stop_on_failure": False, "steps": [
+        {"name": "setpoint", "type": "setpoint", "voltage": 220.0, "current": 2.0, "power_factor": 1.0},
+        {"name": "voltage", "type": "calibrate", "quantity": "voltage", "reference": 220.0},
+    ]}
+    try:
+        report = run_recipe(recipe, supply, meter_control, {"mode": "supply", "timeout": 0.3, "interval": 0.05}, {})
+    finally:
+        meter_control.ser.close()
+        supply.close()
+
+    assert report["status"] == "failed"
+    # nothing is calibrated against an unsettled source, even without stop_on_failure
+    assert [step["name"] for step in report["steps"]] == ["setpoint"]
+    assert report["steps"][0]["result"] is None and report["steps"][0]["error"]
@@ -0,0 +1,70 @@
+import asyncio
+import socket
+
+import pytest
+
+import dlt645
+from dlt645 import aio
+from dlt645.constants import DLT645_2007, FUNCTION_CODES, NO_MORE_DATA, RESPONSE_CORRECT, STATION
+from dlt645.exceptions import ReadTimeoutError
+
+ADDR = "000000000001"
+
+
+def reply(function, data=None, addr=ADDR):
+    frame = dlt645.Frame(addr, control={"direction": STATION, "response": RESPONSE_CORRECT, "more": NO_MORE_DATA,
+                                        "function": function})
+    frame.data = data
+    return frame.dump()
+
+
+async def connect():
+    local, remote = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=local)
+    station_reader, station_writer = await asyncio.open_connection(sock=remote)
+    return aio.Connection(reader, writer, timeout=0.2), station_reader, station_writer
+
+
+def test_request_skips_late_replies():
+    async def run():
+        conn, station_reader, station = await connect()
+        read_data = FUNCTION_CODES[DLT645_2007]["READ_DATA"]
+        energy = reply(read_data, "0002597000000000")
+
+        # the station starts answering too late: timeout, the partial frame is dropped
+        station.write(energy[:6])
+        with pytest.raises(ReadTimeoutError):
+            await conn.get_active_energy(ADDR, timeout=0.05)
+        assert conn.frame_reader.buffer == b""
+
+        # the late reply to the energy read is not taken for the address reply
+        station.write(energy + reply(FUNCTION_CODES[DLT645_2007]["READ_ADDR"]))
+        assert await conn.get_addr() == ADDR
+
+        # nor a reply from another station
+        station.write(reply(read_data, "0001000000000000", addr="000000000002") + energy)
+        assert await conn.get_active_energy(ADDR) == 259.7
+        conn.close()
+        station.close()
+
+    asyncio.run(run())
+
+
+def test_pipe_writer_drain_waits_for_resume():
+    async def run():
+        writer = aio.PipeWriter()
+        writer.pause_writing()
+        drained = asyncio.ensure_future(writer.drain())
+        await asyncio.sleep(0)
+        assert not drained.done()
+        writer.resume_writing()
+        await asyncio.wait_for(drained, 1)
+
+        writer.pause_writing()
+        drained = asyncio.ensure_future(writer.drain())
+        await asyncio.sleep(0)
+        writer.connection_lost(None)
+        with pytest.raises(ConnectionResetError):
+            await asyncio.wait_for(drained, 1)
+
+    asyncio.run(run())
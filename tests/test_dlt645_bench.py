@@ -0,0 +1,12 @@
+import importlib
+import sys
+
+
+def test_codec_benchmark_without_tty(monkeypatch):
+    # as on Windows: no tty module
+    monkeypatch.setitem(sys.modules, "tty", None)
+    monkeypatch.delitem(sys.modules, "dlt645.bench", raising=False)
+    bench = importlib.import_module("dlt645.bench")
+    results = bench.codec(number=10)
+    assert set(results) >= {"encode"}
+    assert all(legacy > 0 and current > 0 for legacy, current in results.values())
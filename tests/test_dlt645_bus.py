@@ -0,0 +1,87 @@
+import pytest
+
+import dlt645
+from dlt645.bus import Bus, addr_matches, parse_replies
+from dlt645.constants import DLT645_2007, FUNCTION_CODES, NO_MORE_DATA, RESPONSE_CORRECT, STATION
+
+ADDRESSES = ["000000000001", "000000001201", "000000340007", "000000000099"]
+# address byte values probed by the discovery, every BCD value would take a few seconds
+VALUES = ("00", "01", "07", "12", "34", "56", "99")
+
+
+def addr_reply(addr):
+    control = {"direction": STATION, "response": RESPONSE_CORRECT, "more": NO_MORE_DATA,
+               "function": FUNCTION_CODES[DLT645_2007]["READ_ADDR"]}
+    frame = dlt645.Frame(addr, control=control)
+    frame.data = addr
+    return frame.dump()
+
+
+def test_addr_matches():
+    assert addr_matches("AAAAAAAAAA01", "000000001201")
+    assert addr_matches("aaaaaaaa1201", "000000001201")
+    assert not addr_matches("AAAAAAAAAA17", "000000001201")
+    assert addr_matches("AAAAAAAAAAAA", "123456789012")
+
+
+def test_parse_replies():
+    assert parse_replies(b"", "AAAAAAAAAA01") == (set(), False)
+    replies = b"\xfe\xfe" + addr_reply("000000000001") + addr_reply("000000001201")
+    assert parse_replies(replies, "AAAAAAAAAA01") == ({"000000000001", "000000001201"}, False)
+    # a reply from outside the pattern is ignored
+    assert parse_replies(addr_reply("000000000002"), "AAAAAAAAAA01") == (set(), False)
+    # overlapping replies garble each other
+    collided = bytes(a | b for a, b in zip(addr_reply("000000000001"), addr_reply("000000000099")))
+    assert parse_replies(collided, "AAAAAAAAAAAA")[1]
+    assert parse_replies(addr_reply("000000000001")[:-3], "AAAAAAAAAAAA")[1]  # truncated
+
+
+@pytest.fixture
+def bus_simulator():
+    """Four simulated meters sharing one pty, as on an RS-485 bus."""
+    pytest.importorskip("tty")
+    from Station_Simulator import Simulator
+
+    sim = Simulator(meters=len(ADDRESSES), settle_time=0.0, seed=1, bus=True)
+    for meter, addr in zip(sim.meters, ADDRESSES):
+        meter.station_addr = addr
+    sim.start()
+    yield sim
+    sim.stop()
+
+
+@pytest.fixture
+def bus(bus_simulator):
+    import serial
+
+    ser = serial.Serial(bus_simulator.meter_ports[0], 115200, timeout=0.05)
+    yield Bus(ser)
+    ser.close()
+
+
+def test_bus_discovers_every_station(bus):
+    assert bus.scan(values=VALUES) == sorted(ADDRESSES)
+    assert bus.stations == sorted(ADDRESSES)
+
+
+def test_bus_scan_known_addresses(bus):
+    assert bus.scan(addresses=["000000000001", "000000000002", "000000000099"]) == ["000000000001",
+                                                                                 "000000000099"]
+
+
+def test_bus_request_reaches_each_station(bus, bus_simulator):
+    control = {"direction": 0, "response": RESPONSE_CORRECT, "more": NO_MORE_DATA, "function": 1}
+    bus.stations = list(ADDRESSES)
+    for addr in bus.stations:
+        frame = dlt645.Frame(addr, control=control)
+        frame.data = "D0F8"
+        reply = bus.request(frame)
+        assert reply.addr == addr and reply.u16(2) == 5000  # 50.00 Hz
+    assert set(bus.stats()) == set(ADDRESSES)
+
+
+def test_parse_replies_garbled_reply_before_a_valid_one():
+    garbled = bytearray(addr_reply("000000000099"))
+    garbled[-2] ^= 0xFF
+    # the second reply is found, but the first one was lost in the collision
+    assert parse_replies(bytes(garbled) + addr_reply("000000000001"), "AAAAAAAAAAAA") == ({"000000000001"}, True)
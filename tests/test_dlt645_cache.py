@@ -0,0 +1,47 @@
+import json
+
+from dlt645.cache import AddressCache, cached_addr, validate_addr
+
+ADDR = "000000000001"
+
+
+def test_address_cache_round_trip(tmp_path):
+    path = str(tmp_path / "addresses.json")
+    cache = AddressCache(path)
+    assert cache.get("/dev/ttyUSB0") is None
+    cache.put("/dev/ttyUSB0", ADDR)
+    cache.put("bus", [ADDR, "000000000002"])
+
+    reloaded = AddressCache(path)
+    assert reloaded.get("/dev/ttyUSB0") == ADDR
+    assert reloaded.get("bus") == [ADDR, "000000000002"]
+    reloaded.invalidate("/dev/ttyUSB0")
+    assert AddressCache(path).get("/dev/ttyUSB0") is None
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_address_cache_ignores_unreadable_file(tmp_path):
+    path = tmp_path / "addresses.json"
+    path.write_text("{not json")
+    cache = AddressCache(str(path))
+    assert cache.get("/dev/ttyUSB0") is None
+    cache.put("/dev/ttyUSB0", ADDR)
+    assert json.loads(path.read_text()) == {"/dev/ttyUSB0": ADDR}
+
+
+def test_validate_addr(simulator, meter_serial):
+    addr = simulator.meters[0].station_addr
+    assert validate_addr(meter_serial, addr)
+    assert not validate_addr(meter_serial, "999999999999")
+
+
+def test_cached_addr(simulator, meter_serial, tmp_path):
+    addr = simulator.meters[0].station_addr
+    cache = AddressCache(str(tmp_path / "addresses.json"))
+    # nothing cached: read with a broadcast, then cached
+    assert cached_addr(meter_serial, "fixture1", cache) == addr
+    assert cache.get("fixture1") == addr
+    # a stale address (meter swapped) is replaced
+    cache.put("fixture1", "999999999999")
+    assert cached_addr(meter_serial, "fixture1", cache) == addr
+    assert AddressCache(cache.path).get("fixture1") == addr
@@ -0,0 +1,131 @@
+import os
+import random
+
+import pytest
+
+import dlt645
+from dlt645.constants import DLT645_2007, FUNCTION_CODES, MORE_DATA, RESPONSE_INCORRECT, STATION
+from dlt645.exceptions import FrameChecksumError, FrameFormatError
+
+# active energy request of the dlt645 documentation, as sent on the line
+ENERGY_REQUEST = bytes.fromhex("68 96 63 07 22 00 00 68 11 04 33 33 33 33 d3 16")
+
+
+def test_dump_known_frame():
+    frame = dlt645.Frame("000022076396")
+    frame.data = "00000000"
+    assert frame.dump() == ENERGY_REQUEST
+
+
+def test_load_known_frame():
+    frame = dlt645.Frame()
+    frame.load(bytearray(ENERGY_REQUEST))
+    assert frame.addr == "000022076396"
+    assert frame.control["function"] == FUNCTION_CODES[DLT645_2007]["READ_DATA"]
+    assert frame.data == "00000000"
+    assert frame.payload_bytes == bytes(4)
+
+
+def test_round_trip_random_frames():
+    rng = random.Random(645)
+    for _ in range(200):
+        addr = "".join("%02d" % rng.randrange(100) for _ in range(6))
+        control = {
+            "direction": rng.randrange(2),
+            "response": rng.randrange(2),
+            "more": rng.randrange(2),
+            "function": rng.randrange(32),
+        }
+        payload = bytes(rng.randrange(256) for _ in range(rng.randrange(0, 201)))
+        frame = dlt645.Frame(addr, control=dict(control))
+        frame.data = payload[::-1].hex()  # most significant byte first
+
+        loaded = dlt645.Frame()
+        loaded.load(bytearray(frame.dump()))
+        assert loaded.addr == addr
+        assert loaded.control == control
+        assert loaded.payload_bytes == payload
+        assert loaded.length == len(payload)
+        assert loaded.data == payload[::-1].hex()
+        if len(payload) >= 2:
+            assert loaded.u16(0) == int.from_bytes(payload[:2], "little")
+        assert loaded.dump() == frame.dump()
+
+
+def test_bytes_data_is_line_order():
+    frame = dlt645.Frame("000000000001")
+    frame.data = bytes([0x12, 0x34])
+    loaded = dlt645.Frame()
+    loaded.load(bytearray(frame.dump()))
+    assert loaded.data == "1234"
+    assert loaded.payload_bytes == bytes([0x34, 0x12])
+    with pytest.raises(IndexError):
+        loaded.u16(1)
+
+
+def test_load_rejects_corrupted_frames():
+    with pytest.raises(FrameChecksumError):
+        dlt645.Frame().load(bytearray(ENERGY_REQUEST[:-2] + b"\x00\x16"))
+    with pytest.raises(FrameFormatError):
+        dlt645.Frame().load(bytearray(ENERGY_REQUEST[:-1] + b"\x00"))
+
+
+def test_frame_reader_any_chunk_size():
+    frames = []
+    for i in range(5):
+        frame = dlt645.Frame("%012d" % (i + 1), control={"direction": STATION, "response": RESPONSE_INCORRECT,
+                                                         "more": MORE_DATA, "function": 1})
+        frame.data = os.urandom(i * 7).hex()
+        frames.append(frame)
+    stream = b"".join(dlt645.preamble(i) + frame.dump() for i, frame in enumerate(frames))
+
+    for chunk_size in (1, 3, 16, len(stream)):
+        reader = dlt645.FrameReader()
+        received = []
+        for start in range(0, len(stream), chunk_size):
+            frame = reader.feed(stream[start:start + chunk_size])
+            while frame is not None:
+                received.append(frame)
+                frame = reader.next_frame()
+        assert [f.dump() for f in received] == [f.dump() for f in frames]
+        assert reader.needed() == 1
+
+
+def test_frame_reader_skips_leading_noise():
+    reader = dlt645.FrameReader()
+    frame = reader.feed(b"\x00\x12\xfe\xfe" + ENERGY_REQUEST)
+    assert frame.dump() == ENERGY_REQUEST
+    assert not reader.buffer
+
+
+def test_frame_reader_skips_stray_start_byte():
+    reader = dlt645.FrameReader()
+    # a 0x68 without the second start byte of a header, whose "length" would be 0xff
+    assert reader.feed(b"\x68\x01\x02\xff") is None
+    assert reader.needed() == 6  # waiting for a header, not for 0xff data bytes
+    frame = reader.feed(ENERGY_REQUEST)
+    assert frame.dump() == ENERGY_REQUEST
+    assert not reader.buffer
+
+    reader = dlt645.FrameReader()
+    reader.feed(b"\x68\x00\x00\x00\x00\x00\x00\x11\x00\xf0")
+    assert reader.needed() == 1  # nothing plausible left
+
+
+def test_frame_reader_corrupted_frame_followed_by_good_one():
+    corrupted = ENERGY_REQUEST[:-2] + b"\x00\x16"
+    reader = dlt645.FrameReader()
+    frame = reader.feed(corrupted + ENERGY_REQUEST)
+    assert frame.dump() == ENERGY_REQUEST
+    assert not reader.buffer
+
+    # alone in the buffer, the corrupted frame is reported
+    reader = dlt645.FrameReader()
+    with pytest.raises(FrameChecksumError):
+        reader.feed(corrupted)
+    # and the good frame arriving next is still found
+    assert reader.feed(ENERGY_REQUEST).dump() == ENERGY_REQUEST
+
+    reader = dlt645.FrameReader()
+    with pytest.raises(FrameFormatError):
+        reader.feed(ENERGY_REQUEST[:-1] + b"\x00")
@@ -0,0 +1,59 @@
+import asyncio
+import os
+
+import pytest
+
+import dlt645
+from dlt645.exceptions import FrameFormatError, ResponseError
+from dlt645.session import Session
+
+DATA_ID = 0x06010001  # a load profile, longer than one frame
+BLOCK = bytes(range(256)) * 3 + bytes(232)  # 1000 bytes, 195 per frame
+
+
+@pytest.fixture
+def block_meter(simulator):
+    meter = simulator.meters[0]
+    meter.blocks[DATA_ID] = BLOCK
+    return meter
+
+
+def test_read_data_stream_follow_up_frames(block_meter, meter_serial):
+    chunks = list(dlt645.read_data_stream(meter_serial, block_meter.station_addr, DATA_ID))
+    assert [len(chunk) for chunk in chunks] == [195] * 5 + [25]
+    assert b"".join(chunks) == BLOCK
+
+
+def test_read_data_through_a_session(block_meter, meter_serial):
+    session = Session(meter_serial)
+    assert dlt645.read_data(meter_serial, block_meter.station_addr, DATA_ID, request=session.request) == BLOCK
+    assert session.counters["requests"] == 6 and session.counters["failures"] == 0
+
+
+def test_read_data_stream_frame_limit(block_meter, meter_serial):
+    with pytest.raises(FrameFormatError, match="not complete"):
+        list(dlt645.read_data_stream(meter_serial, block_meter.station_addr, DATA_ID, max_frames=3))
+
+
+def test_read_data_error_response(block_meter, meter_serial):
+    with pytest.raises(ResponseError):
+        dlt645.read_data(meter_serial, block_meter.station_addr, 0x06010002)
+
+
+def test_aio_read_data(block_meter, simulator):
+    from dlt645 import aio
+
+    async def run():
+        fd = os.open(simulator.meter_ports[0], os.O_RDWR | os.O_NOCTTY)
+        conn = await aio.open_fd(fd, timeout=1.0)
+        try:
+            chunks = [chunk async for chunk in conn.read_data_stream(block_meter.station_addr, DATA_ID)]
+            with pytest.raises(ResponseError):
+                await conn.read_data(block_meter.station_addr, 0x06010002)
+        finally:
+            conn.close()
+            os.close(fd)
+        return chunks
+
+    chunks = asyncio.run(run())
+    assert len(chunks) == 6 and b"".join(chunks) == BLOCK
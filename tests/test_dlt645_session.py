@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+import dlt645
+from dlt645.constants import DLT645_1997, FUNCTION_CODES, MAIN, NO_MORE_DATA, RESPONSE_CORRECT, STATION
+from dlt645.session import RttEstimator, Session
+
+ADDR = "000000000001"
+
+
+def frame(direction, data):
+    control = {"direction": direction, "response": RESPONSE_CORRECT, "more": NO_MORE_DATA,
+               "function": FUNCTION_CODES[DLT645_1997]["READ_DATA"]}
+    result = dlt645.Frame(ADDR, control=control)
+    result.data = data
+    return result
+
+
+class Line(io.BytesIO):
+    """File-like object answering each request with the next scripted reply, None to drop it."""
+
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = list(replies)
+        self.timeout = 1.0
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        answer = self.replies.pop(0)
+        if answer is not None:
+            position = self.tell()
+            self.seek(0, io.SEEK_END)
+            super().write(answer)
+            self.seek(position)
+        return len(data)
+
+
+def test_rtt_estimator():
+    estimator = RttEstimator(initial=1.0, min_timeout=0.05, max_timeout=2.0)
+    assert estimator.timeout == 1.0
+    estimator.update(0.1)
+    assert estimator.srtt == 0.1 and estimator.rttvar == 0.05
+    assert estimator.timeout == pytest.approx(0.1 + 4 * 0.05)
+    for _ in range(50):
+        estimator.update(0.001)
+    assert estimator.timeout == 0.05  # lower bound
+
+
+def test_rtt_estimator_backoff():
+    estimator = RttEstimator(initial=0.3, max_timeout=2.0)
+    timeouts = []
+    for _ in range(5):
+        estimator.backoff()
+        timeouts.append(estimator.timeout)
+    assert timeouts == pytest.approx([0.6, 1.2, 2.0, 2.0, 2.0])
+
+
+def test_session_retries_lost_reply():
+    reply = frame(STATION, "1234D0D9").dump()
+    line = Line([None, reply])
+    session = Session(line, retries=2, initial_timeout=0.5)
+    result = session.request(frame(MAIN, "D0D9"))
+    assert result is not None and result.u16(2) == 0x1234
+    assert session.counters["retries"] == 1 and session.counters["timeouts"] == 1
+    # the timeout doubled after the loss, the retried round trip is not measured
+    assert session.estimator(ADDR).timeout == 1.0
+    assert session.estimator(ADDR).srtt is None
+    assert line.timeout == 1.0
+
+
+def test_session_write_not_retried():
+    line = Line([None, None])
+    session = Session(line, retries=2)
+    assert session.request(frame(MAIN, "D0D9"), idempotent=False) is None
+    assert len(line.writes) == 1
+    assert session.stats()["stations"][ADDR]["failures"] == 1
+
+
+def test_session_skips_unmatched_reply():
+    stale = frame(STATION, "0001D0DA").dump()
+    line = Line([stale + frame(STATION, "0002D0D9").dump()])
+    session = Session(line)
+    match = lambda reply: reply.u16(0) == 0xD0D9
+    assert session.request(frame(MAIN, "D0D9"), match=match).u16(2) == 2
+
+
+@pytest.mark.parametrize("configured, saved", [(4, 4), (True, 4), (0, 0), (False, 0)])
+def test_preamble_bytes_saved(configured, saved):
+    reply = frame(STATION, "0001D0D9").dump()
+    line = Line([reply, reply])
+    session = Session(line, preamble=configured, idle_gap=60)
+    session.request(frame(MAIN, "D0D9"))
+    session.request(frame(MAIN, "D0D9"))
+    assert line.writes[1] == frame(MAIN, "D0D9").dump()
+    assert session.counters["preamble_bytes_saved"] == saved
+    assert session.counters["preambles"] == (1 if saved else 0)
+    session.skip_preambles(3)
+    assert session.counters["preamble_bytes_saved"] == 4 * saved
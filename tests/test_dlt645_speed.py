@@ -0,0 +1,140 @@
+import io
+import logging
+
+import dlt645
+from dlt645.constants import (
+    DLT645_1997,
+    DLT645_2007,
+    FUNCTION_CODES,
+    NO_MORE_DATA,
+    RESPONSE_CORRECT,
+    SPEED_CODES,
+    STATION,
+)
+
+ADDR = "000000000001"
+SET_SPEED = FUNCTION_CODES[DLT645_2007]["SET_SPEED"]
+READ_ADDR = FUNCTION_CODES[DLT645_2007]["READ_ADDR"]
+
+
+class Port(io.BytesIO):
+    """Serial port to a station switching to the rates it supports; a neighbour at
+    NEIGHBOUR answers the broadcast read address requests too. The station's
+    replies sent at a ``silent`` rate are lost."""
+
+    NEIGHBOUR = "000000000002"
+
+    def __init__(self, baudrate, supported, reachable=True, silent=(), compat=DLT645_2007):
+        super().__init__()
+        self.baudrate = baudrate
+        self.station_rate = baudrate
+        self.supported = supported
+        self.reachable = reachable
+        self.silent = silent
+        self.functions = FUNCTION_CODES[compat]
+        self.requests = []
+
+    def reset_input_buffer(self):
+        self.seek(0, io.SEEK_END)
+
+    def reply(self, addr, function, data=None):
+        frame = dlt645.Frame(addr, control={"direction": STATION, "response": RESPONSE_CORRECT,
+                                            "more": NO_MORE_DATA, "function": function})
+        if data is not None:
+            frame.data = data
+        if self.station_rate in self.silent:
+            return
+        position = self.tell()
+        self.seek(0, io.SEEK_END)
+        super().write(frame.dump())
+        self.seek(position)
+
+    def write(self, data):
+        request = dlt645.FrameReader().feed(bytes(data))
+        self.requests.append((self.baudrate, request))
+        function = request.control["function"]
+        if self.baudrate != self.station_rate:
+            return len(data)
+        if function == self.functions["SET_SPEED"]:
+            code = request.payload_bytes[0]
+            rate = next(rate for rate, value in SPEED_CODES.items() if value == code)
+            if rate in self.supported:
+                self.reply(ADDR, function, "%02X" % code)
+                self.station_rate = rate
+        elif function == self.functions["READ_DATA"]:
+            if request.addr.lower() == ADDR and self.reachable:
+                self.reply(ADDR, function, request.data)
+        elif function == self.functions.get("READ_ADDR"):
+            if request.addr.lower() == "aaaaaaaaaaaa":
+                self.reply(self.NEIGHBOUR, READ_ADDR, self.NEIGHBOUR)
+            if request.addr.lower() in (ADDR, "aaaaaaaaaaaa") and self.reachable:
+                self.reply(ADDR, READ_ADDR, ADDR)
+        return len(data)
+
+
+def test_negotiate_speed_first_accepted():
+    port = Port(2400, supported=(9600,))
+    assert dlt645.negotiate_speed(port, ADDR, [19200, 9600], switch_delay=0) == 9600
+    assert port.baudrate == 9600
+    # the new rate is confirmed by the station itself, not by a broadcast
+    rate, verify = port.requests[-1]
+    assert rate == 9600 and verify.control["function"] == READ_ADDR and verify.addr == ADDR
+
+
+def test_negotiate_speed_skips_slower_rates():
+    port = Port(9600, supported=(2400, 9600))
+    assert dlt645.negotiate_speed(port, ADDR, [19200, 2400, 9600], switch_delay=0) == 9600
+    # only 19200 is requested (refused), never a downgrade to 2400
+    assert [request.control["function"] for _, request in port.requests] == [SET_SPEED]
+    assert port.baudrate == 9600
+
+
+def test_negotiate_speed_unverified_link():
+    port = Port(2400, supported=(9600,), reachable=False)
+    # the neighbour still answers broadcasts at the new rate, which must not count
+    assert dlt645.negotiate_speed(port, ADDR, 9600, switch_delay=0) == 2400
+    assert port.baudrate == 2400
+
+
+def test_negotiate_speed_replies_lost_at_new_rate():
+    port = Port(2400, supported=(2400, 9600), silent=(9600,))
+    assert dlt645.negotiate_speed(port, ADDR, [9600], switch_delay=0) == 2400
+    # the station was asked back to 2400 at 9600, where it still listens
+    assert (9600, "%02X" % SPEED_CODES[2400]) in [
+        (rate, request.data) for rate, request in port.requests if request.control["function"] == SET_SPEED
+    ]
+    assert port.baudrate == port.station_rate == 2400
+
+
+def test_negotiate_speed_station_stays_at_new_rate():
+    # first verify reply lost, the station refuses to go back
+    port = Port(2400, supported=(9600,))
+    write = port.write
+    lost = []
+
+    def write_once_lost(data):
+        request = dlt645.FrameReader().feed(bytes(data))
+        if request.control["function"] == READ_ADDR and not lost:
+            lost.append(request)
+            port.requests.append((port.baudrate, request))
+            return len(data)
+        return write(data)
+
+    port.write = write_once_lost
+    assert dlt645.negotiate_speed(port, ADDR, 9600, switch_delay=0) == 9600
+    assert port.baudrate == port.station_rate == 9600
+
+
+def test_negotiate_speed_1997():
+    port = Port(2400, supported=(9600,), compat=DLT645_1997)
+    assert dlt645.negotiate_speed(port, ADDR, 9600, compat=DLT645_1997, switch_delay=0) == 9600
+    rate, verify = port.requests[-1]
+    assert verify.control["function"] == FUNCTION_CODES[DLT645_1997]["READ_DATA"] and verify.addr == ADDR
+
+
+def test_negotiate_speed_no_faster_target(caplog):
+    port = Port(115200, supported=(9600, 19200))
+    with caplog.at_level(logging.WARNING, logger="dlt645"):
+        assert dlt645.negotiate_speed(port, ADDR, sorted(SPEED_CODES), switch_delay=0) == 115200
+    assert "No target rate above 115200" in caplog.text
+    assert port.requests == []
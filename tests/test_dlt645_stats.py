@@ -0,0 +1,133 @@
+import io
+
+import dlt645
+from dlt645.constants import DLT645_1997, FUNCTION_CODES, MAIN, NO_MORE_DATA, RESPONSE_CORRECT, STATION
+from dlt645.stats import Histogram, TransactionStats
+
+ADDR = "000000000001"
+READ = FUNCTION_CODES[DLT645_1997]["READ_DATA"]
+
+
+def frame(direction, data, addr=ADDR):
+    control = {"direction": direction, "response": RESPONSE_CORRECT, "more": NO_MORE_DATA, "function": READ}
+    request = dlt645.Frame(addr, control=control)
+    request.data = data
+    loaded = dlt645.Frame()
+    loaded.load(bytearray(request.dump()))
+    return loaded
+
+
+def request(data_id, addr=ADDR):
+    return frame(MAIN, "%04X" % data_id, addr)
+
+
+def reply(data_id, value=0, addr=ADDR):
+    return frame(STATION, "%04X%04X" % (value, data_id), addr)
+
+
+def test_histogram_percentiles():
+    histogram = Histogram(precision_bits=5)
+    for value in range(1, 1001):
+        histogram.record(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 1000 and snapshot["min"] == 1 and snapshot["max"] == 1000
+    assert snapshot["mean"] == 500.5
+    for percent in (50, 90, 99):
+        # bucket lower bound, within the relative precision
+        assert percent * 10 * (1 - 2 ** -5) <= histogram.percentile(percent) <= percent * 10
+    assert Histogram().percentile(50) is None
+
+
+def test_pipelined_replies_paired_by_data_identifier():
+    stats = TransactionStats()
+    flo = object()
+    stats.request_sent(flo, request(0xD0D9), 20, start=0.0)
+    stats.request_sent(flo, request(0xD0DA), 16, start=0.0)
+    # replies out of order: each one completes its own request
+    stats.reply_received(flo, 0.002, 0.003, 18, reply=reply(0xD0DA))
+    stats.reply_received(flo, 0.001, 0.004, 18, reply=reply(0xD0D9))
+    station = stats.snapshot(ADDR)
+    assert station["transactions"] == 2 and station["bytes_out"] == 36 and station["late_replies"] == 0
+    assert stats._port(flo)[0] == []
+    assert station["last_byte_us"]["min"] == 3000 and station["last_byte_us"]["max"] == 4000
+
+
+def test_late_reply_after_retry():
+    stats = TransactionStats()
+    flo = object()
+    stats.request_sent(flo, request(0xD0D9), 20, start=0.0)
+    stats.reply_received(flo, None, 0.5, 0, error="timeout")
+    # sent again: which attempt the next reply answers is ambiguous, no latency is recorded
+    stats.request_sent(flo, request(0xD0D9), 20, start=0.5)
+    stats.reply_received(flo, 0.6, 0.6, 18, reply=reply(0xD0D9))
+    stats.reply_received(flo, 0.7, 0.7, 18, reply=reply(0xD0D9))
+    # a reply of another station never completes this station's request
+    stats.request_sent(flo, request(0xD0DA), 16, start=1.0)
+    stats.reply_received(flo, 1.1, 1.1, 18, reply=reply(0xD0DA, addr="000000000002"))
+    stats.reply_received(flo, 1.2, 1.2, 18, reply=reply(0xD0DA))
+
+    station = stats.snapshot(ADDR)
+    assert station["timeouts"] == 1 and station["transactions"] == 3 and station["late_replies"] == 1
+    assert station["last_byte_us"]["count"] == 1
+    assert 199000 <= station["last_byte_us"]["max"] <= 200000
+    assert stats.snapshot("000000000002")["late_replies"] == 1
+
+
+class Loopback(io.BytesIO):
+    """File-like object answering every request with queued replies."""
+
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = replies
+
+    def write(self, data):
+        if self.replies:
+            position = self.tell()
+            self.seek(0, io.SEEK_END)
+            super().write(self.replies.pop(0))
+            self.seek(position)
+        return len(data)
+
+
+def test_scan_leaves_no_pending_request():
+    from dlt645.bus import probe
+
+    stats = dlt645.enable_stats(TransactionStats())
+    try:
+        flo = Loopback([frame(STATION, "%012d" % 1).dump(), reply(0xD0D9).dump()])
+        assert probe(flo, "aaaaaaaaaa01") == ({ADDR}, False)
+        assert stats._port(flo)[0] == []
+
+        dlt645.write_frame(flo, request(0xD0D9))
+        assert dlt645.recv_frame(flo) is not None
+        station = stats.snapshot(ADDR)
+        assert station["transactions"] == 1 and station["late_replies"] == 0
+    finally:
+        dlt645.disable_stats()
+
+
+class Port(io.BytesIO):
+    """Weakly referenceable file-like object."""
+
+
+def test_port_state_dropped_with_the_port():
+    import gc
+
+    stats = TransactionStats()
+    flo = Port()
+    stats.request_sent(flo, request(0xD0D9), 20, start=0.0)
+    assert len(stats.ports) == 1
+    del flo
+    gc.collect()
+    # a new port, even one reusing the id, does not inherit the pending request
+    assert len(stats.ports) == 0
+
+
+def test_unpaired_replies_counted_apart():
+    stats = TransactionStats()
+    flo = object()
+    stats.reply_received(flo, 0.001, 0.002, 18, error="checksum")
+    stats.reply_received(flo, None, 0.5, 0, error="timeout")
+    snapshot = stats.snapshot()
+    assert snapshot["unpaired_replies"] == 1
+    assert snapshot["by_station"] == {} and snapshot["by_function"] == {}
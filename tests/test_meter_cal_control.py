@@ -0,0 +1,161 @@
+import pytest
+
+from Meter_Cal_Control import (decode_pair, decode_register, is_cacheable, live_registers, register_id,
+                               register_key, register_labels, registers, signed16, summarize_samples)
+
+
+def test_register_catalogue_decoders():
+    # voltage: 0.01 V per MSB unit, the top byte of the LSB register adds 1/256 of it
+    assert decode_pair(0x00D9, 0x00E9, 22000, 0x8000) == pytest.approx(220.005)
+    assert decode_pair(0x00B0, 0x00C0, 100, 0x0000) == 400  # total power, 4 W per unit
+    assert decode_register(0x00F8, 5000) == pytest.approx(50.0)
+    assert decode_register(0x0061, 0x1234) == 0x1234  # configuration registers stay raw
+    assert decode_register(0x0030, 0x1234) == 0x1234  # and so do unlisted ones
+    with pytest.raises(KeyError):
+        decode_pair(0x00D9, 0x00EA, 0, 0)
+
+
+def test_register_catalogue_keys_and_labels():
+    assert register_key(0x00D9) == (0x00D9, 0x00E9)
+    assert register_key(0x00F8) == 0x00F8
+    assert register_key(0x0030) == 0x0030
+    assert register_labels[(0x00DD, 0x00ED)] == "Current R Phase"
+    assert register_labels[0x0061] == "Voltage Gain R_phase"
+    assert registers[0x00D9].name == "voltage_R" and registers[0x00D9].unit == "V"
+    assert register_id(0x00D9) == 0xD0D9 and register_id(0x0070) == 0xE070
+    assert signed16(0xFFFF) == -1 and signed16(0x7FFF) == 0x7FFF
+
+
+def test_live_registers_are_never_cached():
+    # measurements, their LSB registers and checksums are live, gains are not
+    assert {0x00D9, 0x00E9, 0x00F8, 0x003B} <= live_registers
+    assert 0x0061 not in live_registers
+    assert not is_cacheable(0x00E9) and is_cacheable(0x0061)
+
+
+def test_read_registers_batch(simulator, meter_control):
+    meter = simulator.meters[0]
+    simulator.supply.set_target(220.0, 2.0, 0.0)
+    meter.write(0x0030, 0x1234)
+
+    keys = [register_key(0x00D9), register_key(0x00DD), 0x0030, 0x00F8]
+    values = meter_control.read_registers(keys)
+
+    assert values[register_key(0x00D9)] == pytest.approx(220.0 * meter.errors["voltage"][0], abs=0.01)
+    assert values[register_key(0x00DD)] == pytest.approx(2.0 * meter.errors["current"][0], abs=0.001)
+    assert values[0x0030] == 0x1234
+    assert values[0x00F8] == pytest.approx(50.0)
+    # the whole batch went out pipelined, no register needed a single read
+    assert meter_control.session.counters["requests"] == 0
+
+
+def test_read_registers_small_window(simulator, meter_control):
+    for addr in range(0x0030, 0x0038):
+        simulator.meters[0].write(addr, addr)
+    values = meter_control.read_registers(list(range(0x0030, 0x0038)), window=3)
+    assert values == {addr: addr for addr in range(0x0030, 0x0038)}
+
+
+def test_register_shadow_serves_configuration_registers(simulator, meter_control):
+    from Meter_Cal_Control import RegisterShadow
+
+    meter = simulator.meters[0]
+    shadow = meter_control.shadow = RegisterShadow()
+    meter_control.write_meter_data(0x0030, 0x5678)
+    assert meter.registers[0x0030] == 0x5678
+
+    # changed behind the shadow's back: the shadowed value is served without a round trip
+    meter.write(0x0030, 0x1111)
+    assert meter_control.read_registers([0x0030]) == {0x0030: 0x5678}
+    assert shadow.stats()["hits"] == 1
+
+    shadow.invalidate(meter_control.station_addr, 0x0030)
+    assert meter_control.read_registers([0x0030]) == {0x0030: 0x1111}
+
+
+def test_register_shadow_skips_live_registers(simulator, meter_control):
+    from Meter_Cal_Control import RegisterShadow, is_cacheable
+
+    shadow = meter_control.shadow = RegisterShadow()
+    assert not is_cacheable(0x00D9) and not is_cacheable(0x00E9) and not is_cacheable(0x003B)
+    meter_control.read_registers([register_key(0x00D9), 0x003B])
+    assert shadow.values == {}
+
+
+def test_register_shadow_expiry():
+    from Meter_Cal_Control import RegisterShadow
+
+    shadow = RegisterShadow(max_age=-1)
+    shadow.put("000000000001", 0x0030, 1)
+    assert shadow.get("000000000001", 0x0030) is None
+    shadow.max_age = 30
+    assert shadow.get("000000000001", 0x0030) == 1
+    shadow.invalidate("000000000001")
+    assert shadow.get("000000000001", 0x0030) is None
+
+
+def test_solve_phases_converges(simulator, meter_control):
+    simulator.supply.set_target(220.0, 5.0, 0.0)
+    results = meter_control.solve_phases("voltage", 220.0, tolerance=0.001, settle=0)
+
+    assert [result["name"] for result in results] == ["gain 0061", "gain 0065", "gain 0069"]
+    assert all(result["converged"] and result["iterations"] >= 1 for result in results)
+    values = meter_control.read_registers([register_key(addr) for addr in (0x00D9, 0x00DA, 0x00DB)])
+    assert all(value == pytest.approx(220.0, rel=0.001) for value in values.values())
+
+
+def test_solve_gains_iteration_cap(simulator, meter_control):
+    simulator.supply.set_target(220.0, 5.0, 0.0)
+    corrections = []
+    # a correction that never moves the measurement
+    loop = ("stuck", register_key(0x00D9), lambda measured: 0.5, corrections.append)
+    [result] = meter_control.solve_gains([loop], tolerance=0.001, max_iterations=3, settle=0)
+
+    assert result["iterations"] == 3 and len(corrections) == 3
+    assert not result["converged"] and result["error"] == 0.5
+
+
+def test_solve_gains_loop_min_tolerance(simulator, meter_control):
+    simulator.supply.set_target(220.0, 5.0, 0.0)
+    corrections = []
+    loop = ("coarse", register_key(0x00D9), lambda measured: 0.002, corrections.append, 0.003)
+    [result] = meter_control.solve_gains([loop], tolerance=0.001, settle=0)
+
+    assert result["converged"] and result["tolerance"] == 0.003 and not corrections
+
+
+def test_phaseangle_loop_register_step(meter_control):
+    *_, min_tolerance = meter_control.phaseangle_loop(0x0048, 60.0)
+    # one 0.1 degree register step near PF 0.5
+    assert min_tolerance == pytest.approx(0.003, abs=0.0002)
+
+
+def test_solve_phases_unknown_quantity(meter_control):
+    with pytest.raises(ValueError):
+        meter_control.solve_phases("energy", 1.0)
+
+
+def test_summarize_samples():
+    summary = summarize_samples([1.0, 2.0, 3.0, 4.0, 100.0], trim=0.2)
+    assert summary["count"] == 5
+    assert summary["mean"] == pytest.approx(22.0)
+    assert summary["median"] == 3.0
+    assert summary["trimmed_mean"] == pytest.approx(3.0)  # the outlier is dropped
+    assert summarize_samples([5.0])["std"] == 0.0
+
+
+def test_sample_registers_stops_early(simulator, meter_control):
+    simulator.supply.set_target(220.0, 5.0, 0.0)
+    voltage = register_key(0x00D9)
+    stats = meter_control.sample_registers([voltage], samples=10, interval=0, precision=0.001, min_samples=3)
+    # noiseless readings are within the precision as soon as the minimum is taken
+    assert stats[voltage]["count"] == 3
+
+
+def test_sample_registers_takes_every_sample_when_noisy(simulator, meter_control):
+    simulator.supply.set_target(220.0, 5.0, 0.0)
+    simulator.meters[0].noise = 0.01
+    voltage = register_key(0x00D9)
+    stats = meter_control.sample_registers([voltage], samples=6, interval=0, precision=1e-6)
+    assert stats[voltage]["count"] == 6
+    assert stats[voltage]["std"] > 0
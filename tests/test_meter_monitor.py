@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+from Meter_Monitor import Monitor, RingBuffer
+
+
+def test_ring_buffer_wraps():
+    buffer = RingBuffer(3)
+    for n in range(5):
+        buffer.append(float(n), None if n == 3 else n * 10.0)
+    times, values = buffer.window()
+    assert list(times) == [2.0, 3.0, 4.0]
+    assert values[0] == 20.0 and values[1] != values[1] and values[2] == 40.0  # NaN for a missing reading
+    assert list(buffer.window(last=1)[0]) == [4.0]
+
+
+def test_monitor_survives_failed_cycles(simulator, meter_control, monkeypatch):
+    read_registers = meter_control.read_registers
+    failures = [OSError("port unplugged")] * 2
+
+    def flaky(registers):
+        if failures:
+            raise failures.pop()
+        return read_registers(registers)
+
+    monkeypatch.setattr(meter_control, "read_registers", flaky)
+    monitor = Monitor(meter_control, {"frequency": 0x00F8}, retry_delay=0.01).start()
+    try:
+        deadline = time.monotonic() + 5
+        while monitor.total_cycles < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert monitor.thread.is_alive()
+    finally:
+        monitor.stop()
+
+    rate = monitor.rate()
+    assert rate["poll_errors"] == 2 and "port unplugged" in rate["last_error"]
+    assert rate["cycles"] >= 3
+    assert monitor.window(last=1)["frequency"][1][0] == pytest.approx(50.0)
@@ -0,0 +1,40 @@
+import pytest
+
+from Multi_Station_Control import run_stations
+
+
+def test_run_stations_without_stations():
+    with pytest.raises(ValueError, match="No station"):
+        run_stations(None, [], {}, {})
+
+
+def test_set_supply_timeout_fails_stations():
+    pytest.importorskip("tty")
+    from Multi_Station_Control import Station, set_supply
+    from Power_Supply_Control import PowerSupply
+    from Station_Simulator import Simulator
+
+    simulator = Simulator(meters=0, settle_time=10.0).start()
+    supply = PowerSupply(simulator.supply_port, timeout=0.2)
+    try:
+        stations = [Station("meter1"), Station("meter2")]
+        set_supply(supply, stations, {"mode": "supply", "timeout": 0.3, "interval": 0.05}, 220.0, 2.0, 1)
+        assert [station.result["status"] for station in stations] == ["failed", "failed"]
+        assert stations[0].result["error"].startswith("setpoint")
+    finally:
+        supply.close()
+        simulator.stop()
+
+
+def test_set_supply_skipped_without_active_station():
+    from Multi_Station_Control import Station, set_supply
+
+    class Supply:
+        def set_voltage_and_current_Powerfactor(self, **setpoint):
+            raise AssertionError("the source is not driven for failed stations")
+
+    stations = [Station("meter1"), Station("meter2")]
+    for station in stations:
+        station.result["status"] = "failed"
+    set_supply(Supply(), stations, {"mode": "supply"}, 220.0, 2.0, 1)
+    assert [station.result["error"] for station in stations] == [None, None]
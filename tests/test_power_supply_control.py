@@ -0,0 +1,151 @@
+import pytest
+
+from Power_Supply_Control import crc16_modbus, encode_frame, golden_frames, power_factor_to_angle
+
+
+@pytest.mark.parametrize("setpoint", list(golden_frames))
+def test_encode_frame_matches_golden_frames(setpoint):
+    assert encode_frame(*setpoint) == bytes.fromhex(golden_frames[setpoint])
+
+
+def test_golden_frames_crc():
+    for expected in golden_frames.values():
+        body = bytes.fromhex(expected)[5:]
+        assert crc16_modbus(body[:-2]).to_bytes(2, "little") == body[-2:]
+
+
+def test_power_factor_to_angle():
+    assert power_factor_to_angle("0.5L") == 60.0
+    assert power_factor_to_angle(0) == pytest.approx(90.0)
+    assert power_factor_to_angle("0.6C") == pytest.approx(360.0 - 53.13, abs=0.01)
+    with pytest.raises(ValueError):
+        power_factor_to_angle(1.5)
+
+
+def test_zero_power_factor_encodes_90_degrees():
+    frame = encode_frame(0, 0, 0)
+    assert frame[32:38] == bytes.fromhex("23 28 23 28 23 28")
+
+
+def test_wait_until_settled(simulator):
+    from Power_Supply_Control import PowerSupply
+
+    supply = PowerSupply(simulator.supply_port, timeout=0.2)
+    try:
+        settled = (220.0,) * 3 + (2.0,) * 3
+        elapsed = supply.wait_until_settled((220.0, 2.0), interval=0.01, read_values=lambda: settled)
+        assert elapsed < 1.0
+        assert supply.settle_times == [elapsed]
+    finally:
+        supply.close()
+
+
+def test_wait_until_settled_timeout(simulator):
+    from Power_Supply_Control import PowerSupply, SettleTimeoutError
+
+    supply = PowerSupply(simulator.supply_port, timeout=0.2)
+    try:
+        with pytest.raises(SettleTimeoutError):
+            supply.wait_until_settled((220.0, 2.0), timeout=0.1, interval=0.01,
+                                      read_values=lambda: (200.0,) * 3 + (2.0,) * 3)
+        assert supply.settle_times == []
+    finally:
+        supply.close()
+
+
+def test_wait_until_settled_zero_target(simulator):
+    from Power_Supply_Control import PowerSupply, SettleTimeoutError
+
+    supply = PowerSupply(simulator.supply_port, timeout=0.2)
+    try:
+        # a 0 A target settles on a reading within the absolute tolerance
+        supply.wait_until_settled((220.0, 0.0), interval=0.01, read_values=lambda: (220.0,) * 3 + (0.004,) * 3)
+        with pytest.raises(SettleTimeoutError):
+            supply.wait_until_settled((220.0, 0.0), timeout=0.05, interval=0.01,
+                                      read_values=lambda: (220.0,) * 3 + (0.05,) * 3)
+    finally:
+        supply.close()
+
+
+def test_wait_until_settled_min_time(simulator):
+    import time
+    from Power_Supply_Control import PowerSupply
+
+    supply = PowerSupply(simulator.supply_port, timeout=0.2)
+    settled = lambda: (220.0,) * 3 + (2.0,) * 3
+    try:
+        supply.set_voltage_and_current_Powerfactor(220.0, 2.0, "0.5L")
+        assert supply.wait_until_settled((220.0, 2.0), interval=0.01, min_time=0.3, read_values=settled) >= 0.3
+
+        # time spent since the setpoint counts towards min_time
+        supply.set_voltage_and_current_Powerfactor(220.0, 2.0, 1)
+        time.sleep(0.3)
+        assert supply.wait_until_settled((220.0, 2.0), interval=0.01, min_time=0.3, read_values=settled) < 0.2
+    finally:
+        supply.close()
+
+
+class Port:
+    """Serial port returning scripted chunks, one per read."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.reads = []
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def read(self, size):
+        self.reads.append(size)
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def readback_reply(data):
+    from Power_Supply_Control import READBACK_REQUEST
+
+    body = READBACK_REQUEST[:2] + bytes([len(data)]) + data
+    return body + crc16_modbus(body).to_bytes(2, "little")
+
+
+@pytest.fixture
+def supply():
+    from Power_Supply_Control import PowerSupply
+
+    supply = PowerSupply.__new__(PowerSupply)
+    supply.rx_buffer = bytearray()
+    return supply
+
+
+def test_read_response_split_reply(supply):
+    reply = readback_reply(bytes(range(10)))
+    supply.connection = Port([reply[:2], reply[2:5], reply[5:]])
+    assert supply.read_response() == reply
+    # only the missing bytes were asked for: header and count, then the rest of the frame
+    assert supply.connection.reads == [3, 1, len(reply) - 5]
+
+
+def test_read_response_bad_crc(supply):
+    good = readback_reply(b"\x01\x02")
+    bad = bytearray(readback_reply(b"\x03\x04"))
+    bad[-1] ^= 0xFF
+    supply.connection = Port([bytes(bad) + good])
+    assert supply.read_response() == good
+    supply.connection = Port([bytes(bad)])
+    assert supply.read_response() is None
+
+
+def test_read_response_leading_garbage(supply):
+    reply = readback_reply(b"\x10\x20\x30")
+    supply.connection = Port([b"\xf9\x00\x37\x11" + reply])
+    assert supply.read_response() == reply
+    assert not supply.rx_buffer
+
+
+def test_read_response_back_to_back_replies(supply):
+    first, second = readback_reply(b"\x01"), readback_reply(b"\x02\x03")
+    supply.connection = Port([first + second])
+    assert supply.read_response() == first
+    assert supply.rx_buffer == second  # kept for the next call, without reading the port
+    assert supply.read_response() == second
+    assert supply.connection.reads == [3]
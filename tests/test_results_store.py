@@ -0,0 +1,81 @@
+import itertools
+
+import pytest
+
+import Results_Store
+from Results_Store import ResultsStore
+
+METER = "000000000001"
+OTHER = "000000000002"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Store in a temporary database, with a clock advancing one second per call."""
+    clock = itertools.count(1000.0)
+    monkeypatch.setattr(Results_Store.time, "time", lambda: next(clock))
+    store = ResultsStore(str(tmp_path / "results.db"))
+    yield store
+    store.close()
+
+
+def test_latest_gains(store):
+    first = store.begin_run(METER, "/dev/ttyUSB0", "recipe")
+    first.register_written(METER, 0x0061, 0x1000)
+    first.register_written(METER, 0x0062, 0x2000)
+    first.finish("done")
+
+    second = store.begin_run(METER, "/dev/ttyUSB0", "recipe")
+    second.register_written(METER, 0x0061, 0x1100)
+    second.register_written(METER, 0x0062, 0x2200, accepted=False)  # refused by the meter
+    second.finish("failed")
+
+    other = store.begin_run(OTHER)
+    other.register_written(OTHER, 0x0061, 0x7777)
+    other.finish("done")
+
+    gains = store.latest_gains(METER)
+    assert {reg: value for reg, (value, _) in gains.items()} == {0x0061: 0x1100, 0x0062: 0x2000}
+    assert gains[0x0061][1] > gains[0x0062][1]
+    assert store.latest_gains("000000000003") == {}
+
+
+def test_runs_reads_and_timings(store):
+    recorder = store.begin_run(METER, "/dev/ttyUSB0", "recipe")
+    recorder.register_read(METER, 0x00D9, 22000)
+    recorder.register_read(METER, 0x00F8, 5000)
+    recorder.time_step("voltage", lambda: None)
+    run_id = recorder.finish("done", {"status": "done"})
+    store.begin_run(OTHER).finish("done")
+
+    [run] = store.runs(METER)
+    assert run["id"] == run_id and run["status"] == "done" and run["recipe"] == "recipe"
+    assert len(store.runs()) == 2
+    assert store.runs(since=run["finished"]) == store.runs(OTHER)
+    assert [(reg, raw) for _, reg, raw in store.reads(METER)] == [(0x00D9, 22000), (0x00F8, 5000)]
+    assert [raw for _, _, raw in store.reads(METER, addr=0x00F8)] == [5000]
+    assert list(store.timings(run_id)) == ["voltage"]
+
+
+def test_unfinished_run_is_kept(store):
+    recorder = store.begin_run(METER, "/dev/ttyUSB0", "recipe")
+    recorder.batch_size = 2
+    recorder.register_written(METER, 0x0061, 0x1000)
+    recorder.register_read(METER, 0x00D9, 22000)
+    # written gains are stored at once, reads by batch or at the end of a step
+    assert store.latest_gains(METER)[0x0061][0] == 0x1000
+    assert store.reads(METER) == []
+    recorder.register_read(METER, 0x00D9, 22001)
+    assert len(store.reads(METER)) == 2
+    recorder.register_read(METER, 0x00F8, 5000)
+    recorder.time_step("voltage", lambda: None)
+
+    # the process dies here, before finish()
+    [run] = store.runs(METER)
+    assert run["status"] == "running"
+    assert len(store.reads(METER)) == 3
+    assert list(store.timings(run["id"])) == ["voltage"]
+
+    assert recorder.finish("failed", {"status": "failed"}) == run["id"]
+    [run] = store.runs(METER)
+    assert run["status"] == "failed" and run["finished"] > run["started"]
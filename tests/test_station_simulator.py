@@ -0,0 +1,75 @@
+import importlib
+import sys
+
+import pytest
+
+import dlt645
+from dlt645.constants import DLT645_1997, FUNCTION_CODES, MAIN, NO_MORE_DATA, RESPONSE_CORRECT, RESPONSE_INCORRECT
+from Meter_Cal_Control import register_id, register_value
+from Power_Supply_Control import READBACK_REQUEST, PowerSupply, encode_frame
+from Station_Simulator import MeterModel, Simulator, SupplyModel
+
+
+def request(addr, function, data):
+    frame = dlt645.Frame(addr, control={"direction": MAIN, "response": RESPONSE_CORRECT, "more": NO_MORE_DATA,
+                                        "function": FUNCTION_CODES[DLT645_1997][function]})
+    frame.data = data
+    loaded = dlt645.Frame()
+    loaded.load(bytearray(frame.dump()))
+    return loaded
+
+
+def read(meter, addr):
+    reply = meter.handle(request(meter.station_addr, "READ_DATA", "%04X" % register_id(addr)))
+    loaded = dlt645.Frame()
+    loaded.load(bytearray(reply.dump()))
+    return loaded
+
+
+def test_import_without_tty(monkeypatch):
+    # as on Windows: the models are usable, only serving them on ptys is not
+    monkeypatch.setitem(sys.modules, "tty", None)
+    monkeypatch.delitem(sys.modules, "Station_Simulator", raising=False)
+    simulator = importlib.import_module("Station_Simulator").Simulator(meters=2)
+    assert len(simulator.meters) == 2 and simulator.supply_port is None
+
+
+def test_supply_model_setpoint_and_readback():
+    supply = SupplyModel(settle_time=0.0)
+    buffer = bytearray(encode_frame(230.0, 5.0, "0.5L") + READBACK_REQUEST)
+    reply = supply.handle(buffer)
+    assert not buffer
+    assert supply.output() == pytest.approx((230.0, 5.0, 60.0))
+    # the readback decodes back to the setpoint on every phase
+    values = PowerSupply.extract_voltage_and_current(None, reply)
+    assert values == pytest.approx((230.0,) * 3 + (5.0,) * 3, abs=1e-3)
+
+
+def test_supply_model_ramp():
+    supply = SupplyModel(settle_time=3600.0)
+    supply.set_target(220.0, 2.0, 0.0)
+    voltage, current, _ = supply.output()
+    assert 0 <= voltage < 1.0 and 0 <= current < 0.01  # barely started
+
+
+def test_meter_model_registers():
+    supply = SupplyModel(settle_time=0.0)
+    supply.set_target(220.0, 2.0, 0.0)
+    meter = MeterModel("000000000001", supply, seed=1)
+
+    voltage = register_value(read(meter, 0x00D9)) * 0.01
+    assert voltage == pytest.approx(220.0 * meter.errors["voltage"][0], abs=0.01)
+    assert register_value(read(meter, 0x00F8)) == 5000
+
+    # halving the voltage gain halves the reading
+    meter.handle(request(meter.station_addr, "WRITE_DATA", "4000%04X" % register_id(0x0061)))
+    assert meter.registers[0x0061] == 0x4000
+    assert register_value(read(meter, 0x00D9)) * 0.01 == pytest.approx(voltage / 2, abs=0.01)
+
+
+def test_meter_model_addressing():
+    meter = MeterModel("000000000001", SupplyModel(), seed=1)
+    assert meter.handle(request("000000000002", "READ_DATA", "D0D9")) is None
+    assert meter.handle(request("AAAAAAAAAA01", "READ_DATA", "D0D9")) is not None
+    # a data identifier outside the chip registers
+    assert meter.handle(request(meter.station_addr, "READ_DATA", "1234")).control["response"] == RESPONSE_INCORRECT